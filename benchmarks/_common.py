@@ -0,0 +1,72 @@
+"""Shared helpers for the benchmark scripts (path setup, percentiles, RSS, JSON reports)."""
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(REPO_ROOT, "src")
+SCHEMA_FILE = os.path.join(SRC_DIR, "persistence", "schema.sql")
+
+# The bot imports its modules relative to src/ (e.g. `from persistence.db import Database`)
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+
+def percentiles(samples, quantiles=(0.5, 0.95, 0.99)) -> dict:
+    """Nearest-rank percentiles of samples (seconds) as {'p50': ..., 'count': n}."""
+    ordered = sorted(samples)
+    result = {"count": len(ordered)}
+    for q in quantiles:
+        if not ordered:
+            result[f"p{int(q * 100)}"] = None
+            continue
+        index = max(0, math.ceil(q * len(ordered)) - 1)
+        result[f"p{int(q * 100)}"] = ordered[index]
+    if ordered:
+        result["max"] = ordered[-1]
+        result["mean"] = sum(ordered) / len(ordered)
+    return result
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB, or None where the platform doesn't expose it."""
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_report(benchmark: str, parameters: dict, results: dict, output_path=None) -> dict:
+    """Wraps results with run metadata and writes them as JSON to output_path (or stdout)."""
+    report = {
+        "benchmark": benchmark,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": parameters,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if output_path:
+        with open(output_path, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return report
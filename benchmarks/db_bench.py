@@ -0,0 +1,197 @@
+"""
+Micro-benchmarks for persistence.db.Database.
+
+For each table size the tasks table is seeded with a realistic mix (mostly finished tasks, a
+pending tail, several groups and both priorities), then each operation is timed through the
+Database API exactly as the bot calls it:
+
+    insert        single-row INSERT from Bot.handle_message
+    dequeue       the worker's next-task query (queue_consumer.DEQUEUE_QUERY)
+    group_list    one page of the admin queue browser plus its status header (queue_management)
+    executemany   100-row batched INSERT
+    mixed         concurrent reader and writer coroutines sharing one Database (lock contention)
+
+Usage (from the repository root):
+    python benchmarks/db_bench.py --sizes 1000,10000,100000,1000000 --output db_bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from _common import SCHEMA_FILE, percentiles, write_report
+
+from persistence import db as db_module
+from persistence.db import Database
+from worker.queue_consumer import DEQUEUE_QUERY
+from bot.commands.queue_management import fetch_queue_page, fetch_status_counts
+
+INSERT_QUERY = "INSERT INTO tasks (group_id, user_id, original_link, status, priority) VALUES (?, ?, ?, ?, ?)"
+STATUS_MIX = (("completed", 0.85), ("failed", 0.08), ("pending", 0.05), ("downloading", 0.01), ("uploading", 0.01))
+
+
+def _group_ids(groups: int):
+    return [-1001000000000 - i for i in range(groups)]
+
+
+def _random_task(rng: random.Random, group_ids, status=None):
+    if status is None:
+        roll, status = rng.random(), "completed"
+        for name, share in STATUS_MIX:
+            if roll < share:
+                status = name
+                break
+            roll -= share
+    return (
+        rng.choice(group_ids),
+        rng.randint(1, 50_000),
+        f"https://freepik.com/asset/{rng.randint(1, 10 ** 9)}",
+        status,
+        1 if rng.random() < 0.2 else 0,
+    )
+
+
+def seed_database(path: str, size: int, groups: int, seed: int) -> None:
+    """Creates the schema and inserts size tasks directly with sqlite3 (seeding isn't what we measure)."""
+    rng = random.Random(seed)
+    group_ids = _group_ids(groups)
+    conn = sqlite3.connect(path)
+    try:
+        with open(SCHEMA_FILE) as f:
+            conn.executescript(f.read())
+        batch = 50_000
+        for start in range(0, size, batch):
+            rows = [_random_task(rng, group_ids) for _ in range(min(batch, size - start))]
+            conn.executemany(INSERT_QUERY, rows)
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+
+async def time_operation(operation, iterations: int, max_seconds: float) -> dict:
+    """Runs the coroutine factory up to iterations times (or max_seconds) and summarises latency."""
+    latencies = []
+    deadline = time.monotonic() + max_seconds
+    for i in range(iterations):
+        start = time.perf_counter()
+        await operation(i)
+        latencies.append(time.perf_counter() - start)
+        if time.monotonic() > deadline:
+            break
+    total = sum(latencies)
+    summary = percentiles(latencies)
+    summary["ops_per_sec"] = len(latencies) / total if total else None
+    return summary
+
+
+async def run_mixed(db: Database, group_ids, readers: int, writers: int, seconds: float, seed: int) -> dict:
+    """Readers run dequeue/group listings while writers insert, all on one Database for seconds."""
+    rng = random.Random(seed)
+    read_latencies, write_latencies = [], []
+    stop_at = time.monotonic() + seconds
+
+    async def reader(n: int):
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            if n % 2:
+                await db.fetchone(DEQUEUE_QUERY)
+            else:
+                await fetch_queue_page(db, rng.choice(group_ids), 'active')
+            read_latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0)
+
+    async def writer():
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            await db.execute(INSERT_QUERY, _random_task(rng, group_ids, status="pending"))
+            write_latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*(reader(n) for n in range(readers)), *(writer() for _ in range(writers)))
+    return {
+        "readers": readers,
+        "writers": writers,
+        "read_latency_s": percentiles(read_latencies),
+        "write_latency_s": percentiles(write_latencies),
+        "reads_per_sec": len(read_latencies) / seconds,
+        "writes_per_sec": len(write_latencies) / seconds,
+    }
+
+
+async def bench_size(path: str, size: int, args) -> dict:
+    rng = random.Random(args.seed)
+    group_ids = _group_ids(args.groups)
+    db = Database(path)
+    results = {}
+
+    async def insert(_):
+        await db.execute(INSERT_QUERY, _random_task(rng, group_ids, status="pending"))
+
+    async def dequeue(_):
+        await db.fetchone(DEQUEUE_QUERY)
+
+    async def group_list(i):
+        group_id = group_ids[i % len(group_ids)]
+        await fetch_status_counts(db, group_id)
+        await fetch_queue_page(db, group_id, 'all')
+
+    async def executemany(_):
+        await db.executemany(INSERT_QUERY, [_random_task(rng, group_ids, status="pending") for _ in range(100)])
+
+    for name, operation in (("insert", insert), ("dequeue", dequeue), ("group_list", group_list), ("executemany", executemany)):
+        results[name] = await time_operation(operation, args.iterations, args.max_seconds)
+
+    results["mixed"] = [
+        await run_mixed(db, group_ids, readers, writers, args.mixed_seconds, args.seed)
+        for readers, writers in args.mixed
+    ]
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000", help="Comma-separated task table sizes")
+    parser.add_argument("--groups", type=int, default=50, help="Distinct groups in the seeded data")
+    parser.add_argument("--iterations", type=int, default=500, help="Max calls per operation and size")
+    parser.add_argument("--max-seconds", type=float, default=10.0, help="Time budget per operation and size")
+    parser.add_argument("--mixed", default="4:1,16:4", help="Reader:writer coroutine mixes, comma-separated")
+    parser.add_argument("--mixed-seconds", type=float, default=3.0, help="Duration of each mixed run")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    args.sizes = [int(size) for size in args.sizes.split(",") if size]
+    args.mixed = [tuple(int(n) for n in mix.split(":")) for mix in args.mixed.split(",") if mix]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    db_module.SCHEMA_PATH = SCHEMA_FILE
+    workdir = tempfile.mkdtemp(prefix="assetfetch-dbbench-")
+    results = {}
+    try:
+        for size in args.sizes:
+            path = os.path.join(workdir, f"tasks_{size}.db")
+            seed_start = time.monotonic()
+            seed_database(path, size, args.groups, args.seed)
+            print(f"Seeded {size} tasks in {time.monotonic() - seed_start:.1f}s", file=sys.stderr)
+            with contextlib.redirect_stdout(sys.stderr): # Database prints errors to stdout
+                results[str(size)] = asyncio.run(bench_size(path, size, args))
+            results[str(size)]["db_file_bytes"] = os.path.getsize(path)
+            os.remove(path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    parameters = {key: value for key, value in vars(args).items() if key != "output"}
+    write_report("db_bench", parameters, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Direct delivery benchmark: TelegramDelivery against the local Bot API stand-in (see fakes.py).
+
+    upload      sendDocument multipart uploads of a --size-mb file, streamed from disk: latency,
+                throughput and the peak Python memory traced while they run (tracemalloc, which also
+                covers the stand-in's parser). The peak must stay below --memory-budget-mb, far less
+                than the file, or the exit status is 1.
+    cached      re-sends of the same assets by their cached file_id (no upload).
+    stale       a cached file_id the Bot API rejects is dropped so the task downloads again.
+
+Usage (from the repository root):
+    python benchmarks/delivery_bench.py --size-mb 40 --uploads 5 --resends 200 --output delivery.json
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from _common import SCHEMA_FILE, percentiles, write_report
+from fakes import BotApiStandIn
+
+from persistence import db as db_module
+from persistence.db import Database
+from worker.telegram_delivery import TelegramDelivery
+
+GROUP_ID = -100123
+
+
+def write_file(path: str, size_mb: float) -> None:
+    remaining = int(size_mb * 1024 * 1024)
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as f:
+        while remaining > 0:
+            f.write(block[:remaining])
+            remaining -= len(block)
+
+
+async def run(args, workdir: str) -> dict:
+    db_module.SCHEMA_PATH = SCHEMA_FILE
+    db = Database(os.path.join(workdir, "bot.db"))
+    await db.initialize()
+    server = BotApiStandIn().start()
+    delivery = TelegramDelivery(db, "0:benchmark", base_url=server.base_url, upload_limit_mb=args.size_mb + 1)
+    try:
+        tasks = []
+        for index in range(args.uploads):
+            link = f"https://freepik.com/asset/{index}"
+            cursor = await db.execute(
+                "INSERT INTO tasks (group_id, user_id, message_id, original_link, status) VALUES (?, ?, ?, ?, 'downloading')",
+                (GROUP_ID, 1, index + 1, link)
+            )
+            path = os.path.join(workdir, f"{cursor.lastrowid}_asset{index}.zip")
+            write_file(path, args.size_mb)
+            tasks.append(({"task_id": cursor.lastrowid, "group_id": GROUP_ID, "message_id": index + 1,
+                           "original_link": link, "plan": "file"}, path))
+
+        upload_times = []
+        tracemalloc.start()
+        for task, path in tasks:
+            started = time.perf_counter()
+            await delivery.upload(task, path)
+            upload_times.append(time.perf_counter() - started)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        cached_times = []
+        for index in range(args.resends):
+            task, _ = tasks[index % len(tasks)]
+            file_id = await delivery.cached_file_id(task["original_link"])
+            started = time.perf_counter()
+            if not await delivery.send_cached(task, file_id):
+                raise RuntimeError(f"Cached file_id {file_id} was rejected")
+            cached_times.append(time.perf_counter() - started)
+
+        stale_task = dict(tasks[0][0], original_link="https://freepik.com/asset/stale")
+        await db.execute("INSERT INTO telegram_files (original_link, file_id) VALUES (?, 'never-issued')",
+                         (stale_task["original_link"],))
+        stale_dropped = not await delivery.send_cached(stale_task, "never-issued") \
+            and await delivery.cached_file_id(stale_task["original_link"]) is None
+
+        uploaded = [params["document"] for _, method, params in server.calls
+                    if method == "sendDocument" and isinstance(params.get("document"), dict)]
+        total_mb = args.size_mb * len(upload_times)
+        return {
+            "upload_seconds": percentiles(upload_times),
+            "upload_mb_per_second": total_mb / sum(upload_times) if upload_times else None,
+            "upload_sizes_received": sorted({document["file_size"] for document in uploaded}),
+            "peak_traced_mb": peak / (1024 * 1024),
+            "cached_seconds": percentiles(cached_times),
+            "stale_file_id_dropped": stale_dropped,
+        }
+    finally:
+        server.stop()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=40)
+    parser.add_argument("--uploads", type=int, default=5)
+    parser.add_argument("--resends", type=int, default=200)
+    parser.add_argument("--memory-budget-mb", type=float, default=16)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="delivery_bench_")
+    try:
+        results = asyncio.run(run(args, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    expected_size = int(args.size_mb * 1024 * 1024)
+    results["budget_exceeded"] = results["peak_traced_mb"] > args.memory_budget_mb
+    results["size_mismatch"] = results["upload_sizes_received"] != [expected_size]
+    write_report("delivery_bench", vars(args), results, args.output)
+    return 1 if results["budget_exceeded"] or results["size_mismatch"] or not results["stale_file_id_dropped"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
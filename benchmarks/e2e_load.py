@@ -0,0 +1,213 @@
+"""
+End-to-end load benchmark: synthetic Telegram updates -> Bot.handle_message -> SQLite queue -> worker.
+
+The eight asset sites and Google Drive are served by a local stand-in (see fakes.py): every
+download is uploaded by the worker's DriveUploader through a StandInDriveClient. Telegram replies
+are captured by a fake bot, and the database lives in a temporary directory.
+Results are written as JSON so runs can be compared across commits.
+
+Usage (from the repository root):
+    python benchmarks/e2e_load.py --rate 20 --duration 30 --output bench_output.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from _common import REPO_ROOT, SCHEMA_FILE, peak_rss_mb, percentiles, write_report
+from fakes import ASSET_SITES, FakeApplication, FakeContext, FakeTelegramBot, StandInDriveClient, StandInServer, make_update
+
+import main as bot_main
+from persistence import db as db_module
+from services.task_timeline import TaskTimeline, TERMINAL_STAGES
+from worker.drive_uploader import DriveUploader
+from worker.queue_consumer import start_worker_process
+
+
+class RecordingTimeline(TaskTimeline):
+    """TaskTimeline that also keeps the monotonic time each task entered each stage."""
+
+    def __init__(self, db):
+        super().__init__(db)
+        self.marks = {}
+
+    def record(self, task_id, stage, domain=None, plan=None):
+        self.marks.setdefault(task_id, {})[stage] = time.monotonic()
+        super().record(task_id, stage, domain=domain, plan=plan)
+
+
+def prepare_workspace(workdir: str, args) -> None:
+    """Writes throwaway config files and points the bot's module-level paths at them."""
+    config = {
+        "telegram_bot_token": "0:benchmark",
+        "recommended_channels": [],
+        "initial_admin_ids": [],
+        "download_directory": os.path.join(workdir, "downloads"),
+        "google_drive_folder_id": "benchmark",
+        "metrics_port": 0,
+        "worker_poll_interval": args.poll_interval,
+        "download_budget_gb": args.download_budget_mb / 1024,
+        "download_min_free_gb": 0,
+    }
+    paths = {
+        "CONFIG_PATH": os.path.join(workdir, "config.json"),
+        "ADMINS_CONFIG_PATH": os.path.join(workdir, "admins.json"),
+        "DOMAINS_CONFIG_PATH": os.path.join(workdir, "domains.json"),
+        "DATABASE_PATH": os.path.join(workdir, "bot.db"),
+        "REFERENCE_DATABASE_PATH": os.path.join(workdir, "reference.db"),
+    }
+    with open(paths["CONFIG_PATH"], "w") as f:
+        json.dump(config, f)
+    with open(paths["ADMINS_CONFIG_PATH"], "w") as f:
+        json.dump({"admins": []}, f)
+    with open(os.path.join(REPO_ROOT, "config", "domains.json")) as f:
+        domains = json.load(f)
+    # The stand-in pages carry an <a class="download-button">, so the download stage runs too
+    domains["download_selectors"] = {site: "a.download-button" for site in ASSET_SITES}
+    with open(paths["DOMAINS_CONFIG_PATH"], "w") as f:
+        json.dump(domains, f)
+    os.makedirs(config["download_directory"], exist_ok=True)
+
+    for name, path in paths.items():
+        setattr(bot_main, name, path)
+    db_module.SCHEMA_PATH = SCHEMA_FILE
+
+
+async def run(args) -> dict:
+    bot = bot_main.Bot()
+    bot.timeline = RecordingTimeline(bot.db)
+    await bot.db.initialize()
+    await bot.reference_db.initialize()
+    await bot.storage.scan()
+    # No credential files here, so from_config left the bot without an uploader
+    bot.uploader = DriveUploader(bot.db, [StandInDriveClient()], bot.config["google_drive_folder_id"])
+
+    application = FakeApplication()
+    bot.bind_application_state(application)
+    fake_bot = FakeTelegramBot()
+    context = FakeContext(application, fake_bot)
+
+    worker_tasks = [
+        asyncio.create_task(start_worker_process(
+            bot.db, bot.config, bot.domains_config, timeline=bot.timeline, queue_index=bot.queue_index,
+            scheduler=bot.scheduler, storage=bot.storage, uploader=bot.uploader))
+        for _ in range(args.workers)
+    ]
+    flusher = asyncio.create_task(bot.timeline.run_flusher())
+
+    dispatch_latencies = []
+    errors = []
+
+    async def send(index: int) -> None:
+        group_id = -1000000000000 - (index % args.groups)
+        user_id = 10_000 + (index % args.users)
+        site = ASSET_SITES[index % len(ASSET_SITES)]
+        update = make_update(fake_bot, group_id, user_id, f"http://{site}/asset/{index}")
+        start = time.monotonic()
+        try:
+            await bot.handle_message(update, context)
+        except Exception as e:
+            errors.append(repr(e))
+        dispatch_latencies.append(time.monotonic() - start)
+
+    # Open-loop arrivals: message i is offered at t0 + i / rate regardless of how fast the bot keeps up
+    total = int(args.rate * args.duration)
+    senders = []
+    t0 = time.monotonic()
+    for i in range(total):
+        delay = t0 + i / args.rate - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        senders.append(asyncio.create_task(send(i)))
+    await asyncio.gather(*senders)
+    admission_elapsed = time.monotonic() - t0
+
+    # Drain: wait for every admitted task to reach a terminal stage (or give up after drain_timeout)
+    marks = bot.timeline.marks
+    deadline = time.monotonic() + args.drain_timeout
+    while time.monotonic() < deadline:
+        if all(any(stage in stages for stage in TERMINAL_STAGES) for stages in marks.values()):
+            break
+        await asyncio.sleep(0.05)
+    total_elapsed = time.monotonic() - t0
+
+    for task in worker_tasks + [flusher]:
+        task.cancel()
+    await asyncio.gather(*worker_tasks, flusher, return_exceptions=True)
+
+    admitted = [stages for stages in marks.values() if "pending" in stages]
+    finished = [stages for stages in admitted if any(stage in stages for stage in TERMINAL_STAGES)]
+    end_to_end = [max(stages.get(s, 0) for s in TERMINAL_STAGES) - stages["pending"] for stages in finished]
+    queue_wait = [stages["downloading"] - stages["pending"] for stages in admitted if "downloading" in stages]
+
+    return {
+        "offered": total,
+        "offered_per_sec": total / admission_elapsed if admission_elapsed else None,
+        "admitted": len(admitted),
+        "admitted_per_sec": len(admitted) / admission_elapsed if admission_elapsed else None,
+        "completed": sum(1 for stages in finished if "completed" in stages),
+        "failed": sum(1 for stages in finished if "failed" in stages),
+        "unfinished": len(admitted) - len(finished),
+        "completed_per_sec": len(finished) / total_elapsed if total_elapsed else None,
+        "dispatch_latency_s": percentiles(dispatch_latencies),
+        "queue_wait_s": percentiles(queue_wait),
+        "end_to_end_s": percentiles(end_to_end),
+        "handler_errors": len(errors),
+        "replies_sent": len(fake_bot.sent),
+        "download_bytes_used": bot.storage.bytes_used,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=20.0, help="Offered messages per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of offered load")
+    parser.add_argument("--groups", type=int, default=8, help="Distinct groups sending links")
+    parser.add_argument("--users", type=int, default=200, help="Distinct users sending links")
+    parser.add_argument("--workers", type=int, default=1, help="Concurrent worker loops")
+    parser.add_argument("--site-latency", type=float, default=0.05, help="Stand-in response latency (s)")
+    parser.add_argument("--file-size", type=int, default=64 * 1024, help="Stand-in asset size (bytes)")
+    parser.add_argument("--download-budget-mb", type=float, default=1024, help="Download directory budget (MiB)")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="Worker idle poll interval (s)")
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="Max seconds to wait for completion")
+    parser.add_argument("--log-level", default="WARNING", help="Root log level during the run")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    workdir = tempfile.mkdtemp(prefix="assetfetch-bench-")
+    server = StandInServer(latency=args.site_latency, file_size=args.file_size).start()
+    # requests honours HTTP_PROXY, so every http:// asset and Drive URL lands on the stand-in
+    previous_proxy = os.environ.get("HTTP_PROXY")
+    os.environ["HTTP_PROXY"] = server.url
+    try:
+        prepare_workspace(workdir, args)
+        # Keep stdout clean for the JSON report; the bot prints status lines (e.g. schema init)
+        with contextlib.redirect_stdout(sys.stderr):
+            results = asyncio.run(run(args))
+        results["stand_in_hits"] = dict(server.hits)
+    finally:
+        server.stop()
+        if previous_proxy is None:
+            os.environ.pop("HTTP_PROXY", None)
+        else:
+            os.environ["HTTP_PROXY"] = previous_proxy
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    parameters = {key: value for key, value in vars(args).items() if key != "output"}
+    write_report("e2e_load", parameters, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
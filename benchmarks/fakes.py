@@ -0,0 +1,436 @@
+"""
+Local stand-ins used by the load benchmarks and the tests.
+
+StandInServer is a threaded HTTP server that plays the eight asset sites and Google Drive. It is
+installed as the HTTP proxy for the benchmark process, so the worker's
+`requests.get("http://freepik.com/...")` is answered locally with a configurable latency.
+StandInDriveClient takes DriveClient's place in a DriveUploader and makes the same files.create,
+permissions.create and files.get calls as plain HTTP requests, so they reach the stand-in through
+the proxy too (the Google client library would use HTTPS, which the proxy can't answer).
+
+FakeTelegramBot records every reply instead of calling the Bot API, and make_update() builds
+real telegram.Update objects bound to it so handlers run unmodified.
+
+BotApiStandIn is a local Bot API server for benchmarks that run a real telegram.ext.Application
+(base_url pointed at it): it answers getMe/deleteWebhook, serves queued updates to getUpdates and
+records every other call. sendDocument accepts multipart uploads (parsed as they arrive, so only
+the size of the file is kept) and re-sends by file_id, rejecting ids it never issued. fail_next()
+queues Bot API errors for a method; the tests under tests/ use it for the error mapping.
+"""
+import itertools
+import json
+import queue
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from telegram import Chat, Message, MessageEntity, Update, User
+
+ASSET_SITES = (
+    "freepik.com",
+    "envatoelements.com",
+    "vecteezy.com",
+    "pngtree.com",
+    "motionarray.com",
+    "pikbest.com",
+    "storyblocks.com",
+    "iconscout.com",
+)
+DRIVE_HOST = "www.googleapis.com"
+
+_ASSET_PAGE = """<html><head><title>{host} asset {asset_id}</title></head>
+<body><h1>Asset {asset_id}</h1><p>{filler}</p>
+<a class="download-button" href="http://{host}/files/{asset_id}.zip">Download</a></body></html>"""
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass # Keep benchmark output clean
+
+    def _target(self):
+        # As a proxy we receive absolute URLs; as a plain server, relative paths plus a Host header
+        parsed = urlparse(self.path)
+        host = (parsed.hostname or self.headers.get("Host", "").split(":")[0]).lower()
+        return host, parsed
+
+    def _send(self, status, body: bytes, content_type="text/html; charset=utf-8"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        host, parsed = self._target()
+        server.count(host)
+        time.sleep(server.latency)
+
+        if host in ASSET_SITES:
+            if parsed.path.startswith("/files/"):
+                # Distinct content per asset, so the DriveUploader uploads each one instead of deduplicating
+                header = f"{host}{parsed.path}\n".encode("utf-8")
+                self._send(200, header + b"\0" * max(0, server.file_size - len(header)), "application/zip")
+            else:
+                asset_id = parsed.path.rstrip("/").rsplit("/", 1)[-1] or "0"
+                page = _ASSET_PAGE.format(host=host, asset_id=asset_id, filler="lorem ipsum " * server.page_filler)
+                self._send(200, page.encode("utf-8"))
+        elif host == DRIVE_HOST and "/files/" in parsed.path:
+            file_id = parsed.path.rstrip("/").rsplit("/", 1)[-1]
+            self._send(200, json.dumps({"id": file_id, "trashed": False}).encode(), "application/json")
+        else:
+            self._send(404, b"not found", "text/plain")
+
+    def do_POST(self):
+        server = self.server
+        host, parsed = self._target()
+        server.count(host)
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        time.sleep(server.latency)
+
+        if host == DRIVE_HOST and parsed.path.endswith("/permissions"):
+            self._send(200, json.dumps({"id": "anyoneWithLink", "type": "anyone", "role": "reader"}).encode(), "application/json")
+        elif host == DRIVE_HOST and "/files" in parsed.path:
+            file_id = f"fake{next(server.drive_ids)}"
+            body = {"id": file_id, "webViewLink": f"https://drive.google.com/file/d/{file_id}/view"}
+            self._send(200, json.dumps(body).encode(), "application/json")
+        else:
+            self._send(404, b"not found", "text/plain")
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Threaded stand-in for the asset sites and Google Drive."""
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.05, file_size: int = 64 * 1024, page_filler: int = 200):
+        super().__init__(("127.0.0.1", 0), _StandInHandler)
+        self.latency = latency
+        self.file_size = file_size
+        self.page_filler = page_filler
+        self.drive_ids = itertools.count(1)
+        self.hits = {}
+        self._hits_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, host: str) -> None:
+        with self._hits_lock:
+            self.hits[host] = self.hits.get(host, 0) + 1
+
+    def start(self) -> "StandInServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="stand-in-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class StandInDriveClient:
+    """DriveClient for a DriveUploader in the benchmarks: the same Drive calls as plain HTTP requests to
+    DRIVE_HOST, answered by StandInServer through the HTTP proxy. The file is streamed, not read into memory."""
+
+    def __init__(self, name: str = "stand-in.json", timeout: float = 30):
+        self.name = name
+        self.timeout = timeout
+        self._session = threading.local() # One connection pool per upload thread
+
+    def _requests(self):
+        session = getattr(self._session, "value", None)
+        if session is None:
+            import requests # Only the upload path needs it; startup_bench checks it isn't imported early
+            session = self._session.value = requests.Session()
+        return session
+
+    def upload(self, path: str, name: str, folder_id: str):
+        with open(path, "rb") as f:
+            response = self._requests().post(
+                f"http://{DRIVE_HOST}/upload/drive/v3/files", params={"uploadType": "media", "name": name, "parents": folder_id},
+                data=f, timeout=self.timeout
+            )
+        response.raise_for_status()
+        created = response.json()
+        self._requests().post(
+            f"http://{DRIVE_HOST}/drive/v3/files/{created['id']}/permissions", json={"type": "anyone", "role": "reader"},
+            timeout=self.timeout
+        ).raise_for_status()
+        return created["id"], created.get("webViewLink")
+
+    def exists(self, file_id: str) -> bool:
+        response = self._requests().get(f"http://{DRIVE_HOST}/drive/v3/files/{file_id}", timeout=self.timeout)
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return not response.json().get("trashed")
+
+    def delete_many(self, file_ids) -> dict:
+        return {file_id: None for file_id in file_ids}
+
+
+class _BotApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_multipart(self, boundary: bytes, length: int) -> dict:
+        """Form fields as strings; file parts as {"file_name", "file_size"} without keeping their bytes."""
+        delimiter = b"\r\n--" + boundary
+        buffer, state, params = b"\r\n", "boundary", {}
+        name = filename = None
+        value, size = b"", 0
+        while True:
+            if state == "boundary":
+                index = buffer.find(delimiter)
+                if index >= 0 and len(buffer) >= index + len(delimiter) + 2:
+                    after = buffer[index + len(delimiter):index + len(delimiter) + 2]
+                    buffer = buffer[index + len(delimiter) + 2:]
+                    if after == b"--":
+                        break
+                    state = "headers"
+                    continue
+            elif state == "headers":
+                index = buffer.find(b"\r\n\r\n")
+                if index >= 0:
+                    headers, buffer = buffer[:index].decode("utf-8", "replace"), buffer[index + 4:]
+                    name = re.search(r'name="([^"]*)"', headers).group(1)
+                    match = re.search(r'filename="([^"]*)"', headers)
+                    filename = match.group(1) if match else None
+                    value, size, state = b"", 0, "body"
+                    continue
+            else:
+                index = buffer.find(delimiter)
+                data = buffer[:index] if index >= 0 else buffer[:max(0, len(buffer) - len(delimiter) + 1)]
+                buffer = buffer[len(data):]
+                if filename is None:
+                    value += data
+                else:
+                    size += len(data)
+                if index >= 0:
+                    params[name] = value.decode("utf-8") if filename is None else {"file_name": filename, "file_size": size}
+                    state = "boundary"
+                    continue
+            if not length:
+                break
+            chunk = self.rfile.read(min(length, 64 * 1024))
+            length -= len(chunk)
+            buffer += chunk
+        return params
+
+    def _params(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("multipart/form-data"):
+            return self._read_multipart(content_type.split("boundary=", 1)[1].encode(), length)
+        body = self.rfile.read(length) if length else b""
+        if content_type.startswith("application/json"):
+            return json.loads(body or b"{}")
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            return {key: values[-1] for key, values in parse_qs(body.decode()).items()}
+        return {}
+
+    def _reply(self, result, status: int = 200, retry_after: int = None) -> None:
+        error = {"ok": False, "error_code": status, "description": result}
+        if retry_after is not None:
+            error["parameters"] = {"retry_after": retry_after}
+        body = json.dumps({"ok": True, "result": result} if status == 200 else error).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        method = self.path.rsplit("/", 1)[-1]
+        params = self._params()
+        server.record(method, params)
+        failure = server.take_failure(method)
+        if failure is not None:
+            self._reply(*failure)
+        elif method == "getMe":
+            self._reply(server.me)
+        elif method == "getUpdates":
+            self._reply(server.take_updates(params))
+        elif method == "sendMessage":
+            self._reply({
+                "message_id": next(server.message_ids), "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"}, "text": params.get("text", ""),
+            })
+        elif method == "sendDocument":
+            document = server.document(params.get("document"))
+            if document is None:
+                self._reply("Bad Request: wrong file identifier/HTTP URL specified", 400)
+                return
+            self._reply({
+                "message_id": next(server.message_ids), "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "supergroup"}, "document": document,
+            })
+        else:
+            self._reply(True)
+
+    do_GET = do_POST
+
+
+class BotApiStandIn(ThreadingHTTPServer):
+    """Threaded local Bot API. Use base_url=server.base_url with Application.builder().base_url()."""
+    daemon_threads = True
+
+    def __init__(self, poll_wait: float = 0.5):
+        super().__init__(("127.0.0.1", 0), _BotApiHandler)
+        self.poll_wait = poll_wait
+        self.me = {"id": 1, "is_bot": True, "first_name": "AssetFetch", "username": "assetfetch_bench_bot",
+                   "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False}
+        self.calls = [] # (monotonic time, method, params)
+        self.message_ids = itertools.count(1)
+        self.documents = {} # file_id -> Bot API Document of every uploaded file
+        self._file_ids = itertools.count(1)
+        self._updates = queue.Queue()
+        self._failures = {} # method -> [(description, status, retry_after)] answered before the real result
+        self._calls_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/bot"
+
+    def record(self, method: str, params: dict) -> None:
+        with self._calls_lock:
+            self.calls.append((time.monotonic(), method, params))
+
+    def document(self, document):
+        """The Document for an upload ({"file_name", "file_size"}) or a known file_id; None for an unknown id."""
+        if isinstance(document, dict):
+            number = next(self._file_ids)
+            stored = {"file_id": f"BQACAgI{number:08d}", "file_unique_id": f"AgAD{number:08d}",
+                      "file_name": document["file_name"], "file_size": document["file_size"]}
+            with self._calls_lock:
+                self.documents[stored["file_id"]] = stored
+            return stored
+        return self.documents.get(document)
+
+    def fail_next(self, method: str, status: int, description: str, retry_after: int = None) -> None:
+        """Answers the next call of method with a Bot API error instead (e.g. 429 with retry_after)."""
+        with self._calls_lock:
+            self._failures.setdefault(method, []).append((description, status, retry_after))
+
+    def take_failure(self, method: str):
+        with self._calls_lock:
+            failures = self._failures.get(method)
+            return failures.pop(0) if failures else None
+
+    def push_update(self, update: dict) -> None:
+        self._updates.put(update)
+
+    def clear_updates(self) -> None:
+        while not self._updates.empty():
+            self._updates.get_nowait()
+
+    def take_updates(self, params: dict) -> list:
+        """Everything queued, or [] after poll_wait seconds (a short long-poll)."""
+        try:
+            updates = [self._updates.get(timeout=self.poll_wait)]
+        except queue.Empty:
+            return []
+        while not self._updates.empty():
+            updates.append(self._updates.get_nowait())
+        return updates
+
+    def start(self) -> "BotApiStandIn":
+        self._thread = threading.Thread(target=self.serve_forever, name="bot-api-stand-in", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def make_update_payload(update_id: int, chat_id: int, user_id: int, text: str) -> dict:
+    """A Bot API JSON update carrying a text message (as served by BotApiStandIn)."""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()), "text": text,
+            "chat": {"id": chat_id, "type": "supergroup" if chat_id < 0 else "private", "title": "Bench group"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+        },
+    }
+
+
+class FakeTelegramBot:
+    """Minimal Bot replacement: records replies with their send time instead of calling Telegram."""
+
+    def __init__(self, bot_id: int = 1):
+        self.id = bot_id
+        self.sent = [] # (monotonic time, chat_id, text)
+        self._message_ids = itertools.count(1_000_000)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((time.monotonic(), chat_id, text))
+        return Message(
+            message_id=next(self._message_ids),
+            date=datetime.now(timezone.utc),
+            chat=Chat(id=chat_id, type=Chat.SUPERGROUP if chat_id < 0 else Chat.PRIVATE),
+            text=text,
+        )
+
+    async def get_chat_member(self, chat_id, user_id, **kwargs):
+        return type("ChatMember", (), {"status": "member"})()
+
+    async def delete_message(self, chat_id, message_id, **kwargs):
+        return True
+
+    async def leave_chat(self, chat_id, **kwargs):
+        return True
+
+
+class FakeApplication:
+    """Carries the shared user_data mapping handlers read from context.application."""
+
+    def __init__(self):
+        self.user_data = {}
+
+
+class FakeContext:
+    def __init__(self, application: FakeApplication, bot: FakeTelegramBot, args=None):
+        self.application = application
+        self.bot = bot
+        self.args = args or []
+
+
+_update_ids = itertools.count(1)
+
+
+def make_update(bot: FakeTelegramBot, chat_id: int, user_id: int, text: str, with_entities: bool = True) -> Update:
+    """Builds a real group-message Update (with url entities, like Telegram sends) bound to the fake bot."""
+    entities = None
+    if with_entities:
+        entities = []
+        offset = 0
+        for word in text.split(" "):
+            if word.startswith(("http://", "https://")):
+                entities.append(MessageEntity(type=MessageEntity.URL, offset=offset, length=len(word)))
+            offset += len(word) + 1
+    message = Message(
+        message_id=next(_update_ids),
+        date=datetime.now(timezone.utc),
+        chat=Chat(id=chat_id, type=Chat.SUPERGROUP, title=f"Bench group {chat_id}"),
+        from_user=User(id=user_id, first_name=f"user{user_id}", is_bot=False),
+        text=text,
+        entities=entities,
+    )
+    message.set_bot(bot)
+    update = Update(update_id=message.message_id, message=message)
+    update.set_bot(bot)
+    return update
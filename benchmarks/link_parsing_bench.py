@@ -0,0 +1,210 @@
+"""
+Link extraction benchmark for bot.links.extract_links, the parser behind Bot.handle_message.
+
+The corpus is either a JSONL file of Bot API messages (--corpus; each line a message object with
+text/entities or caption/caption_entities, e.g. exported from getUpdates) or --messages generated
+ones shaped like real group traffic: bare links, captions around a link, several links in one
+message, emoji and non-Latin text ahead of a link (UTF-16 entity offsets), text_link entities,
+unsupported sites, links in parentheses or followed by punctuation, and chatter without links.
+
+    entities    extraction from Telegram's url/text_link entities: messages/sec and per-message percentiles
+    regex       the same corpus with the entities stripped, through the URL_PATTERN fallback
+    agreement   messages where both paths find the same supported links, and how many links the old
+                whole-text urlparse check would have queued
+    scaling     time per character for one message grown from --scale-base to 64x that many links. The
+                exit status is 1 if the largest size costs more than --max-scaling-ratio times the
+                per-character time of the smallest (extraction must stay linear in message length).
+
+Usage (from the repository root):
+    python benchmarks/link_parsing_bench.py --messages 100000 --output links.json
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from urllib.parse import urlparse
+
+from _common import REPO_ROOT, percentiles, write_report
+
+from telegram import MessageEntity
+
+from bot.links import extract_links
+from services.config_watcher import DomainMatcher
+
+UNSUPPORTED_SITES = ("youtube.com", "t.me", "instagram.com", "drive.google.com", "example.org")
+CHATTER = (
+    "thanks!", "anyone have the premium version of this?", "bot is slow today 😅", "ok", "done ✅",
+    "Спасибо, всё скачалось", "mil gracias 🙏", "can you add shutterstock?", "👍👍👍",
+)
+CAPTIONS = (
+    "need this one please", "pls download 🙏", "Можно это?", "for my project:", "这个可以吗",
+    "🔥🔥 hot pick", "same as before but the PSD", "الرجاء التحميل",
+)
+
+
+def utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+class MessageBuilder:
+    """Assembles a message text piece by piece, with the url entities Telegram would attach."""
+
+    def __init__(self):
+        self.parts, self.entities, self.length = [], [], 0
+
+    def add(self, text: str, entity: str = None, url: str = None):
+        if entity is not None:
+            self.entities.append(MessageEntity(entity, self.length, utf16_len(text), url=url))
+        self.parts.append(text)
+        self.length += utf16_len(text)
+        return self
+
+    def build(self):
+        return "".join(self.parts), tuple(self.entities)
+
+
+def random_link(rng: random.Random, sites, index: int) -> str:
+    site = rng.choice(sites)
+    host = rng.choice((site, "www." + site))
+    path = rng.choice((f"/premium-vector/asset-{index}.htm", f"/item/{index}-mockup", f"/free-photo/x_{index}?q=a&b=2"))
+    return rng.choice(("https://", "http://", "https://", "")) + host + path
+
+
+def generate_corpus(count: int, sites, seed: int):
+    """[(text, entities)] with a realistic mix of message shapes."""
+    rng = random.Random(seed)
+    corpus = []
+    for index in range(count):
+        builder = MessageBuilder()
+        kind = rng.random()
+        if kind < 0.35: # Bare link
+            builder.add(random_link(rng, sites, index), "url")
+        elif kind < 0.6: # Caption plus link, maybe punctuated or in parentheses
+            link = random_link(rng, sites, index)
+            builder.add(rng.choice(CAPTIONS) + " ")
+            if rng.random() < 0.3:
+                builder.add("(").add(link, "url").add(")")
+            else:
+                builder.add(link, "url").add(rng.choice(("", ".", "!", " thanks")))
+        elif kind < 0.75: # Several links, one per line, sometimes a repeat or an unsupported site
+            for n in range(rng.randint(2, 6)):
+                site_pool = sites if rng.random() < 0.85 else UNSUPPORTED_SITES
+                builder.add(f"{n + 1}) ").add(random_link(rng, site_pool, index * 10 + n), "url").add("\n")
+        elif kind < 0.82: # Hidden link behind text
+            link = random_link(rng, sites, index)
+            builder.add("download ").add("this", "text_link", url="https://" + link.split("://")[-1]).add(" please")
+        elif kind < 0.9: # Unsupported site only
+            builder.add(rng.choice(CAPTIONS) + " ").add(random_link(rng, UNSUPPORTED_SITES, index), "url")
+        else: # No link at all
+            builder.add(rng.choice(CHATTER))
+        corpus.append(builder.build())
+    return corpus
+
+
+def load_corpus(path: str):
+    corpus = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            message = json.loads(line)
+            if "text" in message:
+                text, raw = message["text"], message.get("entities", [])
+            else:
+                text, raw = message.get("caption"), message.get("caption_entities", [])
+            entities = tuple(MessageEntity(e["type"], e["offset"], e["length"], url=e.get("url")) for e in raw)
+            if text:
+                corpus.append((text, entities))
+    return corpus
+
+
+def time_corpus(corpus, matcher, use_entities: bool):
+    samples, found = [], []
+    for text, entities in corpus:
+        started = time.perf_counter()
+        result = extract_links(text, entities if use_entities else None, matcher)
+        samples.append(time.perf_counter() - started)
+        found.append(tuple(link for link, _ in result.links))
+    return samples, found
+
+
+def legacy_links(text: str) -> int:
+    """Links the old handler queued: 1 if the whole text parsed as a URL (supported or not), else 0."""
+    try:
+        parsed = urlparse(text)
+    except ValueError:
+        return 0
+    return 1 if parsed.scheme and parsed.netloc else 0
+
+
+def scaling(matcher, sites, base: int, repeats: int):
+    """Per-character extraction time for one message of base, 4*base, 16*base and 64*base links."""
+    rng = random.Random(1)
+    rows = []
+    for factor in (1, 4, 16, 64):
+        builder = MessageBuilder()
+        for n in range(base * factor):
+            builder.add(rng.choice(CAPTIONS) + " ").add(random_link(rng, sites, n), "url").add("\n")
+        text, entities = builder.build()
+        best = float("inf")
+        for _ in range(repeats):
+            started = time.perf_counter()
+            extract_links(text, entities, matcher, limit=len(entities))
+            extract_links(text, None, matcher, limit=len(entities))
+            best = min(best, time.perf_counter() - started)
+        rows.append({"links": base * factor, "chars": len(text), "seconds": best, "ns_per_char": best / len(text) * 1e9})
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="JSONL file of Bot API message objects (default: generated)")
+    parser.add_argument("--messages", type=int, default=100_000, help="Generated messages when no --corpus is given")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--scale-base", type=int, default=20, help="Links in the smallest scaling message")
+    parser.add_argument("--scale-repeats", type=int, default=5)
+    parser.add_argument("--max-scaling-ratio", type=float, default=3.0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    with open(f"{REPO_ROOT}/config/domains.json") as f:
+        domains = json.load(f)
+    matcher = DomainMatcher.from_config(domains)
+    sites = domains["allowed_domains"]
+    corpus = load_corpus(args.corpus) if args.corpus else generate_corpus(args.messages, sites, args.seed)
+
+    entity_times, entity_links = time_corpus(corpus, matcher, use_entities=True)
+    regex_times, regex_links = time_corpus(corpus, matcher, use_entities=False)
+    scale = scaling(matcher, sites, args.scale_base, args.scale_repeats)
+    ratio = scale[-1]["ns_per_char"] / scale[0]["ns_per_char"]
+
+    characters = sum(len(text) for text, _ in corpus)
+    results = {
+        "messages": len(corpus),
+        "characters": characters,
+        "entities": {
+            "seconds": percentiles(entity_times),
+            "messages_per_second": len(corpus) / sum(entity_times),
+            "links_found": sum(len(links) for links in entity_links),
+            "messages_with_links": sum(1 for links in entity_links if links),
+        },
+        "regex": {
+            "seconds": percentiles(regex_times),
+            "messages_per_second": len(corpus) / sum(regex_times),
+            "links_found": sum(len(links) for links in regex_links),
+        },
+        "agreement": {
+            "same_links": sum(1 for a, b in zip(entity_links, regex_links) if a == b) / len(corpus),
+            "legacy_links_queued": sum(legacy_links(text) for text, _ in corpus),
+        },
+        "scaling": scale,
+        "scaling_ratio": ratio,
+        "not_linear": ratio > args.max_scaling_ratio,
+    }
+    write_report("link_parsing_bench", vars(args), results, args.output)
+    return 1 if results["not_linear"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
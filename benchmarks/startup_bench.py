@@ -0,0 +1,235 @@
+"""
+Startup benchmark: how long a restart takes before the bot handles its first update.
+
+Two measurements, each in fresh interpreters:
+
+    imports        `python -X importtime -c "import main"`: total import time, the slowest modules, the
+                   bot's own modules, and whether any heavy lazily-imported dependency (requests, bs4,
+                   googleapiclient, selenium) was pulled in at startup.
+    first_update   wall time from process launch to each startup phase: main imported, Bot() built,
+                   Bot.startup() done (schema, queue index, scheduler, disk scan), Bot.register_handlers()
+                   done, Application initialized against a local Bot API stand-in, polling started, first
+                   polled update dispatched. The database is pre-seeded with --seed-tasks tasks. A run
+                   whose handler registration raises fails the benchmark.
+
+The medians are checked against a regression budget; the exit status is 1 if any budget is exceeded.
+
+Usage (from the repository root):
+    python benchmarks/startup_bench.py --runs 5 --budget-ms 2500 --import-budget-ms 800 --output startup.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from _common import REPO_ROOT, SRC_DIR, SCHEMA_FILE, write_report
+
+HEAVY_MODULES = ("requests", "bs4", "googleapiclient", "selenium")
+FIRST_PARTY_PREFIXES = ("main", "bot", "services", "worker", "persistence")
+PHASES = ("process_started", "imported_main", "bot_constructed", "state_loaded", "handlers_registered",
+          "application_initialized", "polling_started", "first_update")
+
+
+def _env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = SRC_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def measure_imports(top: int) -> dict:
+    """Parses -X importtime output for `import main` (times in ms)."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=REPO_ROOT, env=_env(), capture_output=True, text=True, check=True
+    )
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        modules.append((name, int(self_us) / 1000, int(cumulative_us) / 1000))
+
+    total_ms = next((cumulative for name, _, cumulative in modules if name == "main"), None)
+    return {
+        "import_main_ms": total_ms,
+        "slowest_self_ms": [{"module": n, "self_ms": s, "cumulative_ms": c}
+                            for n, s, c in sorted(modules, key=lambda m: m[1], reverse=True)[:top]],
+        "first_party_cumulative_ms": {n: c for n, _, c in modules if n.split(".")[0] in FIRST_PARTY_PREFIXES},
+        "heavy_modules_at_startup": sorted({n.split(".")[0] for n, _, _ in modules if n.split(".")[0] in HEAVY_MODULES}),
+    }
+
+
+def child_main(workdir: str, base_url: str) -> None:
+    """Runs inside the measured interpreter; prints phase offsets (seconds since launch) as JSON."""
+    t0 = float(os.environ["STARTUP_BENCH_T0"])
+    marks = {"process_started": time.time() - t0}
+
+    import main as bot_main
+    marks["imported_main"] = time.time() - t0
+
+    import asyncio
+    import logging
+    from telegram import Update
+    from telegram.ext import TypeHandler
+    from persistence import db as db_module
+
+    logging.getLogger().setLevel(logging.WARNING)
+    bot_main.CONFIG_PATH = os.path.join(workdir, "config.json")
+    bot_main.ADMINS_CONFIG_PATH = os.path.join(workdir, "admins.json")
+    bot_main.DOMAINS_CONFIG_PATH = os.path.join(workdir, "domains.json")
+    bot_main.DATABASE_PATH = os.path.join(workdir, "bot.db")
+    bot_main.REFERENCE_DATABASE_PATH = os.path.join(workdir, "reference.db")
+    bot_main.ARCHIVE_DATABASE_PATH = os.path.join(workdir, "archive.db")
+    db_module.SCHEMA_PATH = SCHEMA_FILE
+
+    bot = bot_main.Bot()
+    marks["bot_constructed"] = time.time() - t0
+
+    async def run():
+        await bot.startup()
+        marks["state_loaded"] = time.time() - t0
+
+        application = bot.build_application(bot.config["telegram_bot_token"], base_url=base_url)
+        bot.register_handlers(application)
+        marks["handlers_registered"] = time.time() - t0
+        first_update = asyncio.Event()
+
+        async def on_update(update, context):
+            first_update.set()
+
+        application.add_handler(TypeHandler(Update, on_update), group=-1)
+        await application.initialize()
+        marks["application_initialized"] = time.time() - t0
+        await application.updater.start_polling(poll_interval=0, timeout=1)
+        await application.start()
+        marks["polling_started"] = time.time() - t0
+        await asyncio.wait_for(first_update.wait(), 30)
+        marks["first_update"] = time.time() - t0
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+
+    asyncio.run(run())
+    print(json.dumps(marks), file=sys.__stdout__)
+
+
+def prepare_workspace(template_db: str) -> str:
+    workdir = tempfile.mkdtemp(prefix="assetfetch-startup-")
+    config = {
+        "telegram_bot_token": "1:startup-benchmark",
+        "recommended_channels": [],
+        "initial_admin_ids": [],
+        "download_directory": os.path.join(workdir, "downloads"),
+        "metrics_port": 0,
+    }
+    with open(os.path.join(workdir, "config.json"), "w") as f:
+        json.dump(config, f)
+    with open(os.path.join(workdir, "admins.json"), "w") as f:
+        json.dump({"admins": []}, f)
+    shutil.copyfile(os.path.join(REPO_ROOT, "config", "domains.json"), os.path.join(workdir, "domains.json"))
+    if template_db:
+        shutil.copyfile(template_db, os.path.join(workdir, "bot.db"))
+    return workdir
+
+
+def seed_template(size: int, directory: str) -> str:
+    """A database with size tasks, already migrated, so runs measure a warm restart rather than setup."""
+    if not size:
+        return None
+    import asyncio
+    from db_bench import seed_database
+    from persistence import db as db_module
+    from persistence.db import Database
+
+    path = os.path.join(directory, "template.db")
+    seed_database(path, size, groups=50, seed=1234)
+    db_module.SCHEMA_PATH = SCHEMA_FILE
+    asyncio.run(Database(path).initialize())
+    return path
+
+
+def measure_first_update(runs: int, seed_tasks: int) -> dict:
+    from fakes import BotApiStandIn, make_update_payload
+
+    server = BotApiStandIn(poll_wait=0.2).start()
+    scratch = tempfile.mkdtemp(prefix="assetfetch-startup-template-")
+    samples = {phase: [] for phase in PHASES}
+    try:
+        template_db = seed_template(seed_tasks, scratch)
+        for run in range(runs):
+            workdir = prepare_workspace(template_db)
+            server.clear_updates()
+            server.push_update(make_update_payload(run + 1, 1001, 1001, "/start"))
+            env = _env()
+            env["STARTUP_BENCH_T0"] = repr(time.time())
+            try:
+                completed = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", workdir, server.base_url],
+                    cwd=REPO_ROOT, env=env, capture_output=True, text=True, timeout=120
+                )
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+            if completed.returncode != 0:
+                raise RuntimeError(f"Startup run {run} failed:\n{completed.stderr}")
+            marks = json.loads(completed.stdout.strip().splitlines()[-1])
+            for phase in PHASES:
+                samples[phase].append(marks[phase] * 1000)
+    finally:
+        server.stop()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return {
+        "runs": runs,
+        "median_ms": {phase: statistics.median(values) for phase, values in samples.items()},
+        "max_ms": {phase: max(values) for phase, values in samples.items()},
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts to measure")
+    parser.add_argument("--seed-tasks", type=int, default=20000, help="Tasks in the database at startup")
+    parser.add_argument("--top", type=int, default=15, help="Slowest modules to list from -X importtime")
+    parser.add_argument("--budget-ms", type=float, default=2500, help="Budget for the median time to first update")
+    parser.add_argument("--import-budget-ms", type=float, default=800, help="Budget for importing main")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--child", nargs=2, metavar=("WORKDIR", "BASE_URL"), help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        child_main(*args.child)
+        return
+
+    # Keep stdout clean for the JSON report; Database.initialize and the seeding print status lines
+    with contextlib.redirect_stdout(sys.stderr):
+        results = {"imports": measure_imports(args.top), "first_update": measure_first_update(args.runs, args.seed_tasks)}
+    first_update_ms = results["first_update"]["median_ms"]["first_update"]
+    import_ms = results["imports"]["import_main_ms"]
+    failures = []
+    if first_update_ms > args.budget_ms:
+        failures.append(f"median time to first update {first_update_ms:.0f} ms > budget {args.budget_ms:.0f} ms")
+    if import_ms is not None and import_ms > args.import_budget_ms:
+        failures.append(f"import main {import_ms:.0f} ms > budget {args.import_budget_ms:.0f} ms")
+    if results["imports"]["heavy_modules_at_startup"]:
+        failures.append(f"heavy modules imported at startup: {results['imports']['heavy_modules_at_startup']}")
+    results["budget"] = {"first_update_ms": args.budget_ms, "import_main_ms": args.import_budget_ms,
+                         "passed": not failures, "failures": failures}
+
+    parameters = {key: value for key, value in vars(args).items() if key not in ("output", "child")}
+    write_report("startup_bench", parameters, results, args.output)
+    for failure in failures:
+        print(f"BUDGET EXCEEDED: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
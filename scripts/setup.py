@@ -19,7 +19,7 @@ def initialize_database(db_path="data/bot.db", schema_path="src/persistence/sche
         if conn:
             conn.close()
 
-def load_initial_admins(db_path="data/bot.db", admins_config_path="config/admins.json"):
+def load_initial_admins(db_path="data/reference.db", admins_config_path="config/admins.json"):
     """Loads initial admin IDs from config into the database."""
     if not os.path.exists(admins_config_path):
         print(f"Admin config file not found: {admins_config_path}")
@@ -65,7 +65,9 @@ def create_initial_config_files():
   ],
   "chrome_profile_path": "C:\\\\Users\\\\<User>\\\\AppData\\\\Local\\\\Google\\\\Chrome\\\\User Data\\\\BotProfile",
   "download_directory": "C:\\\\BotDownloads",
-  "google_drive_folder_id": "YOUR_GOOGLE_DRIVE_FOLDER_ID"
+  "google_drive_folder_id": "YOUR_GOOGLE_DRIVE_FOLDER_ID",
+  "metrics_host": "127.0.0.1",
+  "metrics_port": 9464
 }""")
         print(f"Created example config file: {config_example_path}")
 
@@ -125,5 +127,6 @@ if __name__ == "__main__":
     create_runtime_directories()
     create_initial_config_files()
     initialize_database()
+    initialize_database("data/reference.db", "src/persistence/reference_schema.sql") # Admins, groups, plans
     load_initial_admins()
     print("Setup complete. Please review config files and place your Google Drive credentials.")
@@ -72,7 +72,7 @@ async def handle_new_chat_members(update: Update, context: ContextTypes.DEFAULT_
     Handles when the bot is added to a new group.
     Checks if the group is approved and leaves if not.
     """
-    db = context.application.user_data['db'] # Access the Database instance
+    db = context.application.user_data['reference_db'] # Access the Database instance
     bot_id = context.bot.id
     chat_id = update.effective_chat.id
     chat_name = update.effective_chat.title
@@ -1,9 +1,11 @@
 import logging
+import time
 from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler, filters
 
 from persistence.db import Database
 from bot.auth import check_admin
+from services.profiler import DEFAULT_DURATION, MAX_DURATION, format_report
 
 logger = logging.getLogger(__name__)
 
@@ -26,15 +28,245 @@ async def admin_command_list(update: Update, context: ContextTypes.DEFAULT_TYPE)
     command_list = """
 Available Admin Commands (in DM):
 /admincommands - List available admin commands
-/manage-this-group-queue [group_id] - View pending tasks for a specific group
+/manage_this_group_queue [group_id] [active|pending|failed|completed|all] - Browse a group's queue page by page
+/queue_stats [domain|plan] [minutes] - p50/p95/p99 time-in-stage over a sliding window
+/archive_stats [days] - Task totals per status, including archived tasks
+/circuit_breakers - Sites whose tasks are paused after repeated failures, and tasks waiting to retry
+/jobs [run <name>] - Maintenance jobs with their schedule, last run and duration; run one now
+/profile [seconds] [cpu] - Profile the live bot (CPU, allocations, asyncio tasks, loop blocks); cpu skips allocations
 # TODO: Add more admin DM commands here (e.g., broadcast, stats, user lookup)
 """
     await update.message.reply_text(command_list)
 
 
+async def queue_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handles the /queue_stats command: time-in-stage percentiles per domain or per plan."""
+    user = update.effective_user
+    chat_id = update.effective_chat.id
+
+    # Command must be used in DM
+    if chat_id < 0:
+        await update.message.reply_text("This command can only be used in a private chat with the bot.")
+        return
+
+    # Check if user is admin
+    if not await check_admin(user.id, context):
+        await update.message.reply_text("You are not authorized to use this command.")
+        return
+
+    dimension = context.args[0].lower() if context.args else 'domain'
+    if dimension not in ('domain', 'plan'):
+        await update.message.reply_text("Usage: /queue_stats [domain|plan] [minutes]")
+        return
+
+    timeline = context.application.user_data['timeline']
+    try:
+        minutes = int(context.args[1]) if len(context.args) > 1 else timeline.window_seconds // 60
+    except ValueError:
+        await update.message.reply_text("Usage: /queue_stats [domain|plan] [minutes]")
+        return
+    if minutes <= 0:
+        await update.message.reply_text("Usage: /queue_stats [domain|plan] [minutes] (minutes must be at least 1)")
+        return
+
+    stats = timeline.percentiles(dimension, window_seconds=minutes * 60)
+    if not stats:
+        await update.message.reply_text(f"No stage transitions recorded in the last {minutes} min.")
+        return
+
+    lines = [f"Time in stage by {dimension}, last {minutes} min (p50 / p95 / p99, n):"]
+    for (key, stage), row in sorted(stats.items()):
+        lines.append(f"{key} · {stage}: {row['p50']:.1f}s / {row['p95']:.1f}s / {row['p99']:.1f}s (n={row['count']})")
+    await update.message.reply_text("\n".join(lines))
+
+
+async def archive_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handles the /archive_stats command: task totals per status across the hot and archive databases."""
+    user = update.effective_user
+    chat_id = update.effective_chat.id
+
+    # Command must be used in DM
+    if chat_id < 0:
+        await update.message.reply_text("This command can only be used in a private chat with the bot.")
+        return
+
+    # Check if user is admin
+    if not await check_admin(user.id, context):
+        await update.message.reply_text("You are not authorized to use this command.")
+        return
+
+    try:
+        days = int(context.args[0]) if context.args else 7
+    except ValueError:
+        await update.message.reply_text("Usage: /archive_stats [days]")
+        return
+
+    archiver = context.application.user_data['archiver']
+    try:
+        counts = await archiver.stats(days)
+    except Exception as e:
+        logger.error(f"Error fetching archive stats for admin {user.id}: {e}")
+        await update.message.reply_text(f"An error occurred while fetching stats: {e}")
+        return
+
+    if not counts:
+        await update.message.reply_text(f"No tasks in the last {days} days.")
+        return
+    lines = [f"Tasks in the last {days} days (hot + archive):"]
+    lines.extend(f"- {status}: {count}" for status, count in sorted(counts.items()))
+    lines.append(f"Archived since startup: {archiver.total_archived}")
+    await update.message.reply_text("\n".join(lines))
+
+
+async def circuit_breakers(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handles the /circuit_breakers command: open or half-open breakers and the retry backlog."""
+    user = update.effective_user
+    chat_id = update.effective_chat.id
+
+    # Command must be used in DM
+    if chat_id < 0:
+        await update.message.reply_text("This command can only be used in a private chat with the bot.")
+        return
+
+    # Check if user is admin
+    if not await check_admin(user.id, context):
+        await update.message.reply_text("You are not authorized to use this command.")
+        return
+
+    db: Database = context.application.user_data['db']
+    retries = context.application.user_data['retries']
+    try:
+        row = await db.fetchone("SELECT COUNT(*), MIN(next_attempt_at) FROM tasks WHERE status = 'retrying'")
+    except Exception as e:
+        logger.error(f"Error fetching retry backlog for admin {user.id}: {e}")
+        await update.message.reply_text(f"An error occurred while fetching the retry backlog: {e}")
+        return
+
+    lines = [f"Tasks waiting to retry: {row[0]}" + (f" (next at {row[1]} UTC)" if row[1] else "")]
+    breakers = retries.stats()
+    if not breakers:
+        lines.append("All circuit breakers are closed.")
+    for domain, state, failures, reopens_in in sorted(breakers):
+        detail = f", probing again in {reopens_in / 60:.0f} min" if reopens_in else ""
+        lines.append(f"- {domain}: {state.replace('_', '-')} after {failures} consecutive failures{detail}")
+    await update.message.reply_text("\n".join(lines))
+
+
+def _format_ago(timestamp: float) -> str:
+    seconds = abs(time.time() - timestamp)
+    if seconds < 120:
+        return f"{seconds:.0f}s"
+    if seconds < 7200:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+async def jobs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handles the /jobs command: maintenance job schedules and run stats, or /jobs run <name>."""
+    user = update.effective_user
+    chat_id = update.effective_chat.id
+
+    # Command must be used in DM
+    if chat_id < 0:
+        await update.message.reply_text("This command can only be used in a private chat with the bot.")
+        return
+
+    # Check if user is admin
+    if not await check_admin(user.id, context):
+        await update.message.reply_text("You are not authorized to use this command.")
+        return
+
+    scheduler = context.application.user_data['jobs']
+    if context.args:
+        if len(context.args) != 2 or context.args[0].lower() != 'run':
+            await update.message.reply_text("Usage: /jobs [run <name>]")
+            return
+        name = context.args[1]
+        if name not in scheduler.jobs:
+            await update.message.reply_text(f"Unknown job '{name}'. Jobs: {', '.join(scheduler.jobs)}")
+            return
+        if scheduler.run_now(name):
+            await update.message.reply_text(f"Job {name} started; see /jobs for the result.")
+        else:
+            await update.message.reply_text(f"Job {name} is already running.")
+        return
+
+    lines = ["Maintenance jobs:"]
+    for job in scheduler.stats():
+        lines.append(f"{job['name']} · {job['schedule']}" + (" · heavy" if job['heavy'] else ""))
+        if job['running']:
+            lines.append(f"  running for {_format_ago(job['last_started_at'])}")
+        elif job['last_started_at'] is not None:
+            detail = f": {job['last_error']}" if job['last_error'] else ""
+            lines.append(f"  last run {_format_ago(job['last_started_at'])} ago, {job['last_outcome']} "
+                         f"in {job['last_duration']:.1f}s{detail}")
+        else:
+            lines.append("  not run yet")
+        if job['next_run_at'] is not None and not job['running']:
+            lines.append(f"  next in {_format_ago(job['next_run_at'])}")
+        lines.append(f"  runs {job['runs']}, failed {job['failures']}, timed out {job['timeouts']}, "
+                     f"skipped {job['skipped']}, deferred {job['deferred_seconds'] / 60:.0f} min")
+    await update.message.reply_text("\n".join(lines))
+
+
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handles the /profile command: profiles the running bot for N seconds, then replies with the report."""
+    user = update.effective_user
+    chat_id = update.effective_chat.id
+
+    # Command must be used in DM
+    if chat_id < 0:
+        await update.message.reply_text("This command can only be used in a private chat with the bot.")
+        return
+
+    # Check if user is admin
+    if not await check_admin(user.id, context):
+        await update.message.reply_text("You are not authorized to use this command.")
+        return
+
+    usage = f"Usage: /profile [seconds, 1-{MAX_DURATION}] [cpu]"
+    args = [arg.lower() for arg in context.args or []]
+    trace_memory = 'cpu' not in args
+    if not trace_memory:
+        args.remove('cpu')
+    try:
+        seconds = int(args[0]) if args else DEFAULT_DURATION
+    except ValueError:
+        await update.message.reply_text(usage)
+        return
+    if len(args) > 1 or not 1 <= seconds <= MAX_DURATION:
+        await update.message.reply_text(usage)
+        return
+
+    profiler = context.application.user_data['profiler']
+    if profiler.running:
+        await update.message.reply_text("A profile is already running; its report will be sent when it ends.")
+        return
+
+    async def run_profile():
+        try:
+            report = await profiler.profile(seconds, trace_memory=trace_memory)
+        except Exception as e:
+            logger.error(f"Profile requested by admin {user.id} failed: {e}", exc_info=True)
+            await update.message.reply_text(f"Profiling failed: {e}")
+            return
+        await update.message.reply_text(format_report(report))
+
+    # Updates are handled one at a time, so the profile runs as its own task instead of holding up the handler
+    context.application.create_task(run_profile())
+    what = "CPU" if not trace_memory else "CPU and allocations"
+    logger.info(f"Admin {user.id} started a {seconds}s profile ({what}).")
+    await update.message.reply_text(f"Profiling {what} for {seconds}s. The report follows when it's done.")
+
+
 def setup_admin_dm_handlers(dispatcher, bot_instance):
     """Registers admin DM command handlers."""
     # Handler for command used in Admin DM
     dispatcher.add_handler(CommandHandler("admincommands", admin_command_list, filters=filters.ChatType.PRIVATE))
+    dispatcher.add_handler(CommandHandler("queue_stats", queue_stats, filters=filters.ChatType.PRIVATE))
+    dispatcher.add_handler(CommandHandler("archive_stats", archive_stats, filters=filters.ChatType.PRIVATE))
+    dispatcher.add_handler(CommandHandler("circuit_breakers", circuit_breakers, filters=filters.ChatType.PRIVATE))
+    dispatcher.add_handler(CommandHandler("jobs", jobs, filters=filters.ChatType.PRIVATE))
+    dispatcher.add_handler(CommandHandler("profile", profile, filters=filters.ChatType.PRIVATE))
 
     logger.info("Registered admin DM handlers.")
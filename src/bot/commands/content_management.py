@@ -9,7 +9,7 @@ from bot.auth import check_admin
 logger = logging.getLogger(__name__)
 
 async def block_website(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handles the /block-website command to block a domain in a group."""
+    """Handles the /block_website command to block a domain in a group."""
     user = update.effective_user
     chat_id = update.effective_chat.id
 
@@ -25,11 +25,11 @@ async def block_website(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
     # Check if domain is provided
     if not context.args:
-        await update.message.reply_text("Usage: /block-website [domain]")
+        await update.message.reply_text("Usage: /block_website [domain]")
         return
 
     domain_to_block = context.args[0].lower() # Block case-insensitively
-    db: Database = context.application.user_data['db']
+    db: Database = context.application.user_data['reference_db']
 
     try:
         # Add the domain to the blocked_domains table for this group
@@ -37,6 +37,7 @@ async def block_website(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             "INSERT OR IGNORE INTO blocked_domains (group_id, domain) VALUES (?, ?)",
             (chat_id, domain_to_block)
         )
+        await context.application.user_data['reference'].refresh() # The worker's blocked-domain check reads the cache
 
         logger.info(f"Admin {user.id} blocked domain '{domain_to_block}' in group {chat_id}")
         await update.message.reply_text(f"✅ Domain `{domain_to_block}` blocked in this group.")
@@ -47,7 +48,7 @@ async def block_website(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
 
 async def unblock_website(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handles the /unblock-website command to unblock a domain in a group."""
+    """Handles the /unblock_website command to unblock a domain in a group."""
     user = update.effective_user
     chat_id = update.effective_chat.id
 
@@ -63,11 +64,11 @@ async def unblock_website(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     # Check if domain is provided
     if not context.args:
-        await update.message.reply_text("Usage: /unblock-website [domain]")
+        await update.message.reply_text("Usage: /unblock_website [domain]")
         return
 
     domain_to_unblock = context.args[0].lower() # Unblock case-insensitively
-    db: Database = context.application.user_data['db']
+    db: Database = context.application.user_data['reference_db']
 
     try:
         # Delete the domain from the blocked_domains table for this group
@@ -75,6 +76,7 @@ async def unblock_website(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             "DELETE FROM blocked_domains WHERE group_id = ? AND domain = ?",
             (chat_id, domain_to_unblock)
         )
+        await context.application.user_data['reference'].refresh()
 
         if cursor.rowcount > 0:
             logger.info(f"Admin {user.id} unblocked domain '{domain_to_unblock}' in group {chat_id}")
@@ -90,7 +92,7 @@ async def unblock_website(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 def setup_content_management_handlers(dispatcher):
     """Registers content management (block/unblock) command handlers."""
     # Handlers for commands used in Groups
-    dispatcher.add_handler(CommandHandler("block-website", block_website, filters=filters.ChatType.GROUPS))
-    dispatcher.add_handler(CommandHandler("unblock-website", unblock_website, filters=filters.ChatType.GROUPS))
+    dispatcher.add_handler(CommandHandler("block_website", block_website, filters=filters.ChatType.GROUPS))
+    dispatcher.add_handler(CommandHandler("unblock_website", unblock_website, filters=filters.ChatType.GROUPS))
 
     logger.info("Registered content management handlers.")
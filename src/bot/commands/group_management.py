@@ -31,7 +31,7 @@ async def group_approve(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
                  return
 
             group_id = int(group_id_str)
-            db: Database = context.application.user_data['db']
+            db: Database = context.application.user_data['reference_db']
 
             # 3. Insert or update the group in the database
             await db.execute(
@@ -63,7 +63,7 @@ async def all_approved_groups(update: Update, context: ContextTypes.DEFAULT_TYPE
             await update.message.reply_text("Only admins can use this command in a private chat.")
             return
 
-        db: Database = context.application.user_data['db']
+        db: Database = context.application.user_data['reference_db']
 
         try:
             # 2. Fetch all approved groups from the database
@@ -109,7 +109,7 @@ async def delete_approved_group(update: Update, context: ContextTypes.DEFAULT_TY
                  return
 
             group_id = int(group_id_str)
-            db: Database = context.application.user_data['db']
+            db: Database = context.application.user_data['reference_db']
 
             # 3. Delete the group from the database
             cursor = await db.execute("DELETE FROM groups WHERE group_id = ?", (group_id,))
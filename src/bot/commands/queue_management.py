@@ -1,14 +1,93 @@
 import logging
-from telegram import Update
-from telegram.ext import ContextTypes, CommandHandler, filters
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler, filters
 
 from persistence.db import Database
 from bot.auth import check_admin
+from services.queue_index import format_eta, queue_estimate
 
 logger = logging.getLogger(__name__)
 
+QUEUE_PAGE_SIZE = 10
+MAX_LINK_CHARS = 80 # Keeps a full page well under Telegram's 4096-char message limit
+# Filter name -> statuses it covers (None = every status)
+STATUS_FILTERS = {
+    'active': ('pending', 'downloading', 'uploading', 'retrying'),
+    'pending': ('pending',),
+    'failed': ('failed', 'error'),
+    'completed': ('completed', 'complete'),
+    'all': None,
+}
+QUEUE_CALLBACK_PREFIX = "queue"
+
+
+async def fetch_queue_page(db: Database, group_id: int, status_filter: str, direction: str = 'next', cursor: int = 0):
+    """
+    Returns (rows, has_more) for one page of a group's tasks using keyset pagination on task_id.
+    direction 'next' returns tasks after cursor, 'prev' tasks before it; rows are always ascending.
+    Each page is an index range scan on (group_id[, status], task_id), independent of history size.
+    """
+    statuses = STATUS_FILTERS[status_filter]
+    status_clause = f" AND status IN ({', '.join('?' * len(statuses))})" if statuses else ""
+    if direction == 'prev':
+        key_clause, order = "task_id < ?", "DESC"
+    else:
+        key_clause, order = "task_id > ?", "ASC"
+
+    rows = await db.fetchall(
+        f"SELECT task_id, user_id, original_link, status, priority, created_at FROM tasks "
+        f"WHERE group_id = ?{status_clause} AND {key_clause} ORDER BY task_id {order} LIMIT ?",
+        (group_id, *(statuses or ()), cursor, QUEUE_PAGE_SIZE + 1)
+    )
+    has_more = len(rows) > QUEUE_PAGE_SIZE
+    rows = rows[:QUEUE_PAGE_SIZE]
+    if direction == 'prev':
+        rows.reverse()
+    return rows, has_more
+
+
+async def fetch_status_counts(db: Database, group_id: int) -> dict:
+    """Per-status task counts for a group, read from the trigger-maintained queue_counters table."""
+    rows = await db.fetchall("SELECT status, task_count FROM queue_counters WHERE group_id = ? AND task_count > 0", (group_id,))
+    return dict(rows)
+
+
+async def render_queue_page(db: Database, group_id: int, status_filter: str, direction: str = 'next', cursor: int = 0):
+    """Builds the message text and inline keyboard for one page of the queue browser."""
+    counts = await fetch_status_counts(db, group_id)
+    rows, has_more = await fetch_queue_page(db, group_id, status_filter, direction, cursor)
+
+    header = f"Queue for group `{group_id}` ({status_filter})"
+    summary = ", ".join(f"{status}: {count}" for status, count in sorted(counts.items())) or "no tasks"
+    lines = [header, summary, ""]
+    for task_id, user_id, link, status, priority, created_at in rows:
+        priority_str = "Priority" if priority == 1 else "Normal"
+        if len(link) > MAX_LINK_CHARS:
+            link = link[:MAX_LINK_CHARS - 1] + "…"
+        lines.append(f"- Task `{task_id}` (User: `{user_id}`, Status: `{status}`, {priority_str}, Added: {created_at}): {link}")
+    if not rows:
+        lines.append("No tasks on this page.")
+
+    # Prev/Next only when there is something in that direction
+    if direction == 'prev':
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = cursor > 0, has_more
+    nav = []
+    if rows and has_prev:
+        nav.append(InlineKeyboardButton("◀ Prev", callback_data=f"{QUEUE_CALLBACK_PREFIX}|{group_id}|{status_filter}|prev|{rows[0][0]}"))
+    if rows and has_next:
+        nav.append(InlineKeyboardButton("Next ▶", callback_data=f"{QUEUE_CALLBACK_PREFIX}|{group_id}|{status_filter}|next|{rows[-1][0]}"))
+    filter_row = [
+        InlineKeyboardButton(("• " if name == status_filter else "") + name.capitalize(),
+                             callback_data=f"{QUEUE_CALLBACK_PREFIX}|{group_id}|{name}|next|0")
+        for name in STATUS_FILTERS
+    ]
+    keyboard = [nav, filter_row] if nav else [filter_row]
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
 async def reset_queue(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handles the /reset-queue command to reset the task queue for a group."""
+    """Handles the /reset_queue command to reset the task queue for a group."""
     user = update.effective_user
     chat_id = update.effective_chat.id
 
@@ -26,13 +105,21 @@ async def reset_queue(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
     try:
         # Delete all pending tasks for this group
-        cursor = await db.execute(
-            "DELETE FROM tasks WHERE group_id = ? AND status IN ('pending', 'downloading', 'uploading', 'retrying')",
+        rows = await db.execute_returning(
+            "DELETE FROM tasks WHERE group_id = ? AND status IN ('pending', 'downloading', 'uploading', 'retrying') "
+            "RETURNING task_id, status, local_filepath",
             (chat_id,)
         )
+        storage = context.application.user_data['storage']
+        for _, status, path in rows:
+            if path and status in ('pending', 'retrying'): # Not in a worker's hands; kept downloads are no longer needed
+                storage.release(None, path)
 
-        logger.info(f"Admin {user.id} reset queue for group {chat_id}. Deleted {cursor.rowcount} tasks.")
-        await update.message.reply_text(f"✅ Task queue reset for this group. {cursor.rowcount} pending tasks removed.")
+        context.application.user_data['queue_index'].remove_group(chat_id)
+        context.application.user_data['scheduler'].remove_group(chat_id)
+        context.application.user_data['timeline'].forget(task_id for task_id, _, _ in rows)
+        logger.info(f"Admin {user.id} reset queue for group {chat_id}. Deleted {len(rows)} tasks.")
+        await update.message.reply_text(f"✅ Task queue reset for this group. {len(rows)} pending tasks removed.")
 
     except Exception as e:
         logger.error(f"Error resetting queue for group {chat_id}: {e}")
@@ -40,7 +127,7 @@ async def reset_queue(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
 
 async def manage_this_group_queue(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handles the /manage-this-group-queue command to manage/monitor queue for a specific group (Admin DM)."""
+    """Handles the /manage_this_group_queue command to manage/monitor queue for a specific group (Admin DM)."""
     user = update.effective_user
     chat_id = update.effective_chat.id
 
@@ -56,7 +143,12 @@ async def manage_this_group_queue(update: Update, context: ContextTypes.DEFAULT_
 
     # Check if group_id is provided
     if not context.args:
-        await update.message.reply_text("Usage: /manage-this-group-queue [group_id]")
+        await update.message.reply_text("Usage: /manage_this_group_queue [group_id] [active|pending|failed|completed|all]")
+        return
+
+    status_filter = context.args[1].lower() if len(context.args) > 1 else 'active'
+    if status_filter not in STATUS_FILTERS:
+        await update.message.reply_text(f"Unknown filter '{status_filter}'. Use one of: {', '.join(STATUS_FILTERS)}")
         return
 
     try:
@@ -69,25 +161,9 @@ async def manage_this_group_queue(update: Update, context: ContextTypes.DEFAULT_
         group_id = int(group_id_str)
         db: Database = context.application.user_data['db']
 
-        # Fetch pending tasks for the specified group
-        tasks = await db.fetchall(
-            "SELECT task_id, user_id, original_link, status, priority, created_at FROM tasks WHERE group_id = ? ORDER BY priority DESC, created_at ASC",
-            (group_id,)
-        )
-
-        if not tasks:
-            await update.message.reply_text(f"No pending or in-progress tasks found for group `{group_id}`.")
-            return
-
-        # Format and send the list of tasks
-        task_list = []
-        for task in tasks:
-            task_id, user_id, link, status, priority, created_at = task
-            priority_str = "Priority" if priority == 1 else "Normal"
-            task_list.append(f"- Task `{task_id}` (User: `{user_id}`, Status: `{status}`, Priority: `{priority_str}`, Added: {created_at}): {link}")
-
-        message_text = f"Pending requests for group `{group_id}`:\n" + "\n".join(task_list)
-        await update.message.reply_text(message_text)
+        # Send the first page; Prev/Next and filter buttons are handled by queue_page_callback
+        message_text, keyboard = await render_queue_page(db, group_id, status_filter)
+        await update.message.reply_text(message_text, reply_markup=keyboard)
 
         # TODO: Add options for managing specific tasks (e.g., delete by task_id)
 
@@ -98,12 +174,59 @@ async def manage_this_group_queue(update: Update, context: ContextTypes.DEFAULT_
         await update.message.reply_text(f"An error occurred while fetching the queue: {e}")
 
 
+async def queue_position(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handles the /queue_position command: where the user's pending links are and when they should finish."""
+    user = update.effective_user
+    queue_index = context.application.user_data['queue_index']
+    scheduler = context.application.user_data['scheduler']
+
+    task_ids = queue_index.user_tasks(user.id)
+    if not task_ids:
+        await update.message.reply_text("You have no links waiting in the queue.")
+        return
+
+    lines = ["Your links in the queue (estimated from each group's and plan's fair share):"]
+    for task_id in task_ids:
+        position, eta = queue_estimate(queue_index, scheduler, task_id)
+        lines.append(f"- Task `{task_id}`: about #{position}, ready in {format_eta(eta)}")
+    await update.message.reply_text("\n".join(lines))
+
+
+async def queue_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handles Prev/Next and filter buttons of the /manage_this_group_queue browser."""
+    query = update.callback_query
+
+    if not await check_admin(query.from_user.id, context):
+        await query.answer("Only admins can use this.", show_alert=True)
+        return
+
+    try:
+        _, group_id_str, status_filter, direction, cursor_str = query.data.split("|")
+        group_id, cursor = int(group_id_str), int(cursor_str)
+        if status_filter not in STATUS_FILTERS or direction not in ('next', 'prev'):
+            raise ValueError(query.data)
+    except ValueError:
+        await query.answer("Invalid page request.")
+        return
+
+    db: Database = context.application.user_data['db']
+    try:
+        message_text, keyboard = await render_queue_page(db, group_id, status_filter, direction, cursor)
+        await query.answer()
+        await query.edit_message_text(message_text, reply_markup=keyboard)
+    except Exception as e:
+        logger.error(f"Error paging queue for group {group_id} (admin {query.from_user.id}): {e}")
+        await query.answer(f"An error occurred while fetching the queue: {e}")
+
+
 def setup_queue_management_handlers(dispatcher):
     """Registers queue management command handlers."""
     # Handler for command used in Groups
-    dispatcher.add_handler(CommandHandler("reset-queue", reset_queue, filters=filters.ChatType.GROUPS))
+    dispatcher.add_handler(CommandHandler("reset_queue", reset_queue, filters=filters.ChatType.GROUPS))
+    dispatcher.add_handler(CommandHandler("queue_position", queue_position, filters=filters.ChatType.GROUPS))
 
     # Handler for command used in Admin DM
-    dispatcher.add_handler(CommandHandler("manage-this-group-queue", manage_this_group_queue, filters=filters.ChatType.PRIVATE))
+    dispatcher.add_handler(CommandHandler("manage_this_group_queue", manage_this_group_queue, filters=filters.ChatType.PRIVATE))
+    dispatcher.add_handler(CallbackQueryHandler(queue_page_callback, pattern=rf"^{QUEUE_CALLBACK_PREFIX}\|"))
 
     logger.info("Registered queue management handlers.")
@@ -8,7 +8,7 @@ from bot.auth import check_admin
 logger = logging.getLogger(__name__)
 
 async def bot_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handles the /bot-start command to activate the bot in a group."""
+    """Handles the /bot_start command to activate the bot in a group."""
     user = update.effective_user
     chat_id = update.effective_chat.id
 
@@ -22,7 +22,7 @@ async def bot_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text("Only admins can use this command.")
         return
 
-    db: Database = context.application.user_data['db']
+    db: Database = context.application.user_data['reference_db']
 
     try:
         # Check if the group is approved first
@@ -47,7 +47,7 @@ async def bot_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 
 async def stop_bot(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handles the /stop-bot command to deactivate the bot in a group."""
+    """Handles the /stop_bot command to deactivate the bot in a group."""
     user = update.effective_user
     chat_id = update.effective_chat.id
 
@@ -61,7 +61,7 @@ async def stop_bot(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text("Only admins can use this command.")
         return
 
-    db: Database = context.application.user_data['db']
+    db: Database = context.application.user_data['reference_db']
 
     try:
         # Set the group to inactive
@@ -94,7 +94,7 @@ async def unactivate_bot(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await update.message.reply_text("Only admins can use this command.")
         return
 
-    db: Database = context.application.user_data['db']
+    db: Database = context.application.user_data['reference_db']
 
     try:
         # Set the group to paused
@@ -126,7 +126,7 @@ async def activate_bot(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         await update.message.reply_text("Only admins can use this command.")
         return
 
-    db: Database = context.application.user_data['db']
+    db: Database = context.application.user_data['reference_db']
 
     try:
         # Set the group to not paused
@@ -146,8 +146,8 @@ async def activate_bot(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 def setup_start_stop_handlers(dispatcher):
     """Registers start/stop/activate/unactivate command handlers."""
     # Handlers for commands used in Groups
-    dispatcher.add_handler(CommandHandler("bot-start", bot_start, filters=filters.ChatType.GROUPS))
-    dispatcher.add_handler(CommandHandler("stop-bot", stop_bot, filters=filters.ChatType.GROUPS))
+    dispatcher.add_handler(CommandHandler("bot_start", bot_start, filters=filters.ChatType.GROUPS))
+    dispatcher.add_handler(CommandHandler("stop_bot", stop_bot, filters=filters.ChatType.GROUPS))
     dispatcher.add_handler(CommandHandler("unactivate", unactivate_bot, filters=filters.ChatType.GROUPS))
     dispatcher.add_handler(CommandHandler("activate", activate_bot, filters=filters.ChatType.GROUPS))
 
@@ -23,13 +23,13 @@ async def set_subscription_plan(update: Update, context: ContextTypes.DEFAULT_TY
         await update.message.reply_text("Only admins can change the subscription plan.")
         return
 
-    db: Database = context.application.user_data['db']
+    db: Database = context.application.user_data['reference_db']
 
     try:
         # Check if the group is active
         group_status = await db.fetchone("SELECT is_active FROM groups WHERE group_id = ?", (chat_id,))
         if not group_status or not group_status[0]:
-            await update.message.reply_text("The bot is not active in this group. Use /bot-start first.")
+            await update.message.reply_text("The bot is not active in this group. Use /bot_start first.")
             return
 
         # Update the subscription plan in the database
@@ -42,6 +42,8 @@ async def set_subscription_plan(update: Update, context: ContextTypes.DEFAULT_TY
             "UPDATE groups SET subscription_plan = ? WHERE group_id = ?",
             (plan, chat_id)
         )
+        # Moves queued tasks to the new tier (ReferenceData calls scheduler.set_group_plan)
+        await context.application.user_data['reference'].refresh()
 
 
         logger.info(f"Admin {user.id} set subscription plan to '{plan}' for group {chat_id}")
@@ -0,0 +1,86 @@
+import re
+from urllib.parse import urlsplit
+
+from services.config_watcher import DomainMatcher
+
+MAX_LINKS_PER_MESSAGE = 20 # Links beyond this in one message are ignored
+URL_ENTITY_TYPES = ("url", "text_link")
+# Fallback when a message carries no url entities: scheme or www. prefix up to whitespace or a quote/bracket
+URL_PATTERN = re.compile(r"(?:https?://|www\.)[^\s<>\"'`«»]+", re.IGNORECASE)
+TRAILING_PUNCTUATION = ".,;:!?)]}'\"…"
+SCHEME_PATTERN = re.compile(r"[a-z][a-z0-9+.-]*:(?!\d)", re.IGNORECASE) # "https:", "mailto:"; not "host:8080"
+
+
+class ExtractedLinks:
+    """Result of extract_links(): supported (link, netloc) pairs in message order, and the unsupported hosts."""
+    __slots__ = ("links", "unsupported")
+
+    def __init__(self):
+        self.links = []
+        self.unsupported = []
+
+    def __bool__(self) -> bool:
+        return bool(self.links or self.unsupported)
+
+
+def _clean(candidate: str):
+    """Normalizes one raw link: trims sentence punctuation (keeping balanced parentheses) and adds a missing scheme."""
+    link = candidate.strip()
+    while link and link[-1] in TRAILING_PUNCTUATION:
+        if link[-1] == ")" and link.count("(") >= link.count(")"):
+            break
+        link = link[:-1]
+    if not link:
+        return None
+    if not SCHEME_PATTERN.match(link):
+        link = "https://" + link # Telegram marks bare freepik.com/... as a url entity too
+    return link
+
+
+def _entity_links(text: str, entities):
+    """Link strings of url/text_link entities. Offsets are in UTF-16 code units, so the text is encoded
+    once and every entity is sliced from that (Message.parse_entity would re-encode it per entity)."""
+    encoded = None
+    for entity in entities:
+        if entity.type == "text_link":
+            yield entity.url
+        elif entity.type == "url":
+            if encoded is None:
+                encoded = text.encode("utf-16-le")
+            yield encoded[entity.offset * 2:(entity.offset + entity.length) * 2].decode("utf-16-le")
+
+
+def extract_links(text: str, entities, matcher: DomainMatcher, limit: int = MAX_LINKS_PER_MESSAGE) -> ExtractedLinks:
+    """
+    Finds the links in a message text or caption, in order and without duplicates. Telegram's url and
+    text_link entities are used when present, otherwise URL_PATTERN. Each link's host is checked with
+    the DomainMatcher: supported ones go to .links as (link, lowercased netloc), the rest to .unsupported.
+    Linear in the length of the text.
+    """
+    result = ExtractedLinks()
+    if not text:
+        return result
+    url_entities = [entity for entity in entities or () if entity.type in URL_ENTITY_TYPES]
+    candidates = _entity_links(text, url_entities) if url_entities else (m.group() for m in URL_PATTERN.finditer(text))
+    seen, unsupported = set(), set()
+    for candidate in candidates:
+        link = _clean(candidate or "")
+        if link is None or link in seen:
+            continue
+        seen.add(link)
+        try:
+            parts = urlsplit(link)
+            host = parts.hostname
+        except ValueError:
+            continue
+        if parts.scheme.lower() not in ("http", "https") or not host:
+            continue # mailto:, tg:// and the like in text_link entities
+        if matcher.match(host) is None:
+            if host not in unsupported:
+                unsupported.add(host)
+                result.unsupported.append(host)
+            continue
+        result.links.append((link, parts.netloc.lower()))
+        if len(result.links) >= limit:
+            break
+    return result
@@ -0,0 +1,23 @@
+import logging
+from telegram.request import HTTPXRequest
+
+from services.metrics import TELEGRAM_API_CALLS, TELEGRAM_API_RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+class InstrumentedHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest that counts Bot API calls per method and status code, including 429s."""
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1] # .../bot<token>/sendMessage -> sendMessage
+        try:
+            code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+        except Exception:
+            TELEGRAM_API_CALLS.inc(method=api_method, code="error")
+            raise
+
+        TELEGRAM_API_CALLS.inc(method=api_method, code=code)
+        if code == 429:
+            TELEGRAM_API_RATE_LIMITED.inc(method=api_method)
+            logger.warning(f"Telegram API rate limited on {api_method}")
+        return code, payload
@@ -1,12 +1,10 @@
 import asyncio
 import logging
-import json
 import os
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
-from urllib.parse import urlparse # Import urlparse
 
-from persistence.db import Database
+from persistence.db import Database, REFERENCE_POLICY, REFERENCE_SCHEMA, ARCHIVE_POLICY
 from bot.auth import check_admin, check_channel_membership, handle_new_chat_members
 from bot.commands.admin_dm import setup_admin_dm_handlers
 from bot.commands.group_management import setup_group_management_handlers
@@ -14,10 +12,32 @@ from bot.commands.subscription import setup_subscription_handlers
 from bot.commands.queue_management import setup_queue_management_handlers
 from bot.commands.start_stop import setup_start_stop_handlers
 from bot.commands.content_management import setup_content_management_handlers
+from bot.utils import InstrumentedHTTPXRequest
+from bot.links import extract_links
+from services import metrics
+from services.task_timeline import TaskTimeline
+from services.queue_index import QueueIndex, format_eta, queue_estimate
+from services.archiver import TaskArchiver, ARCHIVE_DATABASE_PATH
+from services.backup import BackupScheduler
+from services.recovery import CrashRecovery, make_drive_lookup
+from services.download_storage import DownloadStorage, GIB
+from services.config_watcher import ConfigWatcher
+from services.log_pipeline import LogPipeline
+from services.network_monitor import NetworkMonitor
+from services.drive_retention import DriveRetention
+from services.admission import AdmissionControl
+from services.reference_data import ReferenceData
+from services.job_scheduler import JobScheduler, trigger_from_config
+from services.profiler import Profiler
 # from bot.commands.admin_dm import admin_command_list_handler # Example handler import
 from worker.queue_consumer import start_worker_process # Assuming worker is a separate process
+from worker.fair_scheduler import FairScheduler
+from worker.retry_scheduler import RetryScheduler, OPEN
+from worker.notices import NoticeReader
+from worker.telegram_delivery import TelegramDelivery
+from worker.drive_uploader import DriveUploader
 
-# Configure logging
+# Console logging until the LogPipeline (JSON files under logs/, background writer) is started in __main__
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO
@@ -28,75 +48,255 @@ CONFIG_PATH = "config/config.json"
 ADMINS_CONFIG_PATH = "config/admins.json"
 DOMAINS_CONFIG_PATH = "config/domains.json"
 DATABASE_PATH = "data/bot.db"
+REFERENCE_DATABASE_PATH = "data/reference.db"
 
 class Bot:
     def __init__(self):
-        self.config = self.load_config()
-        self.db = Database(DATABASE_PATH)
-        self.admin_ids = self.load_admin_ids()
-        self.domains_config = self.load_domains_config()
+        # Validated, read-only snapshots of config.json, admins.json and domains.json, reloaded on change
+        self.config_watcher = ConfigWatcher(CONFIG_PATH, ADMINS_CONFIG_PATH, DOMAINS_CONFIG_PATH)
+        self.config_watcher.load()
+        self.db = Database(DATABASE_PATH) # Hot queue: tasks and the tables that churn with them
+        self.reference_db = Database(REFERENCE_DATABASE_PATH, REFERENCE_POLICY, REFERENCE_SCHEMA) # Admins, groups, plans
+        self.reference = ReferenceData(self.reference_db) # Cached groups and blocked domains, for queue-side lookups
+        self.timeline = TaskTimeline(self.db) # Per-task stage events + time-in-stage percentiles
+        self.queue_index = QueueIndex(workers=self.config.get("worker_count", 1)) # Queue position / ETA in O(log n)
+        self.scheduler = FairScheduler(
+            self.config.get("plan_weights"),
+            max_wait_seconds=self.config.get("max_queue_wait_seconds", 1800)
+        ) # Per-group queues, deficit round-robin across plan tiers
+        self.admission = AdmissionControl.from_config(self.queue_index, self.config, scheduler=self.scheduler) # Queue caps, checked before insert
+        self.archiver = TaskArchiver(
+            self.db, Database(ARCHIVE_DATABASE_PATH, ARCHIVE_POLICY),
+            archive_after_hours=self.config.get("archive_after_hours", 48)
+        ) # Moves finished tasks out of the hot tasks table
+        self.backups = BackupScheduler(
+            {"bot": DATABASE_PATH, "reference": REFERENCE_DATABASE_PATH, "archive": ARCHIVE_DATABASE_PATH},
+            files=[ADMINS_CONFIG_PATH, DOMAINS_CONFIG_PATH],
+            keep_hours=self.config.get("backup_keep_hours", 48)
+        ) # Online SQLite backups into data/backups/
+        self.storage = DownloadStorage(
+            self.config.get("download_directory", "downloads"),
+            budget_bytes=int(self.config.get("download_budget_gb", 50) * GIB),
+            min_free_bytes=int(self.config.get("download_min_free_gb", 2) * GIB),
+            db=self.db
+        ) # Disk budget for download_directory (reservations + LRU eviction of uploaded files)
+        self.retries = RetryScheduler.from_config(
+            self.db, self.config, scheduler=self.scheduler, queue_index=self.queue_index, timeline=self.timeline
+        ) # Backoff for failed tasks + per-domain circuit breakers
+        self.network = NetworkMonitor.from_config(self.config) # Up/down signal the network stages wait on
+        self.delivery = TelegramDelivery.from_config(self.db, self.config) # Direct sendDocument uploads + file_id cache
+        self.uploader = DriveUploader.from_config(self.db, self.config) # Drive uploads, deduplicated by checksum (None: not configured)
+        self.retention = DriveRetention.from_config(self.db, self.config, self.uploader.clients) \
+            if self.uploader is not None else None # Deletes Drive files drive_retention_hours after upload
+        self.jobs = JobScheduler.from_config(self.config, pending=lambda: len(self.scheduler)) # Periodic maintenance
+        self.profiler = Profiler() # On-demand /profile of the live bot
         self.application = None # Telegram Application instance
-
-    def load_config(self):
-        """Loads configuration from config.json."""
-        if not os.path.exists(CONFIG_PATH):
-            logger.error(f"Config file not found: {CONFIG_PATH}. Please copy config.example.json and fill it.")
-            # Exit or raise error, depending on desired behavior
-            raise FileNotFoundError(f"Config file not found: {CONFIG_PATH}")
-        with open(CONFIG_PATH, 'r') as f:
-            return json.load(f)
-
-    def load_admin_ids(self):
-        """Loads admin IDs from admins.json."""
-        if not os.path.exists(ADMINS_CONFIG_PATH):
-             logger.warning(f"Admins config file not found: {ADMINS_CONFIG_PATH}. Using initial_admin_ids from config.json.")
-             return set(self.config.get("initial_admin_ids", []))
-
-        try:
-            with open(ADMINS_CONFIG_PATH, 'r') as f:
-                config = json.load(f)
-            return set(config.get("admins", []))
-        except json.JSONDecodeError as e:
-            logger.error(f"Error decoding admins.json: {e}")
-            return set(self.config.get("initial_admin_ids", []))
-
-
-    def load_domains_config(self):
-        """Loads domains configuration from domains.json."""
-        if not os.path.exists(DOMAINS_CONFIG_PATH):
-            logger.error(f"Domains config file not found: {DOMAINS_CONFIG_PATH}. Please create it based on the plan.")
-            raise FileNotFoundError(f"Domains config file not found: {DOMAINS_CONFIG_PATH}")
-        with open(DOMAINS_CONFIG_PATH, 'r') as f:
-            return json.load(f)
-
-    async def post_init(self, application: Application):
-        """Post initialization hook for the Application."""
-        logger.info("Bot started successfully!")
-        # await self.db.initialize() # Database initialization is handled by setup.py
-
-        # Store necessary data in application.user_data for handlers
+        self.metrics_server = None # Prometheus scrape endpoint, started in post_init
+        self.loop_lag_task = None
+        self.timeline_flush_task = None
+        self.recovery_task = None
+        self.config_watch_task = None
+        self.worker_task = None
+        self.retry_task = None
+        self.network_task = None
+        self.notice_task = None
+        self.reference_task = None
+        self.log_pipeline = None # Set in __main__ once the config is loaded
+
+    # Current config snapshots; each access returns the latest reloaded (read-only) version
+    @property
+    def config(self):
+        return self.config_watcher.current.config
+
+    @property
+    def admin_ids(self):
+        return self.config_watcher.current.admin_ids
+
+    @property
+    def domains_config(self):
+        return self.config_watcher.current.domains
+
+    def bind_application_state(self, application):
+        """Stores necessary data in application.user_data for handlers."""
         application.user_data['db'] = self.db
+        application.user_data['reference_db'] = self.reference_db
+        application.user_data['reference'] = self.reference
         application.user_data['admin_ids'] = self.admin_ids
         application.user_data['recommended_channels'] = self.config.get("recommended_channels", [])
         application.user_data['domains_config'] = self.domains_config
         application.user_data['config'] = self.config # Store full config as well
+        application.user_data['config_watcher'] = self.config_watcher
+        application.user_data['timeline'] = self.timeline
+        application.user_data['queue_index'] = self.queue_index
+        application.user_data['scheduler'] = self.scheduler
+        application.user_data['admission'] = self.admission
+        application.user_data['storage'] = self.storage
+        application.user_data['archiver'] = self.archiver
+        application.user_data['retries'] = self.retries
+        application.user_data['jobs'] = self.jobs
+        application.user_data['profiler'] = self.profiler
+
+    async def startup(self):
+        """Loads the state needed before the first update is handled. Everything else starts in the background."""
+        await self.db.initialize() # Idempotent (CREATE ... IF NOT EXISTS); picks up tables added since setup.py ran
+        await self.reference_db.initialize()
+        await self.reference_db.adopt_tables(DATABASE_PATH) # Reference tables of a bot.db from before the split
+        self.reference.on_plan_change(self.scheduler.set_group_plan)
+        await self.reference.load()
+        await self.queue_index.load(self.db)
+        await self.scheduler.load(self.db)
+        await self.storage.scan()
+        await self.archiver.initialize()
 
-        await start_worker_process(self.db, self.config, self.domains_config) # Start the worker
-
-    async def start(self):
-        """Starts the Telegram bot."""
-        logger.info("Starting bot...")
-        token = self.config.get("telegram_bot_token")
-        if not token or token == "YOUR_TELEGRAM_BOT_TOKEN":
-            logger.error("Telegram bot token not configured. Please update config/config.json")
+    async def post_init(self, application: Application):
+        """Post initialization hook for the Application."""
+        logger.info("Bot started successfully!")
+        await self.startup()
+        self.bind_application_state(application)
+
+        def apply_config(snapshot):
+            # Handlers read these keys per update, so re-binding publishes the new snapshot to them
+            self.bind_application_state(application)
+            self.scheduler.configure(snapshot.config.get("plan_weights"), snapshot.config.get("max_queue_wait_seconds", 1800))
+            self.retries.configure(snapshot.config)
+            self.delivery.configure(snapshot.config)
+            self.admission.configure(snapshot.config)
+            if self.retention is not None:
+                self.retention.configure(snapshot.config)
+            if self.log_pipeline is not None:
+                self.log_pipeline.configure(snapshot.config)
+            self.jobs.configure(snapshot.config)
+            self.schedule_maintenance(snapshot.config)
+        self.config_watcher.subscribe(apply_config)
+
+        def alert_admins(domain, details):
+            # "5 consecutive failures -> alert admin and pause groups": the breaker holds back the site's tasks
+            group_list = ", ".join(str(group_id) for group_id in details["groups"]) or "none queued"
+            if details["state"] == OPEN:
+                text = (f"⚠️ {domain} failed {details['failures']} times in a row. "
+                        f"Its tasks are paused for {details['cooldown'] / 60:.0f} min in groups: {group_list}")
+            else:
+                text = f"✅ {domain} is responding again. Resumed its tasks in groups: {group_list}"
+            for admin_id in self.admin_ids:
+                asyncio.create_task(self._notify_admin(application, admin_id, text))
+        self.retries.on_breaker_change(lambda breaker, groups: alert_admins(breaker.domain, {
+            "state": breaker.state, "failures": breaker.consecutive_failures, "cooldown": breaker.cooldown, "groups": groups,
+        }))
+        self.retry_task = asyncio.create_task(self.retries.run(self.config.get("retry_poll_interval", 5)))
+        self.network_task = asyncio.create_task(self.network.run())
+        self.config_watch_task = asyncio.create_task(self.config_watcher.run(self.config.get("config_reload_interval", 2)))
+        self.reference_task = asyncio.create_task(self.reference.run(self.config.get("reference_poll_interval", 2)))
+
+        # Resume tasks a crash left in downloading/uploading; runs alongside the worker and re-queues as it verifies
+        try:
+            drive_lookup = make_drive_lookup(self.config.get("google_drive_folder_id"))
+        except Exception as e:
+            logger.warning(f"Drive lookups disabled for crash recovery: {e}")
+            drive_lookup = None
+        external_workers = self.config.get("external_workers", False)
+        recovery = CrashRecovery(
+            self.db, scheduler=self.scheduler, queue_index=self.queue_index, timeline=self.timeline,
+            drive_lookup=drive_lookup, max_workers=self.config.get("recovery_workers", 8), storage=self.storage,
+            owner="bot" if external_workers else None # Worker processes recover their own tasks
+        )
+        self.recovery_task = asyncio.create_task(recovery.run())
+        self.timeline_flush_task = asyncio.create_task(self.timeline.run_flusher())
+        self.schedule_maintenance(self.config)
+        self.jobs.start()
+
+        # Metrics endpoint (Prometheus text format) on a local port; set metrics_port to 0 to disable
+        metrics_port = self.config.get("metrics_port", 9464)
+        if metrics_port:
+            metrics.REGISTRY.add_collector(lambda: metrics.collect_queue_depth(self.db))
+            self.metrics_server = await metrics.start_metrics_server(self.config.get("metrics_host", "127.0.0.1"), metrics_port)
+            self.loop_lag_task = asyncio.create_task(metrics.monitor_event_loop_lag())
+
+        async def notify_finished(task_id, status):
+            await self.notify_task_finished(application, task_id, status)
+
+        if external_workers:
+            # Tasks run in `python -m worker` processes; their stage transitions come back through task_notices
+            notice_reader = NoticeReader(self.db, timeline=self.timeline, queue_index=self.queue_index, scheduler=self.scheduler)
+            notice_reader.on_finished(notify_finished)
+            notice_reader.on_breaker_change(alert_admins)
+            self.notice_task = asyncio.create_task(notice_reader.run())
+        else:
+            # Start the worker alongside polling (post_init must return before the first getUpdates)
+            self.worker_task = asyncio.create_task(start_worker_process(
+                self.db, self.config, self.domains_config, timeline=self.timeline, queue_index=self.queue_index,
+                scheduler=self.scheduler, storage=self.storage, config_watcher=self.config_watcher, retries=self.retries,
+                network=self.network, on_finished=notify_finished, delivery=self.delivery,
+                uploader=self.uploader, reference=self.reference
+            ))
+
+    def schedule_maintenance(self, config):
+        """Registers the maintenance jobs, or updates their schedules after a config reload. An entry in
+        job_schedules (cron expression) replaces the job's interval key."""
+        self.jobs.add(
+            "archive", self.archiver.archive_once,
+            trigger_from_config(config, "archive", config.get("archive_interval_minutes", 30) * 60, run_at_start=True),
+            jitter=60, max_runtime=1800, heavy=True
+        )
+        # First backup one interval after start, so a crash/restart loop doesn't produce a backup per restart
+        self.jobs.add(
+            "backup", self.backups.backup_once,
+            trigger_from_config(config, "backup", config.get("backup_interval_hours", 8) * 3600),
+            jitter=300, max_runtime=3600, heavy=True # A copy already on its thread still finishes after a timeout
+        )
+        if self.retention is not None:
+            self.jobs.add(
+                "drive_purge", self.retention.purge_once,
+                trigger_from_config(config, "drive_purge", config.get("drive_purge_interval_minutes", 15) * 60, run_at_start=True),
+                jitter=60, max_runtime=1800, heavy=True
+            )
+
+    async def notify_task_finished(self, application: Application, task_id: int, status: str):
+        """Tells the group that a task completed or failed, replying to the original message when known.
+        Tasks delivered as a Telegram document need no notice: the document is the reply."""
+        row = await self.db.fetchone(
+            "SELECT group_id, message_id, original_link, gdrive_link, error_message, telegram_file_id FROM tasks WHERE task_id = ?",
+            (task_id,)
+        )
+        if not row or row[0] is None:
+            return
+        group_id, message_id, original_link, gdrive_link, error_message, telegram_file_id = row
+        if status == 'completed' and telegram_file_id:
             return
+        if status == 'completed':
+            text = f"✅ Task #{task_id} is done: {gdrive_link or original_link}"
+        else:
+            text = f"❌ Task #{task_id} failed: {error_message or 'unknown error'}"
+        try:
+            await application.bot.send_message(chat_id=group_id, text=text, reply_to_message_id=message_id)
+        except Exception as e:
+            logger.error(f"Failed to notify group {group_id} about task {task_id}: {e}")
 
-        self.application = Application.builder().token(token).post_init(self.post_init).build()
-        dispatcher = self.application.dispatcher
+    async def _notify_admin(self, application: Application, admin_id: int, text: str):
+        try:
+            await application.bot.send_message(chat_id=admin_id, text=text)
+        except Exception as e:
+            logger.error(f"Failed to notify admin {admin_id}: {e}")
+
+    def build_application(self, token: str, base_url: str = None) -> Application:
+        """Builds the Telegram Application (base_url points it at another Bot API server, e.g. a local one)."""
+        builder = (
+            Application.builder()
+            .token(token)
+            .request(InstrumentedHTTPXRequest(connection_pool_size=256))
+            .get_updates_request(InstrumentedHTTPXRequest(connection_pool_size=1))
+            .post_init(self.post_init)
+        )
+        if base_url:
+            builder = builder.base_url(base_url)
+        return builder.build()
+
+    def register_handlers(self, application: Application):
+        """Registers every command and message handler on the Application."""
+        dispatcher = application # PTB v20: handlers are added on the Application itself
 
         # --- Register Handlers ---
         # Basic handler for testing
-        dispatcher.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
+        dispatcher.add_handler(MessageHandler((filters.TEXT | filters.CAPTION) & ~filters.COMMAND, self.handle_message))
         dispatcher.add_handler(CommandHandler("start", self.start_command)) # Example start command
 
         # Register other command handlers (uncomment and implement as modules are created)
@@ -110,6 +310,16 @@ class Bot:
         # Register handler for new chat members (bot added to group)
         dispatcher.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, handle_new_chat_members))
 
+    async def start(self):
+        """Starts the Telegram bot."""
+        logger.info("Starting bot...")
+        token = self.config.get("telegram_bot_token")
+        if not token or token == "YOUR_TELEGRAM_BOT_TOKEN":
+            logger.error("Telegram bot token not configured. Please update config/config.json")
+            return
+
+        self.application = self.build_application(token, self.config.get("telegram_api_url")) # None: api.telegram.org
+        self.register_handlers(self.application)
 
         # --- Start the Bot ---
         logger.info("Polling for updates...")
@@ -120,40 +330,72 @@ class Bot:
         await update.message.reply_text("Hello! I am your AssetFetch Pro bot. Send me a link from a supported website.")
 
     async def handle_message(self, update: Update, context):
-        """Handles incoming messages."""
+        """Queues the supported links in a message text or media caption, all in one insert."""
         user_id = update.effective_user.id
         chat_id = update.effective_chat.id
-        text = update.message.text
-
-        logger.info(f"Received message from user {user_id} in chat {chat_id}: {text}")
+        message = update.message
+        text = message.text if message.text is not None else message.caption
+        entities = message.entities if message.text is not None else message.caption_entities
+
+        # Full text only at DEBUG; %-style args are formatted by the log writer thread, not here
+        logger.debug("Received message from user %s in chat %s: %s", user_id, chat_id, text)
+
+        matcher = context.application.user_data['config_watcher'].current.domain_matcher
+        extracted = extract_links(text, entities, matcher)
+        if not extracted.links:
+            if extracted.unsupported:
+                await message.reply_text(f"⚠️ Links from {', '.join(extracted.unsupported)} are not supported.")
+            return # Ignore messages without links
+
+        # Over a queue cap: answer from the in-memory counts, without touching the database
+        admission: AdmissionControl = context.application.user_data['admission']
+        admitted, rejection = admission.check(chat_id, user_id, len(extracted.links))
+        if not admitted:
+            if admission.should_reply(user_id):
+                await message.reply_text(rejection.message())
+            return
+        links = extracted.links[:admitted]
 
-        # Check if the message contains a URL
+        db: Database = context.application.user_data['db']
         try:
-            parsed_url = urlparse(text)
-            is_url = all([parsed_url.scheme, parsed_url.netloc]) # Check if scheme and netloc are present
-        except ValueError:
-            is_url = False
-
-        if is_url:
-            db: Database = context.application.user_data['db']
-            original_link = text.strip() # Use the original text as the link
-
-            try:
-                # Add the task to the database queue
-                await db.execute(
-                    "INSERT INTO tasks (group_id, user_id, original_link, status, priority) VALUES (?, ?, ?, ?, ?)",
-                    (chat_id, user_id, original_link, 'pending', 0) # Default priority to 0
-                )
-                logger.info(f"Added task for group {chat_id}, user {user_id}: {original_link}")
-                await update.message.reply_text("✅ Link received and added to the processing queue.")
-
-            except Exception as e:
-                logger.error(f"Error adding task to queue for group {chat_id}, user {user_id}: {e}")
-                await update.message.reply_text(f"An error occurred while adding your link to the queue: {e}")
+            # Add the tasks to the database queue in one statement
+            rows = await db.execute_returning(
+                "INSERT INTO tasks (group_id, user_id, message_id, original_link, status, priority) VALUES "
+                + ", ".join(["(?, ?, ?, ?, 'pending', 0)"] * len(links)) # Default priority to 0
+                + " RETURNING task_id, original_link",
+                [value for link, _ in links for value in (chat_id, user_id, message.message_id, link)]
+            )
+        except Exception as e:
+            logger.error(f"Error adding tasks to queue for group {chat_id}, user {user_id}: {e}")
+            await message.reply_text(f"An error occurred while adding your link to the queue: {e}")
+            return
 
+        task_ids = {link: task_id for task_id, link in rows}
+        timeline = context.application.user_data['timeline']
+        queue_index: QueueIndex = context.application.user_data['queue_index']
+        scheduler = context.application.user_data['scheduler']
+        for link, domain in links:
+            task_id = task_ids[link]
+            timeline.record(task_id, 'pending', domain=domain)
+            queue_index.add(task_id, 0, domain, group_id=chat_id, user_id=user_id)
+            scheduler.add(task_id, chat_id, 0)
+            logger.info("Added task %s for group %s, user %s: %s", task_id, chat_id, user_id, link)
+
+        # Positions follow the scheduler's fair share across groups and plans, so they are estimates
+        estimates = [queue_estimate(queue_index, scheduler, task_ids[link]) for link, _ in links]
+        eta = format_eta(estimates[-1][1])
+        if len(links) == 1:
+            reply = (f"✅ Request accepted! You are about #{estimates[0][0]} in the queue. "
+                     f"Estimated completion: {eta}.")
         else:
-             # Ignore non-link messages for now, or add other handlers
-             pass # await update.message.reply_text("I only process links from supported websites.")
+            positions = ", ".join(f"#{position}" for position, _ in estimates)
+            reply = (f"✅ {len(links)} links accepted! Estimated queue positions: {positions}. "
+                     f"Estimated completion of the last: {eta}.")
+        if rejection is not None:
+            reply += f"\n{rejection.message()}"
+        if extracted.unsupported:
+            reply += f"\n⚠️ Skipped links from unsupported sites: {', '.join(extracted.unsupported)}."
+        await message.reply_text(reply)
 
 
 if __name__ == "__main__":
@@ -176,13 +418,17 @@ if __name__ == "__main__":
          print("Database not found. Running setup script...")
          import scripts.setup
          scripts.setup.initialize_database()
-         scripts.setup.load_initial_admins()
+         scripts.setup.initialize_database(REFERENCE_DATABASE_PATH, "src/persistence/reference_schema.sql")
+         scripts.setup.load_initial_admins(REFERENCE_DATABASE_PATH)
          scripts.setup.create_initial_config_files() # Ensure configs exist if DB was missing
 
     bot = Bot()
+    bot.log_pipeline = LogPipeline.from_config(bot.config).start() # Structured logs written off the event loop
     try:
         asyncio.run(bot.start())
     except FileNotFoundError as e:
         logger.error(f"Configuration error: {e}")
     except Exception as e:
         logger.error(f"An unexpected error occurred: {e}", exc_info=True)
+    finally:
+        bot.log_pipeline.stop() # Flush queued records
@@ -1,28 +1,112 @@
 import sqlite3
 import os
 import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import NamedTuple
+
+from services.metrics import DB_LOCK_WAIT, DB_LOCK_HOLD, DB_STATEMENT_LATENCY
 
 DATABASE_PATH = "data/bot.db"
+REFERENCE_DATABASE_PATH = "data/reference.db"
 SCHEMA_PATH = "src/persistence/schema.sql"
+REFERENCE_SCHEMA = "reference_schema.sql" # Next to SCHEMA_PATH
+# Tables that moved from bot.db to reference.db; initialize() of the reference database adopts them
+REFERENCE_TABLES = ("admins", "groups", "subscriptions", "blocked_domains")
+
+
+class StoragePolicy(NamedTuple):
+    """Journaling and checkpointing for one database file. journal_mode is set on the file by the first
+    connection; synchronous and wal_autocheckpoint (pages, None: SQLite's 1000) are set on every connection."""
+    journal_mode: str
+    synchronous: str
+    wal_autocheckpoint: int = None
+    incremental_vacuum: bool = False # auto_vacuum = INCREMENTAL, so deletes can hand pages back in steps
+
+
+# The queue takes a stream of small writes from the bot and the worker processes: WAL, so they can read while
+# one writes, and NORMAL sync (durable across crashes, the last commits may be lost on power failure)
+QUEUE_POLICY = StoragePolicy("WAL", "NORMAL", 1000, incremental_vacuum=True)
+# Admins, groups and plans change a few times a day: rollback journal and a full sync on every commit
+REFERENCE_POLICY = StoragePolicy("DELETE", "FULL")
+# Finished tasks arrive in large batches every archive interval; no WAL, so a batch isn't written twice
+ARCHIVE_POLICY = StoragePolicy("DELETE", "NORMAL")
+
+# Columns added to existing tables after their first release.
+# CREATE TABLE IF NOT EXISTS won't add them to an old database, so initialize() does.
+MIGRATION_COLUMNS = {
+    "tasks": [("error_message", "TEXT"), ("completed_at", "DATETIME"), ("expected_size", "INTEGER"), ("checksum", "TEXT"), ("next_attempt_at", "DATETIME"),
+              ("claimed_by", "TEXT"), ("telegram_file_id", "TEXT"), ("drive_name", "TEXT")],
+}
 
 class Database:
-    def __init__(self, db_path=DATABASE_PATH):
+    """
+    One SQLite file with its own lock and StoragePolicy. The hot queue (tasks and the tables around it),
+    the reference data (REFERENCE_TABLES) and the archive are separate files, so an admin command or
+    an archive batch never waits on queue writes, and each file is journaled for how it is written.
+    """
+
+    def __init__(self, db_path=DATABASE_PATH, policy: StoragePolicy = QUEUE_POLICY, schema: str = None):
         self.db_path = db_path
+        self.policy = policy
+        self.schema = schema # File name next to SCHEMA_PATH; None: SCHEMA_PATH itself
         self._lock = asyncio.Lock()
+        self._journal_set = False
 
     async def connect(self):
-        """Connects to the database."""
-        return sqlite3.connect(self.db_path)
+        """Connects to the database and applies the policy's per-connection settings."""
+        conn = sqlite3.connect(self.db_path)
+        if not self._journal_set:
+            conn.execute(f"PRAGMA journal_mode = {self.policy.journal_mode}")
+            self._journal_set = True
+        conn.execute(f"PRAGMA synchronous = {self.policy.synchronous}")
+        if self.policy.wal_autocheckpoint is not None:
+            conn.execute(f"PRAGMA wal_autocheckpoint = {int(self.policy.wal_autocheckpoint)}")
+        return conn
+
+    def schema_path(self) -> str:
+        return SCHEMA_PATH if self.schema is None else os.path.join(os.path.dirname(SCHEMA_PATH), self.schema)
+
+    @asynccontextmanager
+    async def _locked(self, op):
+        """Acquires self._lock, recording how long we waited for it and how long it was held."""
+        wait_start = time.perf_counter()
+        async with self._lock:
+            acquired_at = time.perf_counter()
+            DB_LOCK_WAIT.observe(acquired_at - wait_start, op=op)
+            try:
+                yield
+            finally:
+                DB_LOCK_HOLD.observe(time.perf_counter() - acquired_at, op=op)
 
     async def initialize(self):
         """Initializes the database schema."""
-        async with self._lock:
+        async with self._locked("initialize"):
             conn = await self.connect()
             try:
-                with open(SCHEMA_PATH, 'r') as f:
+                with open(self.schema_path(), 'r') as f:
                     schema_sql = f.read()
+                had_counters = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'queue_counters'").fetchone()
+                # Add new columns to existing tables first, so indexes in the schema can use them
+                for table, columns in MIGRATION_COLUMNS.items():
+                    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                    for column, column_type in columns:
+                        if existing and column not in existing:
+                            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
                 conn.executescript(schema_sql)
+                has_counters = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'queue_counters'").fetchone()
+                if has_counters and not had_counters:
+                    # Triggers keep queue_counters current from now on; seed it once from existing tasks
+                    conn.execute(
+                        "INSERT INTO queue_counters (group_id, status, task_count) "
+                        "SELECT COALESCE(group_id, 0), COALESCE(status, ''), COUNT(*) FROM tasks GROUP BY 1, 2"
+                    )
                 conn.commit()
+                if self.policy.incremental_vacuum and conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                    # INCREMENTAL lets the archiver hand freed pages back to the OS in small steps.
+                    # Switching an existing database needs one full VACUUM (a one-off cost at startup).
+                    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                    conn.execute("VACUUM")
                 print("Database schema initialized.")
             except sqlite3.Error as e:
                 print(f"Database initialization error: {e}")
@@ -31,12 +115,13 @@ class Database:
 
     async def execute(self, query, params=()):
         """Executes a single query with optional parameters."""
-        async with self._lock:
+        async with self._locked("execute"):
             conn = await self.connect()
             cursor = conn.cursor()
             try:
-                cursor.execute(query, params)
-                conn.commit()
+                with DB_STATEMENT_LATENCY.time(op="execute"):
+                    cursor.execute(query, params)
+                    conn.commit()
                 return cursor
             except sqlite3.Error as e:
                 print(f"Database execution error: {e}\nQuery: {query}\nParams: {params}")
@@ -47,12 +132,13 @@ class Database:
 
     async def fetchone(self, query, params=()):
         """Fetches one row from a query."""
-        async with self._lock:
+        async with self._locked("fetchone"):
             conn = await self.connect()
             cursor = conn.cursor()
             try:
-                cursor.execute(query, params)
-                return cursor.fetchone()
+                with DB_STATEMENT_LATENCY.time(op="fetchone"):
+                    cursor.execute(query, params)
+                    return cursor.fetchone()
             except sqlite3.Error as e:
                 print(f"Database fetchone error: {e}\nQuery: {query}\nParams: {params}")
                 raise
@@ -61,26 +147,46 @@ class Database:
 
     async def fetchall(self, query, params=()):
         """Fetches all rows from a query."""
-        async with self._lock:
+        async with self._locked("fetchall"):
             conn = await self.connect()
             cursor = conn.cursor()
             try:
-                cursor.execute(query, params)
-                return cursor.fetchall()
+                with DB_STATEMENT_LATENCY.time(op="fetchall"):
+                    cursor.execute(query, params)
+                    return cursor.fetchall()
             except sqlite3.Error as e:
                 print(f"Database fetchall error: {e}\nQuery: {query}\nParams: {params}")
                 raise
             finally:
                 conn.close()
 
+    async def execute_returning(self, query, params=()):
+        """Executes a data-modifying statement with a RETURNING clause, commits, and returns its rows."""
+        async with self._locked("execute_returning"):
+            conn = await self.connect()
+            cursor = conn.cursor()
+            try:
+                with DB_STATEMENT_LATENCY.time(op="execute_returning"):
+                    cursor.execute(query, params)
+                    rows = cursor.fetchall()
+                    conn.commit()
+                return rows
+            except sqlite3.Error as e:
+                print(f"Database execution error: {e}\nQuery: {query}\nParams: {params}")
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+
     async def executemany(self, query, params_list):
         """Executes a query against all parameter sequences or mappings in the sequence params_list."""
-        async with self._lock:
+        async with self._locked("executemany"):
             conn = await self.connect()
             cursor = conn.cursor()
             try:
-                cursor.executemany(query, params_list)
-                conn.commit()
+                with DB_STATEMENT_LATENCY.time(op="executemany"):
+                    cursor.executemany(query, params_list)
+                    conn.commit()
                 return cursor
             except sqlite3.Error as e:
                 print(f"Database executemany error: {e}\nQuery: {query}\nParams: {params_list}")
@@ -89,9 +195,84 @@ class Database:
             finally:
                 conn.close()
 
+    async def transaction(self, statements):
+        """Runs (query, params_list) pairs with executemany in one transaction: all of them commit or none do."""
+        async with self._locked("transaction"):
+            conn = await self.connect()
+            try:
+                with DB_STATEMENT_LATENCY.time(op="transaction"):
+                    for query, params_list in statements:
+                        conn.executemany(query, params_list)
+                    conn.commit()
+            except sqlite3.Error as e:
+                print(f"Database transaction error: {e}")
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+
+    async def executescript(self, script):
+        """Executes a multi-statement SQL script (e.g. CREATE TABLE ... IF NOT EXISTS DDL)."""
+        async with self._locked("executescript"):
+            conn = await self.connect()
+            try:
+                with DB_STATEMENT_LATENCY.time(op="executescript"):
+                    conn.executescript(script)
+                    conn.commit()
+            except sqlite3.Error as e:
+                print(f"Database executescript error: {e}")
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+
+    async def checkpoint(self, mode: str = "PASSIVE"):
+        """Copies the WAL back into the database file (TRUNCATE also empties the -wal file). Returns
+        (busy, WAL pages, pages checkpointed); a no-op for files not in WAL mode."""
+        async with self._locked("checkpoint"):
+            conn = await self.connect()
+            try:
+                return conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+            finally:
+                conn.close()
+
+    async def adopt_tables(self, source_path, tables=REFERENCE_TABLES) -> list:
+        """
+        Moves tables that used to live in another database file into this one (run after initialize(),
+        so the tables exist here). Rows are copied only into a table that is still empty, and the source
+        table is dropped once the copy is committed, so an interrupted move just finishes on the next start.
+        Returns the tables that were moved.
+        """
+        if not os.path.exists(source_path) or os.path.abspath(source_path) == os.path.abspath(self.db_path):
+            return []
+        async with self._locked("adopt_tables"):
+            conn = await self.connect()
+            try:
+                conn.execute("ATTACH DATABASE ? AS source", (source_path,))
+                present = {row[0] for row in conn.execute("SELECT name FROM source.sqlite_master WHERE type = 'table'")}
+                moved = [table for table in tables if table in present]
+                for table in moved:
+                    source_columns = {row[1] for row in conn.execute(f"PRAGMA source.table_info({table})")}
+                    columns = ", ".join(row[1] for row in conn.execute(f"PRAGMA main.table_info({table})") if row[1] in source_columns)
+                    if not conn.execute(f"SELECT 1 FROM main.{table} LIMIT 1").fetchone():
+                        conn.execute(f"INSERT INTO main.{table} ({columns}) SELECT {columns} FROM source.{table}")
+                conn.commit()
+                for table in moved:
+                    conn.execute(f"DROP TABLE source.{table}")
+                conn.commit()
+                if moved:
+                    print(f"Moved {', '.join(moved)} from {source_path} to {self.db_path}.")
+                return moved
+            except sqlite3.Error as e:
+                print(f"Database adopt_tables error: {e}")
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+
 # Example Usage (for testing)
 async def main():
-    db = Database()
+    db = Database(REFERENCE_DATABASE_PATH, REFERENCE_POLICY, REFERENCE_SCHEMA)
     await db.initialize()
 
     # Example: Insert an admin
@@ -0,0 +1,59 @@
+-- Reference data for AssetFetch Pro (data/reference.db): who administers the bot, which groups it
+-- serves and on which plan. Written by admin commands, read through services.reference_data.ReferenceData.
+
+-- Table: admins
+-- Stores authorized admin Telegram user IDs.
+CREATE TABLE IF NOT EXISTS admins (
+    user_id INTEGER PRIMARY KEY
+);
+
+-- Table: groups
+-- Stores approved group IDs and their status.
+CREATE TABLE IF NOT EXISTS groups (
+    group_id INTEGER PRIMARY KEY,
+    is_approved BOOLEAN DEFAULT 0,
+    is_active BOOLEAN DEFAULT 0, -- Bot status in the group (/bot-start, /stop-bot)
+    is_paused BOOLEAN DEFAULT 0, -- Paused state (/unactivate, /activate)
+    subscription_plan TEXT DEFAULT 'default',
+    blocked_websites TEXT, -- JSON list of blocked domains for this group
+    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Table: blocked_domains
+-- Stores group-specific blocked domains.
+CREATE TABLE IF NOT EXISTS blocked_domains (
+    group_id INTEGER,
+    domain TEXT,
+    PRIMARY KEY (group_id, domain),
+    FOREIGN KEY (group_id) REFERENCES groups(group_id) ON DELETE CASCADE
+);
+
+-- Table: subscriptions
+-- Stores active subscription plan per group.
+CREATE TABLE IF NOT EXISTS subscriptions (
+    group_id INTEGER PRIMARY KEY,
+    plan TEXT,
+    activated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (group_id) REFERENCES groups(group_id) ON DELETE CASCADE
+);
+
+-- Table: reference_revision
+-- Bumped by a trigger on every change to groups or blocked_domains. Processes holding the in-memory
+-- copy poll this one row and reload only when it has moved.
+CREATE TABLE IF NOT EXISTS reference_revision (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    revision INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO reference_revision (id, revision) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS trg_groups_revision_insert AFTER INSERT ON groups
+BEGIN UPDATE reference_revision SET revision = revision + 1; END;
+CREATE TRIGGER IF NOT EXISTS trg_groups_revision_update AFTER UPDATE ON groups
+BEGIN UPDATE reference_revision SET revision = revision + 1; END;
+CREATE TRIGGER IF NOT EXISTS trg_groups_revision_delete AFTER DELETE ON groups
+BEGIN UPDATE reference_revision SET revision = revision + 1; END;
+CREATE TRIGGER IF NOT EXISTS trg_blocked_domains_revision_insert AFTER INSERT ON blocked_domains
+BEGIN UPDATE reference_revision SET revision = revision + 1; END;
+CREATE TRIGGER IF NOT EXISTS trg_blocked_domains_revision_delete AFTER DELETE ON blocked_domains
+BEGIN UPDATE reference_revision SET revision = revision + 1; END;
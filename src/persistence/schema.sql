@@ -1,22 +1,6 @@
--- Database Schema for AssetFetch Pro Telegram Bot
-
--- Table: admins
--- Stores authorized admin Telegram user IDs.
-CREATE TABLE IF NOT EXISTS admins (
-    user_id INTEGER PRIMARY KEY
-);
-
--- Table: groups
--- Stores approved group IDs and their status.
-CREATE TABLE IF NOT EXISTS groups (
-    group_id INTEGER PRIMARY KEY,
-    is_approved BOOLEAN DEFAULT 0,
-    is_active BOOLEAN DEFAULT 0, -- Bot status in the group (/bot-start, /stop-bot)
-    is_paused BOOLEAN DEFAULT 0, -- Paused state (/unactivate, /activate)
-    subscription_plan TEXT DEFAULT 'default',
-    blocked_websites TEXT, -- JSON list of blocked domains for this group
-    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+-- Database Schema for AssetFetch Pro Telegram Bot: the hot queue database (data/bot.db).
+-- Admins, groups, subscriptions and blocked domains live in reference_schema.sql (data/reference.db);
+-- group_id columns here refer to those groups, but SQLite can't enforce a key across files.
 
 -- Table: users
 -- Tracks user request history for rate-limiting.
@@ -42,19 +26,66 @@ CREATE TABLE IF NOT EXISTS tasks (
     error_count INTEGER DEFAULT 0,
     local_filepath TEXT,
     gdrive_link TEXT,
-    FOREIGN KEY (group_id) REFERENCES groups(group_id),
+    error_message TEXT, -- Last failure reason reported by the worker
+    completed_at DATETIME,
+    expected_size INTEGER, -- Bytes announced by the site (Content-Length) when the download started
+    checksum TEXT, -- SHA-256 of the finished download, checked by crash recovery
+    next_attempt_at DATETIME, -- When a 'retrying' task goes back to 'pending' (backoff or open circuit breaker)
+    claimed_by TEXT, -- Worker that claimed the task: 'bot' (in-process) or a python -m worker id such as 'w0'
+    telegram_file_id TEXT, -- Set when the file was sent straight to the group as a document (direct delivery)
+    drive_name TEXT, -- Name the file is being (or was) uploaded under in the Drive folder, for crash recovery
     FOREIGN KEY (user_id) REFERENCES users(user_id)
 );
 
--- Table: blocked_domains
--- Stores group-specific blocked domains.
-CREATE TABLE IF NOT EXISTS blocked_domains (
-    group_id INTEGER,
-    domain TEXT,
-    PRIMARY KEY (group_id, domain),
-    FOREIGN KEY (group_id) REFERENCES groups(group_id) ON DELETE CASCADE
+-- Table: telegram_files
+-- file_id of every asset sent to a group as a document, by original link, so a repeat request is
+-- re-sent by reference instead of being downloaded and uploaded again.
+CREATE TABLE IF NOT EXISTS telegram_files (
+    original_link TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    file_unique_id TEXT,
+    file_size INTEGER,
+    checksum TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    last_sent_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Table: drive_files
+-- Content-addressed index of the files in the Drive folder: SHA-256 of the download -> Drive file.
+-- A download whose checksum is here is not uploaded again, and new names are checked against it
+-- (file_2.zip) instead of listing the folder.
+CREATE TABLE IF NOT EXISTS drive_files (
+    checksum TEXT PRIMARY KEY,
+    drive_file_id TEXT NOT NULL,
+    drive_link TEXT,
+    name TEXT NOT NULL,
+    size INTEGER,
+    credentials TEXT, -- Credential file the file was uploaded with (config/credentials/<name>)
+    uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_drive_files_name ON drive_files (name);
+
+-- Table: uploads
+-- Ledger of files in the Drive folder, purged retention hours after upload (the local copies stay).
+-- purge_state is 'deleting' while a purge has the row claimed; rows are removed once Drive confirms
+-- the delete, so a purge interrupted by a crash picks up the claimed rows again.
+CREATE TABLE IF NOT EXISTS uploads (
+    upload_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    drive_file_id TEXT NOT NULL UNIQUE,
+    credentials TEXT NOT NULL, -- Credential file that owns the file
+    checksum TEXT,
+    task_id INTEGER,
+    size INTEGER,
+    uploaded_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, -- Reset when the file is reused by deduplication
+    purge_state TEXT, -- NULL, or 'deleting' while claimed by a purge
+    purge_attempts INTEGER NOT NULL DEFAULT 0,
+    purge_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_uploads_uploaded_at ON uploads (uploaded_at);
+-- Files indexed before the ledger existed
+INSERT OR IGNORE INTO uploads (drive_file_id, credentials, checksum, size, uploaded_at)
+SELECT drive_file_id, COALESCE(credentials, ''), checksum, size, uploaded_at FROM drive_files;
+
 -- Table: user_requests
 -- Tracks user request counts for subscription limits (e.g., 1/24h).
 CREATE TABLE IF NOT EXISTS user_requests (
@@ -63,16 +94,99 @@ CREATE TABLE IF NOT EXISTS user_requests (
     last_request TIMESTAMP,
     request_count INTEGER DEFAULT 0,
     PRIMARY KEY (user_id, group_id),
-    FOREIGN KEY (user_id) REFERENCES users(user_id),
-    FOREIGN KEY (group_id) REFERENCES groups(group_id) ON DELETE CASCADE
+    FOREIGN KEY (user_id) REFERENCES users(user_id)
 );
 
--- Table: subscriptions
--- Stores active subscription plan per group.
-CREATE TABLE IF NOT EXISTS subscriptions (
-    group_id INTEGER PRIMARY KEY,
+-- Table: task_events
+-- Append-only stage transitions per task (pending -> downloading -> ... -> completed/failed).
+-- mono_ns is time.monotonic_ns() for precise in-process durations; wall_ts is the Unix time for correlation.
+CREATE TABLE IF NOT EXISTS task_events (
+    task_id INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    mono_ns INTEGER NOT NULL,
+    wall_ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_task_events_task ON task_events (task_id);
+
+-- Indexes for the admin queue browser (keyset pagination by task_id within a group, optionally by status)
+CREATE INDEX IF NOT EXISTS idx_tasks_group_task ON tasks (group_id, task_id);
+CREATE INDEX IF NOT EXISTS idx_tasks_group_status_task ON tasks (group_id, status, task_id);
+-- Oldest-first scans by status (archiver picks finished tasks to move to data/archive.db,
+-- crash recovery finds tasks left in downloading/uploading)
+CREATE INDEX IF NOT EXISTS idx_tasks_status_task ON tasks (status, task_id);
+-- Due retries (the retry scheduler's range scan); partial, so it only holds tasks waiting to retry
+CREATE INDEX IF NOT EXISTS idx_tasks_retry_due ON tasks (next_attempt_at) WHERE status = 'retrying';
+
+-- Table: queue_counters
+-- Number of tasks per (group, status), kept up to date by the triggers below so status
+-- summaries never need COUNT(*) over tasks. NULL group/status are stored as 0 / ''.
+CREATE TABLE IF NOT EXISTS queue_counters (
+    group_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    task_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (group_id, status)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_counters_insert AFTER INSERT ON tasks
+BEGIN
+    INSERT INTO queue_counters (group_id, status, task_count)
+    VALUES (COALESCE(NEW.group_id, 0), COALESCE(NEW.status, ''), 1)
+    ON CONFLICT (group_id, status) DO UPDATE SET task_count = task_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_counters_update AFTER UPDATE OF status, group_id ON tasks
+WHEN OLD.status IS NOT NEW.status OR OLD.group_id IS NOT NEW.group_id
+BEGIN
+    UPDATE queue_counters SET task_count = task_count - 1
+    WHERE group_id = COALESCE(OLD.group_id, 0) AND status = COALESCE(OLD.status, '');
+    INSERT INTO queue_counters (group_id, status, task_count)
+    VALUES (COALESCE(NEW.group_id, 0), COALESCE(NEW.status, ''), 1)
+    ON CONFLICT (group_id, status) DO UPDATE SET task_count = task_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tasks_counters_delete AFTER DELETE ON tasks
+BEGIN
+    UPDATE queue_counters SET task_count = task_count - 1
+    WHERE group_id = COALESCE(OLD.group_id, 0) AND status = COALESCE(OLD.status, '');
+END;
+
+-- Table: queue_feed
+-- Append-only log of tasks entering 'pending' (new or requeued), written by the triggers below. (Plan
+-- change rows came from a trigger on groups before it moved to reference.db; plan changes now reach
+-- workers through ReferenceData.) Standalone worker processes (python -m worker) tail it by feed_id to keep their
+-- in-memory schedulers in sync with the listener; old rows are pruned by the listener.
+CREATE TABLE IF NOT EXISTS queue_feed (
+    feed_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id INTEGER, -- NULL for plan changes
+    group_id INTEGER,
+    priority INTEGER,
+    plan TEXT, -- New subscription plan, for plan changes
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_queue_feed_insert AFTER INSERT ON tasks
+WHEN NEW.status = 'pending'
+BEGIN
+    INSERT INTO queue_feed (task_id, group_id, priority) VALUES (NEW.task_id, NEW.group_id, NEW.priority);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_queue_feed_requeue AFTER UPDATE OF status ON tasks
+WHEN NEW.status = 'pending' AND OLD.status IS NOT 'pending'
+BEGIN
+    INSERT INTO queue_feed (task_id, group_id, priority) VALUES (NEW.task_id, NEW.group_id, NEW.priority);
+END;
+
+-- Table: task_notices
+-- Stage transitions and circuit-breaker changes reported by worker processes, consumed (and deleted)
+-- by the listener, which applies them to its timeline and queue index and notifies users and admins.
+CREATE TABLE IF NOT EXISTS task_notices (
+    notice_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id INTEGER,
+    kind TEXT NOT NULL, -- 'stage' or 'breaker'
+    stage TEXT,
+    domain TEXT,
     plan TEXT,
-    activated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (group_id) REFERENCES groups(group_id) ON DELETE CASCADE
+    payload TEXT, -- JSON details for 'breaker' notices
+    wall_ts REAL NOT NULL,
+    worker_id TEXT
 );
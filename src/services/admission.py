@@ -0,0 +1,103 @@
+import logging
+import time
+from typing import NamedTuple
+
+from services import metrics
+from services.queue_index import QueueIndex, format_eta
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PENDING = 5000
+DEFAULT_MAX_PENDING_PER_USER = 5
+# Pending links a group may have queued, by subscription plan (config key "group_queue_quotas" overrides these)
+DEFAULT_GROUP_QUOTAS = {'default': 100, '12h': 200, 'free': 30, 'file': 300, '1sub': 200}
+REPLY_COOLDOWN = 30 # Seconds between two rejection replies to the same user
+
+
+class Rejection(NamedTuple):
+    reason: str # "queue", "group" or "user"
+    limit: int
+    retry_after: float # Estimated seconds until a slot frees up
+
+    def message(self) -> str:
+        eta = format_eta(self.retry_after)
+        if self.reason == "user":
+            return (f"⏳ You already have {self.limit} links waiting in the queue. "
+                    f"Your next one should start in {eta}; please send more after that.")
+        if self.reason == "group":
+            return (f"⏳ This group's queue is full ({self.limit} links waiting). "
+                    f"A slot should free up in {eta}; please try again then.")
+        return f"⏳ The bot is at capacity ({self.limit} links queued). Please try again in {eta}."
+
+
+class AdmissionControl:
+    """
+    Decides whether a new link may be queued, before anything is written to the database.
+
+    Three caps apply to pending tasks: max_pending_tasks overall, the group's plan quota from
+    group_queue_quotas, and max_pending_per_user. The counts come from the QueueIndex, which every
+    enqueue, claim, requeue and queue reset already keeps in sync, so a check is a few dict lookups
+    and no SQL. A rejection carries the estimated wait until the limiting queue has room again.
+    Rejection replies to a user are sent at most once per REPLY_COOLDOWN; further links are dropped quietly.
+    """
+
+    def __init__(self, queue_index: QueueIndex, scheduler=None, max_pending: int = DEFAULT_MAX_PENDING,
+                 max_per_user: int = DEFAULT_MAX_PENDING_PER_USER, group_quotas: dict = None):
+        self.queue_index = queue_index
+        self.scheduler = scheduler # Source of each group's plan; without it every group gets the default quota
+        self.max_pending = max_pending
+        self.max_per_user = max_per_user
+        self.group_quotas = dict(DEFAULT_GROUP_QUOTAS, **(group_quotas or {}))
+        self._replied = {} # user_id -> monotonic time of the last rejection reply
+
+    @classmethod
+    def from_config(cls, queue_index: QueueIndex, config, scheduler=None) -> "AdmissionControl":
+        admission = cls(queue_index, scheduler)
+        admission.configure(config)
+        return admission
+
+    def configure(self, config) -> None:
+        """Applies max_pending_tasks, max_pending_per_user and group_queue_quotas from a reloaded config."""
+        self.max_pending = int(config.get("max_pending_tasks", DEFAULT_MAX_PENDING))
+        self.max_per_user = int(config.get("max_pending_per_user", DEFAULT_MAX_PENDING_PER_USER))
+        self.group_quotas = dict(DEFAULT_GROUP_QUOTAS, **config.get("group_queue_quotas", {}))
+
+    def group_quota(self, group_id: int) -> int:
+        plan = self.scheduler.group_plan(group_id) if self.scheduler is not None else 'default'
+        return int(self.group_quotas.get(plan, self.group_quotas['default']))
+
+    def check(self, group_id: int, user_id: int, count: int = 1):
+        """
+        How many of count new links (from one message) may be queued: returns (admitted, rejection).
+        rejection is None when all are admitted, else the Rejection for the cap that stopped the rest,
+        checked in the order user, group, then overall.
+        """
+        index = self.queue_index
+        caps = (
+            ("user", self.max_per_user, index.user_count(user_id)),
+            ("group", self.group_quota(group_id), index.group_count(group_id)),
+            ("queue", self.max_pending, len(index)),
+        )
+        reason, limit, pending = min(caps, key=lambda cap: cap[1] - cap[2]) # min() keeps the first of equal rooms
+        admitted = max(0, min(count, limit - pending))
+        if admitted == count:
+            return count, None
+        if reason == "user":
+            wait = index.next_dispatch_seconds(user_id=user_id)
+        elif reason == "group":
+            wait = index.next_dispatch_seconds(group_id=group_id)
+        else:
+            wait = index.next_dispatch_seconds()
+        metrics.ADMISSION_REJECTED.inc(count - admitted, reason=reason)
+        logger.debug("Rejected %s links from user %s in group %s: %s cap of %s", count - admitted, user_id, group_id, reason, limit)
+        return admitted, Rejection(reason, limit, wait)
+
+    def should_reply(self, user_id: int) -> bool:
+        """True (and starts the cooldown) if the user hasn't been sent a rejection in the last REPLY_COOLDOWN seconds."""
+        now = time.monotonic()
+        if now - self._replied.get(user_id, float("-inf")) < REPLY_COOLDOWN:
+            return False
+        if len(self._replied) > 10000: # Forget expired cooldowns now and then
+            self._replied = {uid: at for uid, at in self._replied.items() if now - at < REPLY_COOLDOWN}
+        self._replied[user_id] = now
+        return True
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import time
+
+from persistence.db import Database
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DATABASE_PATH = "data/archive.db"
+
+# Columns tasks_archive is created with. Columns added to tasks since are added to the archive by
+# TaskArchiver.initialize, which copies whatever the live tasks table has.
+TASK_COLUMNS = (
+    "task_id", "user_id", "group_id", "message_id", "original_link", "edited_link", "status", "priority",
+    "created_at", "updated_at", "error_count", "local_filepath", "gdrive_link", "error_message", "completed_at",
+)
+FINISHED_STATUSES = ('completed', 'complete', 'failed', 'error')
+
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks_archive (
+    task_id INTEGER PRIMARY KEY,
+    user_id INTEGER,
+    group_id INTEGER,
+    message_id INTEGER,
+    original_link TEXT,
+    edited_link TEXT,
+    status TEXT,
+    priority INTEGER,
+    created_at DATETIME,
+    updated_at DATETIME,
+    error_count INTEGER,
+    local_filepath TEXT,
+    gdrive_link TEXT,
+    error_message TEXT,
+    completed_at DATETIME,
+    archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_archive_created ON tasks_archive (created_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_archive_group ON tasks_archive (group_id, created_at);
+
+CREATE TABLE IF NOT EXISTS task_events_archive (
+    task_id INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    mono_ns INTEGER NOT NULL,
+    wall_ts REAL NOT NULL,
+    PRIMARY KEY (task_id, stage, mono_ns)
+) WITHOUT ROWID;
+"""
+
+
+class TaskArchiver:
+    """
+    Moves finished tasks (and their task_events) older than a threshold from the hot database into
+    data/archive.db in small batches, then returns freed pages with PRAGMA incremental_vacuum.
+
+    Each batch is copied with INSERT OR IGNORE before it is deleted from the hot tables, so a crash
+    between the two steps only causes the batch to be copied again on the next run.
+    """
+
+    def __init__(self, db: Database, archive_db: Database, archive_after_hours: float = 48,
+                 batch_size: int = 500, vacuum_pages: int = 500):
+        self.db = db
+        self.archive_db = archive_db
+        self.archive_after_hours = archive_after_hours
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.total_archived = 0
+        self.columns = TASK_COLUMNS # Columns copied per task; the live tasks schema once initialized
+
+    async def initialize(self) -> None:
+        """Creates the archive tables if needed and adds any tasks column the archive doesn't have yet."""
+        await self.archive_db.executescript(ARCHIVE_SCHEMA)
+        live = await self.db.fetchall("PRAGMA table_info(tasks)")
+        archived = {row[1] for row in await self.archive_db.fetchall("PRAGMA table_info(tasks_archive)")}
+        for _, name, column_type, *_ in live:
+            if name not in archived:
+                await self.archive_db.execute(f"ALTER TABLE tasks_archive ADD COLUMN {name} {column_type}")
+                logger.info(f"Added column {name} to tasks_archive.")
+        if live:
+            self.columns = tuple(row[1] for row in live)
+
+    async def archive_batch(self) -> int:
+        """Archives up to batch_size finished tasks; returns how many were moved."""
+        placeholders = ", ".join("?" * len(FINISHED_STATUSES))
+        rows = await self.db.fetchall(
+            f"SELECT {', '.join(self.columns)} FROM tasks "
+            f"WHERE status IN ({placeholders}) "
+            f"AND COALESCE(completed_at, updated_at, created_at) < datetime('now', ?) "
+            f"ORDER BY task_id LIMIT ?",
+            (*FINISHED_STATUSES, f"-{self.archive_after_hours} hours", self.batch_size)
+        )
+        if not rows:
+            return 0
+
+        id_index = self.columns.index("task_id")
+        task_ids = [row[id_index] for row in rows]
+        id_placeholders = ", ".join("?" * len(task_ids))
+        events = await self.db.fetchall(
+            f"SELECT task_id, stage, mono_ns, wall_ts FROM task_events WHERE task_id IN ({id_placeholders})",
+            task_ids
+        )
+
+        await self.archive_db.executemany(
+            f"INSERT OR IGNORE INTO tasks_archive ({', '.join(self.columns)}) VALUES ({', '.join('?' * len(self.columns))})",
+            rows
+        )
+        if events:
+            await self.archive_db.executemany(
+                "INSERT OR IGNORE INTO task_events_archive (task_id, stage, mono_ns, wall_ts) VALUES (?, ?, ?, ?)",
+                events
+            )
+
+        await self.db.execute(f"DELETE FROM task_events WHERE task_id IN ({id_placeholders})", task_ids)
+        await self.db.execute(f"DELETE FROM tasks WHERE task_id IN ({id_placeholders})", task_ids)
+        return len(task_ids)
+
+    async def archive_once(self) -> int:
+        """Archives every eligible task batch by batch, vacuuming and yielding between batches."""
+        started = time.monotonic()
+        # Worker processes only need the last few seconds of queue_feed; an hour is a generous margin
+        await self.db.execute("DELETE FROM queue_feed WHERE created_at < datetime('now', '-1 hours')")
+        moved = 0
+        while True:
+            batch = await self.archive_batch()
+            moved += batch
+            if batch:
+                # Return freed pages to the filesystem a little at a time (auto_vacuum = INCREMENTAL).
+                # executescript steps the pragma to completion; execute() would free a single page.
+                await self.db.executescript(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)});")
+            if batch < self.batch_size:
+                break
+            await asyncio.sleep(0) # Let handlers and the worker get the DB lock between batches
+
+        if moved:
+            # Shrink the WAL back to zero: the deletes above would otherwise leave it at its high-water mark
+            await self.db.checkpoint("TRUNCATE")
+            self.total_archived += moved
+            logger.info(f"Archived {moved} finished tasks in {time.monotonic() - started:.2f}s.")
+        return moved
+
+    async def stats(self, days: int = 7) -> dict:
+        """Task counts per status over the last days, combining the hot and archive databases."""
+        since = f"-{int(days)} days"
+        counts = {}
+        for database, table in ((self.db, "tasks"), (self.archive_db, "tasks_archive")):
+            rows = await database.fetchall(
+                f"SELECT status, COUNT(*) FROM {table} WHERE created_at >= datetime('now', ?) GROUP BY status",
+                (since,)
+            )
+            for status, count in rows:
+                counts[status] = counts.get(status, 0) + count
+        return counts
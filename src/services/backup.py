@@ -0,0 +1,141 @@
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIRECTORY = "data/backups"
+MAX_PAGES_PER_STEP = 4096 # Largest step a retry grows to: 16 MiB at 4 KiB pages, still a few ms of lock
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+class BackupScheduler:
+    """
+    In-process online backups of the SQLite databases plus the JSON config files.
+
+    Each database is copied with sqlite3.Connection.backup in steps of pages_per_step pages on a
+    worker thread, sleeping step_pause seconds between steps. A step only holds a shared lock for the
+    time it takes to copy those pages (about a millisecond per MiB), so bot writers, which wait on the
+    lock via the connection timeout, are never stalled for long. A copy that sustained writes restart
+    more than max_restarts times is abandoned and retried after a pause that doubles per attempt, with
+    steps twice as large (up to MAX_PAGES_PER_STEP), so it finishes sooner without ever taking the lock
+    for the whole copy; after max_attempts the backup fails and the next run tries again. Snapshots are
+    gzip-compressed into data/backups/<timestamp>/ and snapshots older than keep_hours are removed.
+    """
+
+    def __init__(self, databases: dict, files=(), backup_dir: str = BACKUP_DIRECTORY,
+                 pages_per_step: int = 256, step_pause: float = 0.005, keep_hours: float = 48,
+                 max_restarts: int = 20, max_attempts: int = 5, retry_pause: float = 1.0):
+        self.databases = dict(databases) # name -> path
+        self.files = list(files)
+        self.backup_dir = backup_dir
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        self.keep_hours = keep_hours
+        self.max_restarts = max_restarts
+        self.max_attempts = max_attempts
+        self.retry_pause = retry_pause
+        self.last_backup_at = None
+        self.last_duration = None
+
+    def _backup_database(self, source_path: str, target_path: str) -> None:
+        """Runs on a worker thread: page-limited online backup, then gzip."""
+        temp_path = target_path + ".tmp"
+        restarts = 0
+        last_remaining = None
+        attempt = 1
+
+        def progress(status, remaining, total):
+            nonlocal restarts, last_remaining
+            # A write from another connection restarts the copy from page 1
+            if last_remaining is not None and remaining > last_remaining:
+                restarts += 1
+                if restarts > self.max_restarts:
+                    raise _TooManyRestarts()
+            last_remaining = remaining
+
+        source = sqlite3.connect(source_path, timeout=30)
+        target = sqlite3.connect(temp_path)
+        try:
+            while True:
+                pages = min(self.pages_per_step * 2 ** (attempt - 1), MAX_PAGES_PER_STEP)
+                try:
+                    source.backup(target, pages=pages, progress=progress, sleep=self.step_pause)
+                    break
+                except _TooManyRestarts:
+                    if attempt >= self.max_attempts:
+                        raise RuntimeError(
+                            f"Backup of {source_path} kept restarting under writes; gave up after {attempt} attempts"
+                        ) from None
+                    # Never fall back to a single-step copy: that holds the lock for the whole database
+                    pause = self.retry_pause * 2 ** (attempt - 1)
+                    logger.warning(f"Backup of {source_path} restarted {restarts} times; retrying in {pause:g}s.")
+                    time.sleep(pause) # Worker thread
+                    attempt += 1
+                    restarts, last_remaining = 0, None
+        except BaseException:
+            target.close()
+            source.close()
+            os.remove(temp_path)
+            raise
+        target.close()
+        source.close()
+
+        with open(temp_path, "rb") as raw, gzip.open(target_path, "wb", compresslevel=6) as compressed:
+            shutil.copyfileobj(raw, compressed, 1024 * 1024)
+        os.remove(temp_path)
+
+    def _copy_file(self, source_path: str, target_dir: str) -> None:
+        if os.path.exists(source_path):
+            shutil.copy2(source_path, os.path.join(target_dir, os.path.basename(source_path)))
+
+    def _rotate(self) -> int:
+        """Deletes snapshot directories older than keep_hours; returns how many were removed."""
+        if not os.path.isdir(self.backup_dir):
+            return 0
+        cutoff = time.time() - self.keep_hours * 3600
+        removed = 0
+        for name in os.listdir(self.backup_dir):
+            path = os.path.join(self.backup_dir, name)
+            if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        return removed
+
+    def _make_snapshot_dir(self) -> str:
+        """Creates data/backups/<timestamp>/, adding -2, -3... when a run in the same second already has it."""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        base = os.path.join(self.backup_dir, time.strftime("%Y%m%d-%H%M%S"))
+        path, suffix = base, 1
+        while True:
+            try:
+                os.mkdir(path) # Fails if it exists, so two runs can't share a directory
+                return path
+            except FileExistsError:
+                suffix += 1
+                path = f"{base}-{suffix}"
+
+    async def backup_once(self) -> str:
+        """Takes one snapshot of every database and file; returns the snapshot directory."""
+        started = time.monotonic()
+        snapshot_dir = self._make_snapshot_dir()
+
+        for name, path in self.databases.items():
+            if not os.path.exists(path):
+                continue
+            await asyncio.to_thread(self._backup_database, path, os.path.join(snapshot_dir, f"{name}.db.gz"))
+        for path in self.files:
+            await asyncio.to_thread(self._copy_file, path, snapshot_dir)
+
+        removed = await asyncio.to_thread(self._rotate)
+        self.last_backup_at = time.time()
+        self.last_duration = time.monotonic() - started
+        logger.info(f"Backup written to {snapshot_dir} in {self.last_duration:.1f}s ({removed} old snapshots removed).")
+        return snapshot_dir
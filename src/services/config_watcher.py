@@ -0,0 +1,258 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from types import MappingProxyType
+
+from services.job_scheduler import CronTrigger
+
+logger = logging.getLogger(__name__)
+
+# Keys read once at startup; a change is accepted but only takes effect after a restart
+RESTART_REQUIRED_KEYS = (
+    "telegram_bot_token", "metrics_host", "metrics_port", "download_directory", "worker_count",
+    "log_directory", "log_rotation", "log_max_mb", "log_backup_count",
+    "network_check_targets", "network_check_interval", "network_check_timeout", "external_workers",
+    "telegram_api_url", "google_drive_folder_id",
+)
+# Optional config.json keys that must be positive numbers when present
+POSITIVE_NUMBER_KEYS = (
+    "worker_poll_interval", "archive_after_hours", "archive_interval_minutes", "backup_interval_hours",
+    "backup_keep_hours", "download_budget_gb", "max_queue_wait_seconds", "recovery_workers", "config_reload_interval",
+    "log_max_mb", "log_backup_count", "log_rate_burst",
+    "retry_max_attempts", "retry_base_delay", "retry_max_delay", "retry_poll_interval",
+    "breaker_failure_threshold", "breaker_cooldown", "breaker_max_cooldown",
+    "network_check_interval", "network_check_timeout", "worker_processes", "telegram_upload_limit_mb",
+    "drive_retention_hours", "drive_purge_interval_minutes", "drive_purge_batch_size", "drive_purge_concurrency",
+    "max_pending_tasks", "max_pending_per_user", "reference_poll_interval",
+    "maintenance_busy_queue", "maintenance_max_defer_minutes",
+)
+LOG_ROTATIONS = ("size", "S", "M", "H", "D", "midnight") # "size" or a TimedRotatingFileHandler `when`
+
+
+class ConfigError(ValueError):
+    """A config file failed validation; the previous snapshot stays active."""
+
+
+def freeze(value):
+    """Read-only deep copy of parsed JSON: dicts become mappingproxies, lists become tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class DomainMatcher:
+    """
+    Compiled form of domains.json. match() maps a URL host to its allowed domain, accepting subdomains
+    (www.freepik.com -> freepik.com) with one set lookup per label instead of a scan of the list.
+    """
+
+    def __init__(self, allowed_domains, rewrite_map=None, download_selectors=None):
+        self.allowed = frozenset(domain.lower() for domain in allowed_domains)
+        self.rewrite_map = MappingProxyType({key.lower(): value for key, value in (rewrite_map or {}).items()})
+        self.download_selectors = MappingProxyType({key.lower(): value for key, value in (download_selectors or {}).items()})
+
+    @classmethod
+    def from_config(cls, domains_config) -> "DomainMatcher":
+        return cls(
+            domains_config.get("allowed_domains", ()),
+            domains_config.get("rewrite_map"),
+            domains_config.get("download_selectors"),
+        )
+
+    def match(self, host: str):
+        """The allowed domain host belongs to, or None."""
+        host = (host or "").lower().split(":", 1)[0].rstrip(".")
+        while host:
+            if host in self.allowed:
+                return host
+            _, _, host = host.partition(".")
+        return None
+
+
+class ConfigSnapshot:
+    """One immutable, validated view of config.json, admins.json and domains.json."""
+    __slots__ = ("config", "admin_ids", "domains", "domain_matcher", "version", "loaded_at")
+
+    def __init__(self, config, admin_ids, domains, domain_matcher, version):
+        self.config = config
+        self.admin_ids = admin_ids
+        self.domains = domains
+        self.domain_matcher = domain_matcher
+        self.version = version
+        self.loaded_at = time.time()
+
+
+def _read_json(path: str):
+    with open(path, 'r') as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError as e:
+            raise ConfigError(f"{path}: invalid JSON ({e})") from e
+
+
+def validate_config(config) -> None:
+    if not isinstance(config, dict):
+        raise ConfigError("config.json must contain a JSON object")
+    if not isinstance(config.get("telegram_bot_token"), str):
+        raise ConfigError("config.json: telegram_bot_token must be a string")
+    for key in POSITIVE_NUMBER_KEYS:
+        value = config.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0):
+            raise ConfigError(f"config.json: {key} must be a positive number, got {value!r}")
+    for key in ("recommended_channels", "initial_admin_ids", "direct_delivery_plans"):
+        if not isinstance(config.get(key, []), list):
+            raise ConfigError(f"config.json: {key} must be a list")
+    if config.get("log_level", "INFO") not in logging.getLevelNamesMapping():
+        raise ConfigError(f"config.json: log_level must be a logging level name, got {config.get('log_level')!r}")
+    if config.get("log_rotation", "size") not in LOG_ROTATIONS:
+        raise ConfigError(f"config.json: log_rotation must be one of {LOG_ROTATIONS}")
+    rate = config.get("log_rate_limit", 20)
+    if isinstance(rate, bool) or not isinstance(rate, (int, float)) or rate < 0:
+        raise ConfigError("config.json: log_rate_limit must be a non-negative number (0 disables sampling)")
+    targets = config.get("network_check_targets", [])
+    if not isinstance(targets, list) or not all(
+            isinstance(t, str) and t.rpartition(":")[0] and t.rpartition(":")[2].isdigit() for t in targets):
+        raise ConfigError('config.json: network_check_targets must be a list of "host:port" strings')
+    weights = config.get("plan_weights", {})
+    if not isinstance(weights, dict) or any(
+            isinstance(w, bool) or not isinstance(w, (int, float)) or w <= 0 for w in weights.values()):
+        raise ConfigError("config.json: plan_weights must map plan names to positive numbers")
+    quotas = config.get("group_queue_quotas", {})
+    if not isinstance(quotas, dict) or any(
+            isinstance(q, bool) or not isinstance(q, int) or q <= 0 for q in quotas.values()):
+        raise ConfigError("config.json: group_queue_quotas must map plan names to positive integers")
+    schedules = config.get("job_schedules", {})
+    if not isinstance(schedules, dict) or not all(isinstance(e, str) for e in schedules.values()):
+        raise ConfigError("config.json: job_schedules must map job names to cron expressions")
+    for name, expression in schedules.items():
+        try:
+            CronTrigger(expression)
+        except ValueError as e:
+            raise ConfigError(f"config.json: job_schedules.{name}: {e}") from e
+
+
+def validate_admins(admins) -> None:
+    if not isinstance(admins, dict) or not isinstance(admins.get("admins", []), list):
+        raise ConfigError('admins.json must look like {"admins": [123, ...]}')
+    if any(isinstance(admin_id, bool) or not isinstance(admin_id, int) for admin_id in admins.get("admins", [])):
+        raise ConfigError("admins.json: admin ids must be integers")
+
+
+def validate_domains(domains) -> None:
+    if not isinstance(domains, dict):
+        raise ConfigError("domains.json must contain a JSON object")
+    allowed = domains.get("allowed_domains")
+    if not isinstance(allowed, list) or not all(isinstance(d, str) and d for d in allowed):
+        raise ConfigError("domains.json: allowed_domains must be a list of domain names")
+    for key in ("rewrite_map", "download_selectors"):
+        mapping = domains.get(key, {})
+        if not isinstance(mapping, dict) or not all(isinstance(v, str) for v in mapping.values()):
+            raise ConfigError(f"domains.json: {key} must map domains to strings")
+        unknown = set(d.lower() for d in mapping) - set(d.lower() for d in allowed)
+        if unknown:
+            raise ConfigError(f"domains.json: {key} has entries for domains not in allowed_domains: {sorted(unknown)}")
+
+
+class ConfigWatcher:
+    """
+    Holds the current ConfigSnapshot and replaces it when one of the files changes.
+
+    Readers take `watcher.current` (or a reference stored from a listener) and use that snapshot for the
+    whole operation, so they never see half of an update. run() polls the files' mtime and size; on a
+    change, the files are read, validated and compiled into a new snapshot on a worker thread, then the
+    reference is swapped in a single assignment on the event loop and listeners are called. A snapshot
+    that fails validation is logged and discarded, and the previous one stays active.
+    """
+
+    def __init__(self, config_path: str, admins_path: str, domains_path: str):
+        self.config_path = config_path
+        self.admins_path = admins_path
+        self.domains_path = domains_path
+        self.current = None
+        self.last_error = None
+        self._signatures = None
+        self._listeners = []
+
+    def _signature(self):
+        signatures = []
+        for path in (self.config_path, self.admins_path, self.domains_path):
+            try:
+                stat = os.stat(path)
+                signatures.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signatures.append(None)
+        return tuple(signatures)
+
+    def _build(self, version: int) -> ConfigSnapshot:
+        """Reads, validates and compiles all three files (blocking; runs on a thread after startup)."""
+        if not os.path.exists(self.config_path):
+            raise FileNotFoundError(f"Config file not found: {self.config_path}")
+        if not os.path.exists(self.domains_path):
+            raise FileNotFoundError(f"Domains config file not found: {self.domains_path}")
+        config = _read_json(self.config_path)
+        validate_config(config)
+        domains = _read_json(self.domains_path)
+        validate_domains(domains)
+        if os.path.exists(self.admins_path):
+            admins = _read_json(self.admins_path)
+            validate_admins(admins)
+            admin_ids = frozenset(admins.get("admins", []))
+        else:
+            logger.warning(f"Admins config file not found: {self.admins_path}. Using initial_admin_ids from config.json.")
+            admin_ids = frozenset(config.get("initial_admin_ids", []))
+        return ConfigSnapshot(freeze(config), admin_ids, freeze(domains), DomainMatcher.from_config(domains), version)
+
+    def load(self) -> ConfigSnapshot:
+        """Initial synchronous load at startup; raises on missing or invalid files."""
+        self._signatures = self._signature()
+        self.current = self._build(1)
+        return self.current
+
+    def subscribe(self, listener) -> None:
+        """Calls listener(snapshot) after every successful reload."""
+        self._listeners.append(listener)
+
+    async def reload(self) -> bool:
+        """Rebuilds the snapshot off the event loop and swaps it in; returns False if validation failed."""
+        version = self.current.version + 1 if self.current else 1
+        try:
+            snapshot = await asyncio.to_thread(self._build, version)
+        except (ConfigError, OSError) as e:
+            self.last_error = str(e)
+            logger.error(f"Config reload rejected, keeping version {self.current.version if self.current else None}: {e}")
+            return False
+
+        previous, self.current = self.current, snapshot # The swap readers observe
+        self.last_error = None
+        if previous is not None:
+            changed = [key for key in RESTART_REQUIRED_KEYS if previous.config.get(key) != snapshot.config.get(key)]
+            if changed:
+                logger.warning(f"Config keys {changed} changed; they take effect after a restart.")
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.error(f"Config listener failed: {e}", exc_info=True)
+        logger.info(
+            f"Config reloaded (version {snapshot.version}): {len(snapshot.admin_ids)} admins, "
+            f"{len(snapshot.domain_matcher.allowed)} allowed domains."
+        )
+        return True
+
+    async def run(self, interval: float = 2.0) -> None:
+        """Polls the files every interval seconds and reloads on change, until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                signatures = await asyncio.to_thread(self._signature)
+                if signatures != self._signatures:
+                    self._signatures = signatures
+                    await self.reload()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Config watcher error: {e}", exc_info=True)
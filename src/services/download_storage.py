@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import os
+import shutil
+from collections import OrderedDict
+
+from services.metrics import DOWNLOAD_STORAGE_BYTES, DOWNLOADS_WAITING_FOR_SPACE, DOWNLOAD_EVICTIONS
+
+logger = logging.getLogger(__name__)
+
+GIB = 1024 ** 3
+ACTIVE_STATUSES = ('pending', 'downloading', 'uploading', 'retrying')
+
+
+class StorageBudgetError(Exception):
+    """Raised when a download can never fit in the download directory budget."""
+
+
+class Reservation:
+    """Space set aside for one download. commit() turns it into used bytes; leaving a with-block without
+    committing (download failed) gives it back."""
+
+    def __init__(self, storage: "DownloadStorage", size: int):
+        self.storage = storage
+        self.size = size
+        self.done = False
+
+    def commit(self, path: str) -> None:
+        if not self.done:
+            self.done = True
+            self.storage._commit(self, path)
+
+    def release(self) -> None:
+        if not self.done:
+            self.done = True
+            self.storage._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class DownloadStorage:
+    """
+    Keeps the download directory within budget_bytes (and min_free_bytes of free disk).
+
+    Bytes in use are counted once by scan() at startup and then kept current in memory. A download
+    reserves its expected size (Content-Length, or unknown_size_bytes without one) before writing
+    anything. If the space isn't there, files that were already uploaded (or whose task failed for good)
+    are deleted in least recently used order; if that still isn't enough, the download waits (first come,
+    first served) until other downloads finish or fail instead of failing halfway through on a full disk.
+    """
+
+    def __init__(self, directory: str, budget_bytes: int, min_free_bytes: int = 2 * GIB,
+                 unknown_size_bytes: int = GIB, db=None):
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+        self.min_free_bytes = min_free_bytes
+        self.unknown_size_bytes = unknown_size_bytes
+        self.db = db
+        self.bytes_used = 0
+        self.bytes_reserved = 0
+        self._sizes = {} # path -> size of every committed file we know about
+        self._evictable = OrderedDict() # path -> task_id, least recently used first
+        self._evictable_bytes = 0
+        self._queue_lock = asyncio.Lock() # One reserver waits for space at a time, in arrival order
+        self._space_freed = asyncio.Event()
+
+    # --- Accounting ---
+
+    def _update_metrics(self) -> None:
+        DOWNLOAD_STORAGE_BYTES.set(self.bytes_used, kind="used")
+        DOWNLOAD_STORAGE_BYTES.set(self.bytes_reserved, kind="reserved")
+        DOWNLOAD_STORAGE_BYTES.set(self.budget_bytes, kind="budget")
+
+    def available(self) -> int:
+        """Bytes a new reservation can take right now without evicting anything."""
+        within_budget = self.budget_bytes - self.bytes_used - self.bytes_reserved
+        try:
+            disk_free = shutil.disk_usage(self.directory).free - self.min_free_bytes - self.bytes_reserved
+        except OSError:
+            disk_free = within_budget
+        return min(within_budget, disk_free)
+
+    async def scan(self) -> None:
+        """Counts what is already on disk. Files not referenced by an active task are evictable, oldest
+        access first; files of active tasks (including complete downloads kept by crash recovery) are not."""
+        os.makedirs(self.directory, exist_ok=True)
+        referenced = {}
+        if self.db is not None:
+            rows = await self.db.fetchall(
+                "SELECT task_id, local_filepath, status FROM tasks WHERE local_filepath IS NOT NULL"
+            )
+            referenced = {os.path.abspath(path): (task_id, status) for task_id, path, status in rows}
+
+        def walk():
+            found = []
+            for root, _, names in os.walk(self.directory):
+                for name in names:
+                    path = os.path.abspath(os.path.join(root, name))
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    found.append((stat.st_atime, path, stat.st_size))
+            return sorted(found)
+
+        self.bytes_used = 0
+        self._sizes.clear()
+        self._evictable.clear()
+        self._evictable_bytes = 0
+        for _, path, size in await asyncio.to_thread(walk):
+            self._sizes[path] = size
+            self.bytes_used += size
+            task_id, status = referenced.get(path, (None, None))
+            if status not in ACTIVE_STATUSES:
+                self._evictable[path] = task_id
+                self._evictable_bytes += size
+        self._update_metrics()
+        logger.info(
+            f"Download directory holds {self.bytes_used / GIB:.2f} GiB in {len(self._sizes)} files "
+            f"({len(self._evictable)} evictable); budget {self.budget_bytes / GIB:.2f} GiB."
+        )
+
+    # --- Reservations ---
+
+    async def _evict(self, needed: int) -> int:
+        """Deletes uploaded files, least recently used first, until needed bytes are available."""
+        evicted, freed_tasks = 0, []
+        while self.available() < needed and self._evictable:
+            path, task_id = self._evictable.popitem(last=False)
+            try:
+                await asyncio.to_thread(os.remove, path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not evict {path}: {e}")
+                continue
+            size = self._sizes.pop(path, 0)
+            self.bytes_used -= size
+            self._evictable_bytes -= size
+            evicted += 1
+            if task_id is not None:
+                freed_tasks.append((task_id,))
+        if evicted:
+            DOWNLOAD_EVICTIONS.inc(evicted)
+            if freed_tasks and self.db is not None:
+                await self.db.executemany("UPDATE tasks SET local_filepath = NULL WHERE task_id = ?", freed_tasks)
+            logger.info(f"Evicted {evicted} uploaded files from {self.directory}.")
+        return evicted
+
+    def would_wait(self, size: int = None) -> bool:
+        """True if reserve(size) can't be granted right away, even after evicting everything evictable."""
+        size = self.unknown_size_bytes if size is None else size
+        return self._queue_lock.locked() or self.available() + self._evictable_bytes < size
+
+    async def reserve(self, size: int = None) -> Reservation:
+        """Waits until size bytes (unknown_size_bytes if None) can be set aside, evicting as needed."""
+        size = self.unknown_size_bytes if size is None else size
+        if size > self.budget_bytes:
+            raise StorageBudgetError(f"Download of {size} bytes exceeds the {self.budget_bytes} byte budget")
+
+        async with self._queue_lock:
+            waiting = False
+            try:
+                while True:
+                    await self._evict(size)
+                    if self.available() >= size:
+                        self.bytes_reserved += size
+                        self._update_metrics()
+                        return Reservation(self, size)
+                    if not waiting:
+                        waiting = True
+                        DOWNLOADS_WAITING_FOR_SPACE.inc()
+                        logger.info(f"Holding back a {size} byte download until the download directory has room.")
+                    self._space_freed.clear()
+                    try:
+                        # Re-check periodically too: disk space can be freed outside the bot
+                        await asyncio.wait_for(self._space_freed.wait(), 30)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                if waiting:
+                    DOWNLOADS_WAITING_FOR_SPACE.dec()
+
+    def _commit(self, reservation: Reservation, path: str) -> None:
+        path = os.path.abspath(path)
+        size = os.path.getsize(path)
+        self.bytes_reserved -= reservation.size
+        self.bytes_used += size - self._sizes.get(path, 0)
+        self._sizes[path] = size
+        self._update_metrics()
+        self._space_freed.set() # The actual size may be smaller than reserved
+
+    def _release(self, reservation: Reservation) -> None:
+        self.bytes_reserved -= reservation.size
+        self._update_metrics()
+        self._space_freed.set()
+
+    # --- File lifecycle ---
+
+    def mark_uploaded(self, task_id: int, path: str) -> None:
+        """The file has been delivered; it may be evicted when space is needed."""
+        path = os.path.abspath(path)
+        if path in self._sizes:
+            if path not in self._evictable:
+                self._evictable_bytes += self._sizes[path]
+            self._evictable[path] = task_id
+            self._evictable.move_to_end(path)
+            self._update_metrics()
+            self._space_freed.set()
+
+    def release(self, task_id: int, path: str) -> None:
+        """The task failed for good and won't upload the file; it may be evicted like an uploaded one."""
+        self.mark_uploaded(task_id, path)
+
+    def touch(self, path: str) -> None:
+        """Marks an evictable file as recently used (e.g. it was just re-sent)."""
+        path = os.path.abspath(path)
+        if path in self._evictable:
+            self._evictable.move_to_end(path)
+
+    def forget(self, path: str) -> None:
+        """Stops counting a file that was deleted by someone else (e.g. the purge job)."""
+        path = os.path.abspath(path)
+        size = self._sizes.pop(path, 0)
+        self.bytes_used -= size
+        if path in self._evictable:
+            del self._evictable[path]
+            self._evictable_bytes -= size
+        self._update_metrics()
+        self._space_freed.set()
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+
+from persistence.db import Database
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+DRIVE_BATCH_LIMIT = 100 # Calls per Drive batch request
+
+
+class DriveRetention:
+    """
+    Deletes files from Drive retention_hours after they were uploaded (local copies are kept).
+
+    Works from the uploads ledger instead of listing the folder. Each round claims up to batch_size
+    expired rows, oldest first through idx_uploads_uploaded_at, by marking them 'deleting' in one
+    UPDATE ... RETURNING. A deduplication hit refreshing uploaded_at at the same time either wins,
+    keeping the file, or finds it claimed. Claimed files are grouped by credential file and deleted
+    with Drive batch requests of up to 100 deletes. At most `concurrency` batch requests are in flight
+    per credential file, and both files run side by side.
+
+    A confirmed delete (or a 404) removes the row from the ledger and from the drive_files index.
+    Failed deletes stay claimed until the run ends, so a round never picks them up again. They are
+    then released with their error for the next run, until max_attempts. A file that fails its last
+    attempt is abandoned: it is logged at ERROR, counted in assetfetch_drive_purged_total{outcome="abandoned"}
+    and stays in the assetfetch_drive_purge_abandoned gauge until it is removed by hand. Rows still
+    'deleting' after a crash are picked up first by the next run, so the purge resumes where it stopped.
+    """
+
+    def __init__(self, db: Database, clients, retention_hours: float = 12, batch_size: int = 500,
+                 concurrency: int = 4, max_attempts: int = 5):
+        self.db = db
+        self.clients = {client.name: client for client in clients}
+        self.retention_hours = retention_hours
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.total_deleted = 0
+
+    @classmethod
+    def from_config(cls, db: Database, config, clients) -> "DriveRetention":
+        return cls(
+            db, clients,
+            retention_hours=config.get("drive_retention_hours", 12),
+            batch_size=int(config.get("drive_purge_batch_size", 500)),
+            concurrency=int(config.get("drive_purge_concurrency", 4)),
+        )
+
+    def configure(self, config) -> None:
+        """Applies drive_retention_hours, drive_purge_batch_size and drive_purge_concurrency from a reloaded config."""
+        self.retention_hours = config.get("drive_retention_hours", 12)
+        self.batch_size = int(config.get("drive_purge_batch_size", 500))
+        self.concurrency = int(config.get("drive_purge_concurrency", 4))
+
+    async def _claim(self):
+        return await self.db.execute_returning(
+            "UPDATE uploads SET purge_state = 'deleting' WHERE upload_id IN ("
+            "SELECT upload_id FROM uploads WHERE uploaded_at < datetime('now', ?) AND purge_state IS NULL "
+            "AND purge_attempts < ? ORDER BY uploaded_at LIMIT ?) "
+            "RETURNING upload_id, drive_file_id, credentials, purge_attempts",
+            (f"-{self.retention_hours} hours", self.max_attempts, self.batch_size)
+        )
+
+    async def _delete(self, rows):
+        """Deletes one claimed round from Drive and removes the deleted files from the ledger.
+        Returns (deleted count, [(upload_id, error)] for the files that are still there)."""
+        by_client = {}
+        unknown = []
+        for upload_id, file_id, credentials in rows:
+            if credentials in self.clients:
+                by_client.setdefault(credentials, []).append((upload_id, file_id))
+            else:
+                unknown.append((upload_id, file_id))
+
+        async def delete_batch(client, semaphore, batch):
+            async with semaphore:
+                try:
+                    return batch, await asyncio.to_thread(client.delete_many, [file_id for _, file_id in batch])
+                except Exception as e:
+                    return batch, {file_id: e for _, file_id in batch}
+
+        requests = []
+        for name, entries in by_client.items():
+            semaphore = asyncio.Semaphore(self.concurrency)
+            for start in range(0, len(entries), DRIVE_BATCH_LIMIT):
+                requests.append(delete_batch(self.clients[name], semaphore, entries[start:start + DRIVE_BATCH_LIMIT]))
+
+        deleted, failed = [], [(upload_id, "credential file not configured") for upload_id, _ in unknown]
+        for batch, results in await asyncio.gather(*requests):
+            for upload_id, file_id in batch:
+                error = results.get(file_id, "no response in batch")
+                if error is None:
+                    deleted.append((upload_id, file_id))
+                else:
+                    failed.append((upload_id, str(error)))
+
+        if deleted:
+            await self.db.executemany("DELETE FROM drive_files WHERE drive_file_id = ?", [(file_id,) for _, file_id in deleted])
+            await self.db.executemany("DELETE FROM uploads WHERE upload_id = ?", [(upload_id,) for upload_id, _ in deleted])
+            metrics.DRIVE_PURGED.inc(len(deleted), outcome="deleted")
+        return len(deleted), failed
+
+    async def purge_once(self) -> int:
+        """Deletes every expired file, one claimed round at a time; returns how many were deleted."""
+        started = time.monotonic()
+        deleted, failed = 0, []
+        attempts = {} # upload_id -> failed deletes before this run
+        rows = await self.db.fetchall(
+            "SELECT upload_id, drive_file_id, credentials, purge_attempts FROM uploads WHERE purge_state = 'deleting'"
+        )
+        if rows:
+            logger.info(f"Resuming an interrupted Drive purge of {len(rows)} files.")
+        while True:
+            if rows:
+                attempts.update((row[0], row[3]) for row in rows)
+                round_deleted, round_failed = await self._delete([row[:3] for row in rows])
+                deleted += round_deleted
+                failed.extend(round_failed)
+            rows = await self._claim()
+            if not rows:
+                break
+            await asyncio.sleep(0) # Let handlers and the worker get the DB lock between rounds
+
+        if failed:
+            await self.db.executemany(
+                "UPDATE uploads SET purge_state = NULL, purge_attempts = purge_attempts + 1, purge_error = ? WHERE upload_id = ?",
+                [(error, upload_id) for upload_id, error in failed]
+            )
+            abandoned = [(upload_id, error) for upload_id, error in failed if attempts[upload_id] + 1 >= self.max_attempts]
+            retrying = len(failed) - len(abandoned)
+            if retrying:
+                metrics.DRIVE_PURGED.inc(retrying, outcome="failed")
+                logger.warning(f"{retrying} expired Drive files could not be deleted (first error: {failed[0][1]}); will retry.")
+            if abandoned:
+                metrics.DRIVE_PURGED.inc(len(abandoned), outcome="abandoned")
+                logger.error(f"Giving up on {len(abandoned)} expired Drive files after {self.max_attempts} failed deletes; "
+                             f"they stay on Drive until removed by hand (upload ids {[upload_id for upload_id, _ in abandoned[:10]]}, "
+                             f"first error: {abandoned[0][1]}).")
+        row = await self.db.fetchone("SELECT COUNT(*) FROM uploads WHERE purge_attempts >= ?", (self.max_attempts,))
+        metrics.DRIVE_PURGE_ABANDONED.set(row[0])
+
+        if deleted:
+            self.total_deleted += deleted
+            logger.info(f"Deleted {deleted} expired files from Drive in {time.monotonic() - started:.2f}s.")
+        return deleted
@@ -0,0 +1,323 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUSY_QUEUE = 50 # Pending tasks at or above which heavy jobs wait for a quieter moment
+DEFAULT_MAX_DEFER_MINUTES = 60 # A heavy job runs anyway once it has waited this long
+BUSY_POLL_INTERVAL = 5
+MAX_SKIPPED_SLOTS = 10000 # Bound on the catch-up walk after a long run or a suspended host
+
+# (name, lowest, highest) of the five cron fields; weekday 7 is accepted as Sunday
+CRON_FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7))
+
+
+def _parse_cron_field(spec: str, name: str, low: int, high: int) -> frozenset:
+    """Values of one cron field: "*", "5", "1-5", "*/15", "0-30/10", "5/15", or a comma list of those."""
+    values = set()
+    for part in spec.split(","):
+        base, _, step = part.partition("/")
+        try:
+            if base == "*":
+                start, end = low, high
+            elif "-" in base:
+                start, end = (int(bound) for bound in base.split("-", 1))
+            else:
+                start = int(base)
+                end = high if step else start
+            step = int(step) if step else 1
+        except ValueError:
+            raise ValueError(f"Cron {name} field {spec!r} is not a number, range or step") from None
+        if not low <= start <= end <= high or step <= 0:
+            raise ValueError(f"Cron {name} field {spec!r} is outside {low}-{high}")
+        values.update(range(start, end + 1, step))
+    if name == "weekday" and 7 in values:
+        values.discard(7)
+        values.add(0)
+    return frozenset(values)
+
+
+class IntervalTrigger:
+    """Fires every `seconds`; the first run is right away with run_at_start, else one interval after start."""
+
+    def __init__(self, seconds: float, run_at_start: bool = False):
+        if seconds <= 0:
+            raise ValueError(f"Interval must be positive, got {seconds!r}")
+        self.seconds = seconds
+        self.run_at_start = run_at_start
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, IntervalTrigger) and (self.seconds, self.run_at_start) == (other.seconds, other.run_at_start)
+
+    def first(self, now: float) -> float:
+        return now if self.run_at_start else now + self.seconds
+
+    def next_after(self, timestamp: float) -> float:
+        return timestamp + self.seconds
+
+    def describe(self) -> str:
+        if self.seconds % 3600 == 0:
+            return f"every {self.seconds / 3600:g} h"
+        if self.seconds % 60 == 0:
+            return f"every {self.seconds / 60:g} min"
+        return f"every {self.seconds:g}s"
+
+
+class CronTrigger:
+    """
+    Standard five-field cron expression (minute hour day month weekday) in local time, e.g.
+    "0 3 * * *" for 03:00 every day or "30 */8 * * *" for 00:30, 08:30 and 16:30. As in cron, when
+    both day and weekday are restricted a time matches if either does.
+    """
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != len(CRON_FIELDS):
+            raise ValueError(f"Cron expression {expression!r} must have 5 fields (minute hour day month weekday)")
+        self.expression = " ".join(fields)
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            _parse_cron_field(spec, *field) for spec, field in zip(fields, CRON_FIELDS)
+        )
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+        self.next_after(time.time()) # Rejects expressions that never fire, such as "0 0 31 2 *"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CronTrigger) and self.expression == other.expression
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = moment.isoweekday() % 7 in self.weekdays # Sunday is 0
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def first(self, now: float) -> float:
+        return self.next_after(now)
+
+    def next_after(self, timestamp: float) -> float:
+        """First matching minute strictly after timestamp. Skips whole months, days and hours that can't match."""
+        moment = datetime.fromtimestamp(timestamp).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+        raise ValueError(f"Cron expression {self.expression!r} never fires")
+
+    def describe(self) -> str:
+        return f"cron {self.expression}"
+
+
+def trigger_from_config(config, name: str, interval_seconds: float, run_at_start: bool = False):
+    """The job's cron expression from config "job_schedules" if it has one, else its interval."""
+    expression = config.get("job_schedules", {}).get(name)
+    if expression:
+        return CronTrigger(expression)
+    return IntervalTrigger(interval_seconds, run_at_start)
+
+
+class Job:
+    """One registered job: its settings, plus run statistics for /jobs and the metrics."""
+
+    def __init__(self, name: str, func, trigger, jitter: float = 0, max_runtime: float = None, heavy: bool = False):
+        self.name = name
+        self.func = func # async callable with no arguments
+        self.trigger = trigger
+        self.jitter = jitter
+        self.max_runtime = max_runtime
+        self.heavy = heavy
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.skipped = 0 # Slots that passed while the previous run was still going
+        self.deferred_seconds = 0.0 # Total time spent waiting for a quiet moment
+        self.last_started_at = None
+        self.last_duration = None
+        self.last_outcome = None
+        self.last_error = None
+        self.next_run_at = None
+        self._wake = asyncio.Event()
+        self._reschedule = False
+        self._run_now = False
+        self._task = None
+
+
+class JobScheduler:
+    """
+    Runs the periodic maintenance jobs (archiving, backups, the Drive purge) inside the bot's event loop,
+    each on an IntervalTrigger or a CronTrigger.
+
+    Every job has its own loop, so a run never overlaps the previous one: slots that pass while a run
+    is still going are skipped, not queued. A random delay of up to `jitter` seconds is added to each
+    slot, and a run that exceeds max_runtime is cancelled. Jobs marked heavy wait while the queue holds
+    busy_queue or more pending tasks (up to max_defer seconds, then they run anyway) and only one heavy
+    job runs at a time, so a backup never lands on top of an archive pass or a traffic peak. Jobs yield
+    to the loop between their own batches.
+    """
+
+    def __init__(self, pending=None, busy_queue: int = DEFAULT_BUSY_QUEUE,
+                 max_defer: float = DEFAULT_MAX_DEFER_MINUTES * 60, busy_poll: float = BUSY_POLL_INTERVAL):
+        self.pending = pending # () -> number of pending tasks, or None to never defer
+        self.busy_queue = busy_queue
+        self.max_defer = max_defer
+        self.busy_poll = busy_poll
+        self.jobs = {} # name -> Job, in registration order
+        self._heavy_lock = asyncio.Lock()
+        self._started = False
+
+    @classmethod
+    def from_config(cls, config, pending=None) -> "JobScheduler":
+        scheduler = cls(pending)
+        scheduler.configure(config)
+        return scheduler
+
+    def configure(self, config) -> None:
+        """Applies maintenance_busy_queue and maintenance_max_defer_minutes from a reloaded config."""
+        self.busy_queue = config.get("maintenance_busy_queue", DEFAULT_BUSY_QUEUE)
+        self.max_defer = config.get("maintenance_max_defer_minutes", DEFAULT_MAX_DEFER_MINUTES) * 60
+
+    def add(self, name: str, func, trigger, jitter: float = 0, max_runtime: float = None, heavy: bool = False) -> Job:
+        """Registers a job, or updates the settings of an existing one (config reload). A changed
+        trigger takes effect immediately; the other settings from the next run."""
+        job = self.jobs.get(name)
+        if job is None:
+            job = self.jobs[name] = Job(name, func, trigger, jitter, max_runtime, heavy)
+            if self._started:
+                job._task = asyncio.create_task(self._loop(job))
+            return job
+        job.func, job.jitter, job.max_runtime, job.heavy = func, jitter, max_runtime, heavy
+        if job.trigger != trigger:
+            job.trigger = trigger
+            job._reschedule = True
+            job._wake.set()
+        return job
+
+    def start(self) -> None:
+        """Starts every job's loop (jobs added later start right away)."""
+        self._started = True
+        for job in self.jobs.values():
+            if job._task is None:
+                job._task = asyncio.create_task(self._loop(job))
+
+    async def stop(self) -> None:
+        tasks = [job._task for job in self.jobs.values() if job._task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for job in self.jobs.values():
+            job._task = None
+        self._started = False
+
+    def run_now(self, name: str) -> bool:
+        """Starts a job outside its schedule (admin request); False if it is running already."""
+        job = self.jobs[name]
+        if job.running or job._run_now:
+            return False
+        job._run_now = True
+        job._wake.set()
+        return True
+
+    def busy(self) -> bool:
+        return self.pending is not None and self.pending() >= self.busy_queue
+
+    def stats(self) -> list:
+        return [
+            {
+                "name": job.name, "schedule": job.trigger.describe(), "heavy": job.heavy, "running": job.running,
+                "runs": job.runs, "failures": job.failures, "timeouts": job.timeouts, "skipped": job.skipped,
+                "deferred_seconds": job.deferred_seconds, "last_started_at": job.last_started_at,
+                "last_duration": job.last_duration, "last_outcome": job.last_outcome, "last_error": job.last_error,
+                "next_run_at": job.next_run_at,
+            }
+            for job in self.jobs.values()
+        ]
+
+    async def _loop(self, job: Job) -> None:
+        slot = job.trigger.first(time.time()) # Unjittered, so jitter never accumulates into drift
+        while True:
+            job.next_run_at = slot + (random.uniform(0, job.jitter) if job.jitter else 0)
+            delay = job.next_run_at - time.time()
+            if delay > 0 and not job._run_now:
+                try:
+                    await asyncio.wait_for(job._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+            job._wake.clear()
+            if job._reschedule:
+                job._reschedule = False
+                slot = job.trigger.first(time.time())
+                continue
+            manual = job._run_now and job.next_run_at > time.time()
+            job._run_now = False
+            await self._execute(job, defer=not manual)
+            if manual:
+                continue # Keep the scheduled slot
+
+            now, skipped = time.time(), 0
+            slot = job.trigger.next_after(slot)
+            while slot <= now:
+                skipped += 1
+                slot = job.trigger.next_after(now if skipped >= MAX_SKIPPED_SLOTS else slot)
+            if skipped:
+                job.skipped += skipped
+                logger.info("Job %s skipped %s slot(s) that passed while it was running.", job.name, skipped)
+
+    async def _execute(self, job: Job, defer: bool = True) -> None:
+        if not job.heavy:
+            await self._invoke(job)
+            return
+        if defer and self.busy():
+            started = time.monotonic()
+            logger.info("Deferring job %s: %s or more tasks are pending.", job.name, self.busy_queue)
+            while self.busy() and time.monotonic() - started < self.max_defer:
+                await asyncio.sleep(self.busy_poll)
+            job.deferred_seconds += time.monotonic() - started
+        async with self._heavy_lock:
+            await self._invoke(job)
+
+    async def _invoke(self, job: Job) -> None:
+        job.running = True
+        job.last_started_at = time.time()
+        started = time.monotonic()
+        outcome, error = "ok", None
+        try:
+            if job.max_runtime:
+                await asyncio.wait_for(job.func(), job.max_runtime)
+            else:
+                await job.func()
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError as e:
+            if job.max_runtime and time.monotonic() - started >= job.max_runtime:
+                outcome, error = "timeout", f"cancelled after the max runtime of {job.max_runtime:g}s"
+                job.timeouts += 1
+                logger.warning(f"Job {job.name} {error}.")
+            else:
+                outcome, error = "failed", repr(e)
+                job.failures += 1
+                logger.error(f"Job {job.name} failed: {e!r}", exc_info=True)
+        except Exception as e:
+            outcome, error = "failed", str(e) or repr(e)
+            job.failures += 1
+            logger.error(f"Job {job.name} failed: {e}", exc_info=True)
+        finally:
+            job.running = False
+        job.runs += 1
+        job.last_duration = time.monotonic() - started
+        job.last_outcome, job.last_error = outcome, error
+        metrics.JOB_RUNS.inc(job=job.name, outcome=outcome)
+        metrics.JOB_DURATION.observe(job.last_duration, job=job.name)
@@ -0,0 +1,49 @@
+import importlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+IMPORT_SECONDS = {} # module name -> seconds its first use spent importing it
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access and then cached.
+
+    Bound at module level (requests = lazy_import("requests")), it keeps heavy dependencies out of
+    startup: the import cost is paid by the first task that needs the module, not by every restart.
+    Safe to touch from worker threads; only one thread performs the import.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    IMPORT_SECONDS[self._name] = time.perf_counter() - started
+                    logger.debug(f"Imported {self._name} on first use in {IMPORT_SECONDS[self._name] * 1000:.0f} ms")
+                    self._module = module
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self._name!r} ({'loaded' if self._module is not None else 'not loaded'})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    """Returns a LazyModule for name (e.g. "requests", "bs4", "googleapiclient.discovery")."""
+    return LazyModule(name)
@@ -0,0 +1,176 @@
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOG_DIRECTORY = "logs"
+DEFAULT_QUEUE_SIZE = 10000
+CONSOLE_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# LogRecord attributes that are not user-supplied `extra` fields
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "suppressed"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, plus exc, suppressed and any `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(), # %-style args are only merged here, on the writer thread
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per call site (file and line) for records below WARNING: each site may log `burst`
+    records at once and `rate` per second after that. The next record let through from a throttled
+    site carries the number it skipped as `suppressed`. Keying on the call site rather than the message
+    keeps this working for f-string messages, which are unique per call.
+    """
+
+    def __init__(self, rate: float = 20.0, burst: int = 50, max_sites: int = 2048):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.max_sites = max_sites
+        self._buckets = {} # (pathname, lineno) -> [tokens, last refill monotonic, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rate:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_sites:
+                    self._buckets.clear()
+                bucket = self._buckets[key] = [float(self.burst), now, 0]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                metrics.LOG_RECORDS_DROPPED.inc(reason="rate_limited")
+                return False
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed, bucket[2] = bucket[2], 0
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the writer thread and never blocks the caller.
+
+    The stock prepare() renders the message on the logging thread; here the record is only copied
+    (exception text is rendered eagerly, since the traceback's frames are about to unwind). When the
+    queue is full the record is dropped and counted rather than stalling the event loop.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.LOG_RECORDS_DROPPED.inc(reason="queue_full")
+
+
+def _file_handler(directory: str, filename: str, rotation: str, max_mb: float, backup_count: int) -> logging.Handler:
+    path = os.path.join(directory, filename)
+    if rotation == "size":
+        return logging.handlers.RotatingFileHandler(
+            path, maxBytes=int(max_mb * 1024 * 1024), backupCount=backup_count, encoding="utf-8", delay=True)
+    return logging.handlers.TimedRotatingFileHandler(
+        path, when=rotation, backupCount=backup_count, encoding="utf-8", delay=True, utc=True)
+
+
+class LogPipeline:
+    """
+    Root logging setup: callers only run the level check, the rate-limit filter and a queue put; a
+    QueueListener thread formats each record (JSON for logs/bot.log, plain text for the console) and
+    does the file I/O and rotation.
+    """
+
+    def __init__(self, directory: str = DEFAULT_LOG_DIRECTORY, level: str = "INFO", rotation: str = "size",
+                 max_mb: float = 50, backup_count: int = 10, rate: float = 20.0, burst: int = 50,
+                 queue_size: int = DEFAULT_QUEUE_SIZE, console: bool = True, filename: str = "bot.log"):
+        os.makedirs(directory, exist_ok=True)
+        file_handler = _file_handler(directory, filename, rotation, max_mb, backup_count)
+        file_handler.setFormatter(JsonFormatter())
+        handlers = [file_handler]
+        if console:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+            handlers.append(console_handler)
+
+        self.queue = queue.Queue(queue_size)
+        self.rate_limit = RateLimitFilter(rate, burst)
+        self.handler = NonBlockingQueueHandler(self.queue)
+        self.handler.addFilter(self.rate_limit)
+        self.listener = logging.handlers.QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.level = level
+
+    @classmethod
+    def from_config(cls, config, filename: str = "bot.log") -> "LogPipeline":
+        """Each process needs its own filename: rotating handlers can't share a file across processes."""
+        return cls(
+            filename=filename,
+            directory=config.get("log_directory", DEFAULT_LOG_DIRECTORY),
+            level=config.get("log_level", "INFO"),
+            rotation=config.get("log_rotation", "size"),
+            max_mb=config.get("log_max_mb", 50),
+            backup_count=config.get("log_backup_count", 10),
+            rate=config.get("log_rate_limit", 20),
+            burst=config.get("log_rate_burst", 50),
+        )
+
+    def start(self) -> "LogPipeline":
+        """Replaces the root handlers with the queue handler and starts the writer thread."""
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        self.listener.start()
+        return self
+
+    def configure(self, config) -> None:
+        """Applies log_level, log_rate_limit and log_rate_burst from a reloaded config."""
+        self.level = config.get("log_level", "INFO")
+        logging.getLogger().setLevel(self.level)
+        self.rate_limit.rate = config.get("log_rate_limit", 20)
+        self.rate_limit.burst = config.get("log_rate_burst", 50)
+
+    def stop(self) -> None:
+        """Flushes queued records and stops the writer thread (call before exit)."""
+        self.listener.stop()
+        logging.getLogger().removeHandler(self.handler)
+        for handler in self.listener.handlers:
+            handler.close()
@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Default latency buckets (seconds) covering sub-millisecond DB calls up to slow downloads
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+# Finer buckets for lock waits and SQLite statements, which should stay in the millisecond range
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, labelvalues, extra=()) -> str:
+    pairs = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(labelnames, labelvalues)]
+    pairs.extend(f'{name}="{_escape_label_value(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base class for a labelled metric rendered in Prometheus text format."""
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._mutex = threading.Lock() # Metrics are touched from the event loop and from worker threads
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self) -> None:
+        """Drops every labelled series (used by collectors that rebuild a gauge on each scrape)."""
+        with self._mutex:
+            self._values.clear()
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._mutex:
+            items = list(self._values.items())
+        for labelvalues, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._mutex:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._mutex:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._mutex:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._mutex:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0] # bucket counts, sum, count
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Context manager that observes the wall time spent inside the block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._mutex:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for labelvalues, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, labelvalues, extra=(("le", _format_value(float(bound))),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Holds every metric plus async collectors that refresh gauges right before a scrape."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector) -> None:
+        """Adds an async callable (no arguments) that is awaited before every render."""
+        self._collectors.append(collector)
+
+    async def collect(self) -> str:
+        for collector in self._collectors:
+            try:
+                await collector()
+            except Exception as e:
+                logger.error(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+        return self.render()
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- Metric definitions ---
+QUEUE_DEPTH_STATUSES = ('pending', 'retrying', 'downloading', 'uploading')
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "assetfetch_queue_depth", "Number of active tasks (pending, retrying, downloading, uploading) by status, priority and group.",
+    ("status", "priority", "group_id")))
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "assetfetch_stage_duration_seconds", "Time spent in each task processing stage (fetch, parse, download, upload, shorten).",
+    ("stage",)))
+DB_LOCK_WAIT = REGISTRY.register(Histogram(
+    "assetfetch_db_lock_wait_seconds", "Time spent waiting to acquire Database._lock.", ("op",), FAST_BUCKETS))
+DB_LOCK_HOLD = REGISTRY.register(Histogram(
+    "assetfetch_db_lock_hold_seconds", "Time Database._lock was held per call.", ("op",), FAST_BUCKETS))
+DB_STATEMENT_LATENCY = REGISTRY.register(Histogram(
+    "assetfetch_db_statement_seconds", "SQLite statement latency including commit.", ("op",), FAST_BUCKETS))
+TELEGRAM_API_CALLS = REGISTRY.register(Counter(
+    "assetfetch_telegram_api_calls_total", "Telegram Bot API calls by method and HTTP status code.",
+    ("method", "code")))
+TELEGRAM_API_RATE_LIMITED = REGISTRY.register(Counter(
+    "assetfetch_telegram_api_429_total", "Telegram Bot API calls rejected with 429 Too Many Requests.", ("method",)))
+EVENT_LOOP_LAG = REGISTRY.register(Histogram(
+    "assetfetch_event_loop_lag_seconds", "Delay between a scheduled wake-up and the loop actually running it.",
+    (), FAST_BUCKETS))
+EVENT_LOOP_LAG_LAST = REGISTRY.register(Gauge(
+    "assetfetch_event_loop_lag_last_seconds", "Most recent event-loop lag sample."))
+DOWNLOAD_STORAGE_BYTES = REGISTRY.register(Gauge(
+    "assetfetch_download_storage_bytes", "Download directory accounting: used, reserved and budget bytes.",
+    ("kind",)))
+DOWNLOADS_WAITING_FOR_SPACE = REGISTRY.register(Gauge(
+    "assetfetch_downloads_waiting_for_space", "Downloads held back until the download directory has room."))
+DOWNLOAD_EVICTIONS = REGISTRY.register(Counter(
+    "assetfetch_download_evictions_total", "Uploaded files deleted from the download directory to make room."))
+CIRCUIT_BREAKER_STATE = REGISTRY.register(Gauge(
+    "assetfetch_circuit_breaker_state", "Per-domain circuit breaker: 0 closed, 1 half-open, 2 open.", ("domain",)))
+TASK_RETRIES = REGISTRY.register(Counter(
+    "assetfetch_task_retries_total", "Failed attempts by outcome: scheduled (backoff), deferred (open breaker), postponed (network down) or failed.",
+    ("outcome",)))
+NETWORK_UP = REGISTRY.register(Gauge(
+    "assetfetch_network_up", "1 while the connectivity monitor considers the network up, 0 during an outage."))
+NETWORK_OUTAGES = REGISTRY.register(Counter(
+    "assetfetch_network_outages_total", "Transitions of the connectivity monitor from up to down."))
+DRIVE_UPLOADS = REGISTRY.register(Counter(
+    "assetfetch_drive_uploads_total", "Files sent to Drive by outcome: uploaded, or deduplicated (identical content already there).",
+    ("outcome",)))
+DRIVE_BYTES_SAVED = REGISTRY.register(Counter(
+    "assetfetch_drive_dedup_bytes_total", "Bytes not uploaded to Drive because identical content was already there."))
+DRIVE_PURGED = REGISTRY.register(Counter(
+    "assetfetch_drive_purged_total", "Expired Drive files by purge outcome: deleted, failed (kept for the next run) or abandoned (max attempts reached).",
+    ("outcome",)))
+DRIVE_PURGE_ABANDONED = REGISTRY.register(Gauge(
+    "assetfetch_drive_purge_abandoned", "Expired Drive files the purge gave up on; they stay on Drive until removed by hand."))
+ADMISSION_REJECTED = REGISTRY.register(Counter(
+    "assetfetch_admission_rejected_total", "Links turned away before queueing, by the cap they hit: user, group or queue.",
+    ("reason",)))
+JOB_RUNS = REGISTRY.register(Counter(
+    "assetfetch_job_runs_total", "Maintenance job runs by outcome: ok, failed or timeout (cancelled at max runtime).",
+    ("job", "outcome")))
+JOB_DURATION = REGISTRY.register(Histogram(
+    "assetfetch_job_duration_seconds", "Wall time of each maintenance job run.", ("job",),
+    (0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 300.0, 900.0, 1800.0, 3600.0)))
+LOG_RECORDS_DROPPED = REGISTRY.register(Counter(
+    "assetfetch_log_records_dropped_total", "Log records not written: rate_limited (per call site) or queue_full.",
+    ("reason",)))
+
+
+async def collect_queue_depth(db) -> None:
+    """Refreshes QUEUE_DEPTH from the tasks table (runs once per scrape, not per message). Only active
+    statuses are counted: finished tasks would grow the series with history, and the IN list lets the
+    scan use idx_tasks_status_task instead of reading the whole table."""
+    placeholders = ", ".join("?" for _ in QUEUE_DEPTH_STATUSES)
+    rows = await db.fetchall(
+        f"SELECT status, priority, group_id, COUNT(*) FROM tasks WHERE status IN ({placeholders}) "
+        "GROUP BY status, priority, group_id",
+        QUEUE_DEPTH_STATUSES
+    )
+    QUEUE_DEPTH.clear()
+    for status, priority, group_id, count in rows:
+        QUEUE_DEPTH.set(count, status=status, priority=priority, group_id=group_id)
+
+
+async def monitor_event_loop_lag(interval: float = 0.5) -> None:
+    """Samples how late the event loop wakes up from a fixed sleep; runs until cancelled."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - expected)
+        EVENT_LOOP_LAG.observe(lag)
+        EVENT_LOOP_LAG_LAST.set(lag)
+
+
+async def _handle_scrape(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # Drain headers; the scrape request has no body we care about
+        while True:
+            header = await asyncio.wait_for(reader.readline(), timeout=5)
+            if header in (b"\r\n", b"\n", b""):
+                break
+
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/metrics", "/"):
+            body = (await REGISTRY.collect()).encode("utf-8")
+            status, content_type = "200 OK", "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, status, content_type = b"Not Found\n", "404 Not Found", "text/plain"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+            + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError) as e:
+        logger.debug(f"Metrics scrape connection dropped: {e}")
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host: str = "127.0.0.1", port: int = 9464) -> asyncio.AbstractServer:
+    """Starts the Prometheus scrape endpoint on host:port and returns the server."""
+    server = await asyncio.start_server(_handle_scrape, host, port)
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# TCP endpoints probed for connectivity ("host:port"); any one answering counts as online
+DEFAULT_TARGETS = ("1.1.1.1:443", "1.0.0.1:443", "8.8.8.8:53")
+
+
+def _parse_target(target: str):
+    host, _, port = target.rpartition(":")
+    return host, int(port)
+
+
+class NetworkMonitor:
+    """
+    Connectivity signal for the worker pipeline, from TCP connects to well-known anycast addresses.
+
+    Hysteresis: `down_after` consecutive failed probes mark the network down, `up_after` consecutive
+    successful ones mark it up again. While up, probes run every `interval` seconds; while down (or
+    after check() was called for a stage's network error), every `fast_interval` seconds, so an outage is noticed
+    within a couple of seconds and work resumes as soon as it ends. Stages call `await wait_online()`
+    before starting I/O; it returns immediately while the network is up and otherwise blocks on an
+    Event that is set the moment the monitor flips back to up.
+    """
+
+    def __init__(self, targets=DEFAULT_TARGETS, interval: float = 5, fast_interval: float = 1, timeout: float = 2,
+                 down_after: int = 2, up_after: int = 2):
+        self.targets = [_parse_target(target) for target in targets]
+        self.interval = interval
+        self.fast_interval = fast_interval
+        self.timeout = timeout
+        self.down_after = down_after
+        self.up_after = up_after
+        self.online = True # Assume up until probes say otherwise
+        self.changed_at = time.time()
+        self._failures = 0
+        self._successes = 0
+        self._online_event = asyncio.Event()
+        self._online_event.set()
+        self._wake = asyncio.Event()
+        self._listeners = []
+        metrics.NETWORK_UP.set(1)
+
+    @classmethod
+    def from_config(cls, config) -> "NetworkMonitor":
+        return cls(
+            targets=config.get("network_check_targets", DEFAULT_TARGETS),
+            interval=config.get("network_check_interval", 5),
+            timeout=config.get("network_check_timeout", 2),
+        )
+
+    def subscribe(self, listener) -> None:
+        """Calls listener(online) on every up/down transition."""
+        self._listeners.append(listener)
+
+    async def _connect(self, host: str, port: int) -> bool:
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        return True
+
+    async def probe(self) -> bool:
+        """True as soon as any target accepts a TCP connection; False if none does within timeout."""
+        if not self.targets:
+            return True # network_check_targets = [] turns the monitor off
+        pending = [asyncio.create_task(self._connect(host, port)) for host, port in self.targets]
+        try:
+            for finished in asyncio.as_completed(pending):
+                if await finished:
+                    return True
+            return False
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _set_online(self, online: bool) -> None:
+        if online == self.online:
+            return
+        downtime = time.time() - self.changed_at
+        self.online = online
+        self.changed_at = time.time()
+        metrics.NETWORK_UP.set(1 if online else 0)
+        if online:
+            self._online_event.set()
+            logger.warning(f"Network is back after {downtime:.0f}s; resuming downloads and uploads.")
+        else:
+            self._online_event.clear()
+            metrics.NETWORK_OUTAGES.inc()
+            logger.warning("Network is down; downloads and uploads are paused until it returns.")
+        for listener in self._listeners:
+            try:
+                listener(online)
+            except Exception as e:
+                logger.error(f"Network listener failed: {e}", exc_info=True)
+
+    def record_probe(self, ok: bool) -> None:
+        """Applies one probe result through the hysteresis counters."""
+        if ok:
+            self._successes += 1
+            self._failures = 0
+            if not self.online and self._successes >= self.up_after:
+                self._set_online(True)
+        else:
+            self._failures += 1
+            self._successes = 0
+            if self.online and self._failures >= self.down_after:
+                self._set_online(False)
+
+    async def check(self) -> bool:
+        """Probes right now (a stage just hit a network error) and returns whether the network is reachable."""
+        ok = await self.probe()
+        self.record_probe(ok)
+        self._wake.set() # Keep probing at the fast interval from here
+        return ok
+
+    async def wait_online(self) -> None:
+        """Returns once the network is up (immediately if it already is)."""
+        if self.online:
+            return
+        with metrics.STAGE_LATENCY.time(stage="network_wait"):
+            await self._online_event.wait()
+
+    async def run(self) -> None:
+        """Probes until cancelled."""
+        while True:
+            self._wake.clear()
+            try:
+                self.record_probe(await self.probe())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Network probe error: {e}", exc_info=True)
+            # Probe quickly while down, or while a failure streak is building up
+            delay = self.fast_interval if (not self.online or self._failures) else self.interval
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
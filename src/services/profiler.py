@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DURATION = 30
+MAX_DURATION = 300
+SAMPLE_INTERVAL = 0.005 # 200 stack samples/s of the event-loop thread
+MAX_STACK_DEPTH = 64 # Frames walked per sample; deeper frames are left out of the cumulative counts
+HEARTBEAT_INTERVAL = 0.01
+BLOCK_THRESHOLD = 0.1 # Loop stalls at least this long are reported as blocks
+BLOCK_STACK_DEPTH = 3 # Innermost frames shown per block
+TOP_N = 10
+MAX_REPORT_CHARS = 4000 # Telegram messages are capped at 4096 characters
+IDLE_FILES = ("selectors.py",) # Leaf frame while the loop waits for I/O
+LOOP_PLUMBING = os.sep + "asyncio" + os.sep # Event-loop frames under every busy sample, left out of the cumulative list
+
+
+def _describe(code) -> str:
+    """pstats-style location of a code object: dir/file.py:line(function)."""
+    path = "/".join(code.co_filename.split(os.sep)[-2:])
+    return f"{path}:{code.co_firstlineno}({getattr(code, 'co_qualname', code.co_name)})"
+
+
+def _is_plumbing(code) -> bool:
+    return LOOP_PLUMBING in code.co_filename or code.co_name == "<module>"
+
+
+def _coroutine_name(task) -> str:
+    coro = task.get_coro()
+    return getattr(coro, "__qualname__", None) or type(coro).__name__
+
+
+class _Sampler:
+    """
+    Runs on its own thread for one profile. Every interval it takes the event-loop thread's current
+    frame from sys._current_frames() and counts the code objects on its stack (formatted only for the
+    report). A heartbeat coroutine on the loop stamps _beat every HEARTBEAT_INTERVAL; a sample that finds
+    the stamp older than block_threshold is inside a loop block and its stack is charged to that block.
+    """
+
+    def __init__(self, thread_id: int, interval: float, block_threshold: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.samples = 0
+        self.idle = 0
+        self.self_counts = Counter() # code -> samples with code as the innermost frame
+        self.total_counts = Counter() # code -> samples with code anywhere on the stack
+        self.blocks = [] # (seconds, innermost codes)
+        self.max_tasks = 0
+        self.cpu_seconds = 0.0 # This thread's own CPU time, i.e. the sampling overhead
+        self._beat = time.monotonic()
+        self._block = None # [beat it started after, last stalled sample, Counter of stacks]
+        self._stop = threading.Event()
+
+    async def heartbeat(self) -> None:
+        beats = 0
+        while True:
+            self._beat = time.monotonic()
+            beats += 1
+            if beats % 100 == 0: # About once a second; all_tasks() is O(tasks)
+                self.max_tasks = max(self.max_tasks, len(asyncio.all_tasks()))
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run(self) -> None:
+        try:
+            while not self._stop.wait(self.interval):
+                self._sample()
+            self._close_block()
+        finally:
+            self.cpu_seconds = time.thread_time()
+
+    def _sample(self) -> None:
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        now = time.monotonic()
+        codes = []
+        while frame is not None and len(codes) < MAX_STACK_DEPTH:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        self.samples += 1
+        if codes[0].co_filename.endswith(IDLE_FILES):
+            self.idle += 1
+        else:
+            self.self_counts[codes[0]] += 1
+            self.total_counts.update(set(codes)) # Once per sample, however often a function recurses
+
+        beat = self._beat
+        stalled = now - beat > self.block_threshold + HEARTBEAT_INTERVAL
+        if self._block is not None and (not stalled or beat != self._block[0]):
+            self._close_block()
+        if stalled:
+            if self._block is None:
+                self._block = [beat, now, Counter()]
+            self._block[1] = now
+            self._block[2][tuple(codes[:BLOCK_STACK_DEPTH])] += 1
+
+    def _close_block(self) -> None:
+        if self._block is None:
+            return
+        beat, last_seen, stacks = self._block
+        self.blocks.append((last_seen - beat - HEARTBEAT_INTERVAL, stacks.most_common(1)[0][0]))
+        self._block = None
+
+
+class Profiler:
+    """
+    On-demand profile of the running bot, for the /profile admin command: sampling CPU profile of the
+    event-loop thread, tracemalloc allocation sites, asyncio task counts and the longest event-loop
+    blocks, over a window of at most MAX_DURATION seconds.
+
+    Overhead is bounded and nothing is instrumented: the sampler is a separate thread that reads the
+    loop thread's stack 1 / sample_interval times per second, and its own CPU time is reported. tracemalloc
+    (optional; it slows allocations down while on) traces one frame per allocation and is stopped
+    afterwards unless it was already running. Only one profile runs at a time.
+    """
+
+    def __init__(self, sample_interval: float = SAMPLE_INTERVAL, block_threshold: float = BLOCK_THRESHOLD):
+        self.sample_interval = sample_interval
+        self.block_threshold = block_threshold
+        self.running = False
+
+    async def profile(self, seconds: float = DEFAULT_DURATION, trace_memory: bool = True) -> dict:
+        """Profiles for seconds (clamped to 1..MAX_DURATION) and returns the report for format_report()."""
+        if self.running:
+            raise RuntimeError("A profile is already running")
+        self.running = True
+        seconds = min(max(seconds, 1), MAX_DURATION)
+        started_tracing = False
+        memory = None
+        sampler = _Sampler(threading.get_ident(), self.sample_interval, self.block_threshold)
+        thread = threading.Thread(target=sampler.run, name="profiler", daemon=True)
+        heartbeat = None
+        try:
+            tasks_at_start = len(asyncio.all_tasks())
+            if trace_memory:
+                if tracemalloc.is_tracing():
+                    tracemalloc.reset_peak()
+                else:
+                    tracemalloc.start(1)
+                    started_tracing = True
+                before = tracemalloc.take_snapshot()
+            started = time.monotonic()
+            heartbeat = asyncio.create_task(sampler.heartbeat())
+            thread.start()
+            await asyncio.sleep(seconds)
+            elapsed = time.monotonic() - started
+            if trace_memory:
+                memory = self._memory_report(before)
+        finally:
+            sampler.stop()
+            if heartbeat is not None:
+                heartbeat.cancel()
+            if thread.is_alive():
+                thread.join()
+            if started_tracing:
+                tracemalloc.stop()
+            self.running = False
+
+        tasks = [task for task in asyncio.all_tasks() if task not in (heartbeat, asyncio.current_task())]
+        return {
+            "seconds": elapsed,
+            "samples": sampler.samples,
+            "idle_samples": sampler.idle,
+            "sampler_cpu_seconds": sampler.cpu_seconds,
+            "top_self": [(_describe(code), count) for code, count in sampler.self_counts.most_common(TOP_N)],
+            "top_total": [
+                (_describe(code), count)
+                for code, count in sampler.total_counts.most_common() if not _is_plumbing(code)
+            ][:TOP_N],
+            "blocks": [
+                (duration, [_describe(code) for code in codes])
+                for duration, codes in sorted(sampler.blocks, key=lambda block: block[0], reverse=True)[:TOP_N]
+            ],
+            "block_count": len(sampler.blocks),
+            "tasks": {
+                "start": tasks_at_start, "end": len(tasks), "max": max(sampler.max_tasks, tasks_at_start, len(tasks)),
+                "by_coroutine": Counter(_coroutine_name(task) for task in tasks).most_common(TOP_N),
+            },
+            "memory": memory,
+        }
+
+    def _memory_report(self, before) -> dict:
+        """Allocation sites that grew most since the before snapshot, plus the traced peak."""
+        _, peak = tracemalloc.get_traced_memory()
+        ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+        after = tracemalloc.take_snapshot().filter_traces(ignore)
+        growth = [stat for stat in after.compare_to(before.filter_traces(ignore), "lineno") if stat.size_diff > 0]
+        return {
+            "peak_bytes": peak,
+            "top": [
+                (f"{'/'.join(stat.traceback[0].filename.split(os.sep)[-2:])}:{stat.traceback[0].lineno}",
+                 stat.size_diff, stat.count_diff)
+                for stat in growth[:TOP_N]
+            ],
+        }
+
+
+def format_report(report: dict) -> str:
+    """Compact plain-text report that fits in one Telegram message."""
+    samples = report["samples"] or 1
+    busy = report["samples"] - report["idle_samples"]
+    lines = [
+        f"Profile of {report['seconds']:.0f}s: {report['samples']} samples, loop busy {busy / samples:.0%} "
+        f"(sampler used {report['sampler_cpu_seconds'] * 1000:.0f} ms CPU)",
+        "",
+        "Top functions (self):",
+    ]
+    lines.extend(f"{count / samples:6.1%} {name}" for name, count in report["top_self"])
+    lines.extend(["", "Top functions (cumulative):"])
+    lines.extend(f"{count / samples:6.1%} {name}" for name, count in report["top_total"])
+
+    tasks = report["tasks"]
+    lines.extend(["", f"asyncio tasks: {tasks['start']} at start, {tasks['end']} at end, {tasks['max']} max"])
+    lines.extend(f"{count:6d} {name}" for name, count in tasks["by_coroutine"])
+
+    lines.extend(["", f"Event-loop blocks over {BLOCK_THRESHOLD * 1000:.0f} ms: {report['block_count']}"])
+    for duration, frames in report["blocks"]:
+        lines.append(f"{duration * 1000:6.0f} ms {' <- '.join(frames)}")
+
+    memory = report["memory"]
+    if memory is not None:
+        lines.extend(["", f"Allocations (traced peak {memory['peak_bytes'] / 1048576:.1f} MiB), growth by site:"])
+        lines.extend(f"{size / 1024:8.1f} KiB {count:+7d} {site}" for site, size, count in memory["top"])
+
+    text = "\n".join(lines)
+    return text if len(text) <= MAX_REPORT_CHARS else text[:MAX_REPORT_CHARS - 2] + "\n…"
@@ -0,0 +1,272 @@
+import logging
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+_MIN_CAPACITY = 1024
+
+
+class _Fenwick:
+    """Binary indexed tree over positions 0..capacity-1 supporting point updates and prefix sums in O(log n)."""
+
+    def __init__(self, capacity: int, values=None):
+        self.capacity = capacity
+        self._tree = [0] * (capacity + 1)
+        if values:
+            # O(n) construction from {position: value}
+            for position, value in values.items():
+                self._tree[position + 1] += value
+            for i in range(1, capacity + 1):
+                parent = i + (i & -i)
+                if parent <= capacity:
+                    self._tree[parent] += self._tree[i]
+
+    def add(self, position: int, delta) -> None:
+        i = position + 1
+        while i <= self.capacity:
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix(self, position: int):
+        """Sum of values at positions [0, position)."""
+        total = 0
+        i = min(position, self.capacity)
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+
+class QueueIndex:
+    """
+    In-memory order-statistics index of pending tasks in dispatch order (priority DESC, task_id ASC).
+
+    Each priority level keeps two Fenwick trees over slots: one counting tasks and one summing their
+    expected processing time. position() and eta_seconds() are therefore O(log n) instead of a COUNT(*)
+    over the pending rows. Slots are dense ranks in task_id order, so the trees are sized by the number
+    of pending tasks, not by the span of their ids. New tasks (higher ids) take the next free slot; an
+    older task coming back (retry, recovery) or running out of slots marks the index stale, and the next
+    query re-ranks the live tasks once in O(n log n), however many tasks came back in between.
+    Expected time per task comes from a per-domain exponential moving average of observed processing
+    times. Pending tasks are also indexed by group and by user, which is what admission control counts against.
+    """
+
+    def __init__(self, workers: int = 1, alpha: float = 0.2, default_seconds: float = 60.0):
+        self.workers = max(1, workers)
+        self.alpha = alpha
+        self.default_seconds = default_seconds
+        self._avg_seconds = {} # domain -> EWMA of processing seconds
+        self._tasks = {} # task_id -> (priority, weight, group_id, user_id)
+        self._by_user = {} # user_id -> {task_id}
+        self._by_group = {} # group_id -> {task_id}
+        self._slots = {} # task_id -> slot; ascending with task_id
+        self._next_slot = 0
+        self._last_id = None # Highest task_id given a slot since the last re-rank
+        self._capacity = 0
+        self._stale = False # Some tasks have no slot yet; the next query re-ranks
+        self._counts = {} # priority -> _Fenwick of task counts
+        self._weights = {} # priority -> _Fenwick of expected seconds
+        self._totals = {} # priority -> [count, weight]
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def __contains__(self, task_id) -> bool:
+        return task_id in self._tasks
+
+    # --- Processing-time averages ---
+
+    def expected_seconds(self, domain: str) -> float:
+        return self._avg_seconds.get(domain, self.default_seconds)
+
+    def record_duration(self, domain: str, seconds: float) -> None:
+        """Folds an observed processing time into the domain's moving average."""
+        previous = self._avg_seconds.get(domain)
+        self._avg_seconds[domain] = seconds if previous is None else previous + self.alpha * (seconds - previous)
+
+    # --- Index maintenance ---
+
+    def _rebuild(self) -> None:
+        """Re-ranks the live tasks into slots 0..n-1, with room for as many appends again."""
+        ids = sorted(self._tasks)
+        capacity = _MIN_CAPACITY
+        while capacity < 2 * len(ids):
+            capacity *= 2
+        self._capacity = capacity
+        self._slots = {task_id: slot for slot, task_id in enumerate(ids)}
+        self._next_slot = len(ids)
+        self._last_id = ids[-1] if ids else None
+        per_priority = {}
+        for task_id, slot in self._slots.items():
+            priority, weight, _, _ = self._tasks[task_id]
+            counts, weights = per_priority.setdefault(priority, ({}, {}))
+            counts[slot] = 1
+            weights[slot] = weight
+        self._counts = {p: _Fenwick(capacity, counts) for p, (counts, _) in per_priority.items()}
+        self._weights = {p: _Fenwick(capacity, weights) for p, (_, weights) in per_priority.items()}
+        self._stale = False
+
+    def add(self, task_id: int, priority: int = 0, domain: str = None, group_id: int = None, user_id: int = None) -> None:
+        """Adds a pending task (on enqueue, or when loading the queue at startup)."""
+        if task_id in self._tasks:
+            return
+        weight = self.expected_seconds(domain)
+        self._tasks[task_id] = (priority, weight, group_id, user_id)
+        if user_id is not None:
+            self._by_user.setdefault(user_id, set()).add(task_id)
+        if group_id is not None:
+            self._by_group.setdefault(group_id, set()).add(task_id)
+        totals = self._totals.setdefault(priority, [0, 0.0])
+        totals[0] += 1
+        totals[1] += weight
+
+        if self._stale or self._next_slot >= self._capacity or (self._last_id is not None and task_id < self._last_id):
+            self._stale = True # Out of slots, or an older id that must rank ahead of slotted ones
+            return
+        slot = self._slots[task_id] = self._next_slot
+        self._next_slot += 1
+        self._last_id = task_id
+        if priority not in self._counts:
+            self._counts[priority] = _Fenwick(self._capacity)
+            self._weights[priority] = _Fenwick(self._capacity)
+        self._counts[priority].add(slot, 1)
+        self._weights[priority].add(slot, weight)
+
+    def add_many(self, tasks) -> None:
+        """Adds (task_id, priority, domain, group_id, user_id) tuples, e.g. a batch of retries or recovered
+        tasks. Older ids among them cost one re-rank at the next query, not one each."""
+        for task_id, priority, domain, group_id, user_id in tasks:
+            self.add(task_id, priority, domain, group_id=group_id, user_id=user_id)
+
+    def remove(self, task_id: int) -> bool:
+        """Removes a task that was claimed by a worker or cancelled. Returns False if it wasn't pending."""
+        entry = self._tasks.pop(task_id, None)
+        if entry is None:
+            return False
+        priority, weight, group_id, user_id = entry
+        slot = self._slots.pop(task_id, None)
+        if slot is not None: # Not yet slotted if it was added while the index was stale
+            self._counts[priority].add(slot, -1)
+            self._weights[priority].add(slot, -weight)
+        totals = self._totals[priority]
+        totals[0] -= 1
+        totals[1] -= weight
+        for index, key in ((self._by_user, user_id), (self._by_group, group_id)):
+            tasks = index.get(key)
+            if tasks:
+                tasks.discard(task_id)
+                if not tasks:
+                    del index[key]
+        return True
+
+    def remove_group(self, group_id: int) -> int:
+        """Drops every pending task of a group (queue reset)."""
+        task_ids = list(self._by_group.get(group_id, ()))
+        for task_id in task_ids:
+            self.remove(task_id)
+        return len(task_ids)
+
+    # --- Queries ---
+
+    def _ahead(self, task_id: int):
+        """(tasks, expected seconds) queued ahead of task_id."""
+        if self._stale:
+            self._rebuild()
+        priority = self._tasks[task_id][0]
+        count = weight = 0
+        for other, (other_count, other_weight) in self._totals.items():
+            if other > priority:
+                count += other_count
+                weight += other_weight
+        slot = self._slots[task_id]
+        count += self._counts[priority].prefix(slot)
+        weight += self._weights[priority].prefix(slot)
+        return count, weight
+
+    def position(self, task_id: int):
+        """1-based queue position of a pending task, or None if it isn't pending."""
+        if task_id not in self._tasks:
+            return None
+        return self._ahead(task_id)[0] + 1
+
+    def eta_seconds(self, task_id: int, ahead: int = None):
+        """Estimated seconds until the task completes, or None if it isn't pending. With ahead (tasks the
+        dispatcher runs first, e.g. FairScheduler.dispatches_ahead), that many average tasks are counted
+        instead of the tasks ahead of it in priority order."""
+        if task_id not in self._tasks:
+            return None
+        if ahead is None:
+            _, work_ahead = self._ahead(task_id)
+        else:
+            count = sum(totals[0] for totals in self._totals.values())
+            work_ahead = ahead * sum(totals[1] for totals in self._totals.values()) / count
+        return work_ahead / self.workers + self._tasks[task_id][1]
+
+    def user_tasks(self, user_id: int) -> list:
+        """Pending task ids of a user, oldest first."""
+        return sorted(self._by_user.get(user_id, ()))
+
+    def user_count(self, user_id: int) -> int:
+        return len(self._by_user.get(user_id, ()))
+
+    def group_count(self, group_id: int) -> int:
+        return len(self._by_group.get(group_id, ()))
+
+    def next_dispatch_seconds(self, user_id: int = None, group_id: int = None) -> float:
+        """
+        Estimated seconds until a worker picks up the user's (or the group's) first pending task, or any
+        pending task when neither is given: the work queued ahead of it plus one average task for the
+        workers busy right now. O(k + log n) for a user or group with k pending tasks.
+        """
+        count = sum(totals[0] for totals in self._totals.values())
+        if not count:
+            return 0.0
+        average = sum(totals[1] for totals in self._totals.values()) / count
+        task_ids = self._by_user.get(user_id, ()) if user_id is not None else self._by_group.get(group_id, ())
+        ahead = 0.0
+        if task_ids:
+            first = min(task_ids, key=lambda task_id: (-self._tasks[task_id][0], task_id))
+            ahead = self._ahead(first)[1]
+        return (ahead + average) / self.workers
+
+    async def load(self, db) -> None:
+        """Rebuilds the index from the pending rows in the database (startup)."""
+        rows = await db.fetchall("SELECT task_id, priority, original_link, group_id, user_id FROM tasks WHERE status = 'pending'")
+        self._tasks.clear()
+        self._by_user.clear()
+        self._by_group.clear()
+        self._totals.clear()
+        for task_id, priority, link, group_id, user_id in rows:
+            domain = urlparse(link or "").netloc.lower()
+            self._tasks[task_id] = (priority or 0, self.expected_seconds(domain), group_id, user_id)
+            if user_id is not None:
+                self._by_user.setdefault(user_id, set()).add(task_id)
+            if group_id is not None:
+                self._by_group.setdefault(group_id, set()).add(task_id)
+            totals = self._totals.setdefault(priority or 0, [0, 0.0])
+            totals[0] += 1
+            totals[1] += self._tasks[task_id][1]
+        self._rebuild()
+        logger.info(f"Queue index loaded with {len(rows)} pending tasks.")
+
+
+def queue_estimate(queue_index: QueueIndex, scheduler, task_id: int):
+    """(1-based position, ETA seconds) of a pending task, or (None, None). With a FairScheduler the position
+    is its deficit round-robin estimate across groups and plans; without one, dispatch follows priority order."""
+    ahead = scheduler.dispatches_ahead(task_id) if scheduler is not None else None
+    if ahead is None:
+        return queue_index.position(task_id), queue_index.eta_seconds(task_id)
+    if task_id not in queue_index:
+        return ahead + 1, None
+    return ahead + 1, queue_index.eta_seconds(task_id, ahead)
+
+
+def format_eta(seconds: float) -> str:
+    """Human-friendly ETA such as '~45 s', '~12 min' or '~2 h 5 min'."""
+    seconds = max(0, int(seconds))
+    if seconds < 60:
+        return f"~{seconds} s"
+    minutes = round(seconds / 60)
+    if minutes < 60:
+        return f"~{minutes} min"
+    return f"~{minutes // 60} h {minutes % 60} min"
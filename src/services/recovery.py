@@ -0,0 +1,257 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from persistence.db import Database
+from services.lazy_import import lazy_import
+
+logger = logging.getLogger(__name__)
+
+INTERRUPTED_STATUSES = ('downloading', 'uploading')
+DRIVE_CREDENTIALS_PATH = "config/credentials/gdrive1.json"
+
+# The Google client stack is heavy; only crash recovery with interrupted uploads needs it
+service_account = lazy_import("google.oauth2.service_account")
+discovery = lazy_import("googleapiclient.discovery")
+
+# Verification outcomes
+UPLOADED = 'uploaded' # Already on Drive: the upload finished but the status update was lost
+VERIFIED = 'verified' # Local file complete; re-queued and keeps local_filepath, so the worker skips straight to the upload
+PARTIAL = 'partial' # Missing, truncated or corrupt; partial file removed, re-queued from scratch
+
+
+def file_checksum(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verify_local_file(path: str, expected_size: int = None, checksum: str = None) -> bool:
+    """True if the file exists and matches the recorded size and checksum. A file with neither recorded
+    can't be shown to be complete, so it counts as unverified."""
+    if not path or not os.path.isfile(path):
+        return False
+    if expected_size is None and not checksum:
+        return False
+    if expected_size is not None and os.path.getsize(path) != expected_size:
+        return False # Cheap check first; only hash files of the right size
+    return not checksum or file_checksum(path) == checksum
+
+
+def make_drive_lookup(folder_id: str, credentials_path: str = DRIVE_CREDENTIALS_PATH):
+    """Returns a blocking lookup(names) -> {name: (file id, webViewLink, credential file name)} over the Drive
+    upload folder, or None if
+    Drive isn't configured. One files.list call answers a whole batch of names. The Drive client is built
+    by the first lookup (on a recovery thread), not at startup."""
+    if not folder_id or folder_id == "YOUR_GOOGLE_DRIVE_FOLDER_ID" or not os.path.exists(credentials_path):
+        return None
+    services = []
+    service_lock = threading.Lock()
+    credentials_name = os.path.basename(credentials_path) # DriveClient.name, as recorded in the ledger
+
+    def drive_service():
+        with service_lock:
+            if not services:
+                credentials = service_account.Credentials.from_service_account_file(
+                    credentials_path, scopes=["https://www.googleapis.com/auth/drive.metadata.readonly"]
+                )
+                services.append(discovery.build("drive", "v3", credentials=credentials, cache_discovery=False))
+            return services[0]
+
+    def lookup(names):
+        service = drive_service()
+        quoted = [name.replace("\\", "\\\\").replace("'", "\\'") for name in names]
+        name_filter = " or ".join(f"name = '{name}'" for name in quoted)
+        query = f"'{folder_id}' in parents and trashed = false and ({name_filter})"
+        found, page_token = {}, None
+        while True:
+            response = service.files().list(
+                q=query, fields="nextPageToken, files(id, name, webViewLink)", pageSize=1000, pageToken=page_token
+            ).execute()
+            for item in response.get("files", []):
+                found.setdefault(item["name"], (item["id"], item.get("webViewLink"), credentials_name))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return found
+
+    return lookup
+
+
+def _drive_name(row):
+    """The task's file name on Drive: drive_name, or the local name for uploads from before it was recorded."""
+    return row[10] or (os.path.basename(row[6]) if row[6] else None)
+
+
+class CrashRecovery:
+    """
+    Startup phase that resumes tasks left in downloading/uploading by a crash or restart.
+
+    Interrupted tasks are read through idx_tasks_status_task in task_id order. Every local file is
+    verified (size, then SHA-256) on a thread pool, and Drive is asked about the uploaded file names in
+    batches of drive_batch_size, all concurrently. Results are then consumed in task_id order, and each
+    task is re-queued (database, FairScheduler, QueueIndex) as soon as it and every task before it are
+    verified, so the worker can start on the oldest recovered tasks while later files are still hashing.
+    Only tasks that reached 'uploading' are looked up on Drive.
+    """
+
+    def __init__(self, db: Database, scheduler=None, queue_index=None, timeline=None, drive_lookup=None,
+                 max_workers: int = 8, drive_batch_size: int = 50, storage=None, owner: str = None, live_owners=None):
+        self.db = db
+        self.scheduler = scheduler
+        self.queue_index = queue_index
+        self.timeline = timeline
+        self.drive_lookup = drive_lookup
+        self.max_workers = max_workers
+        self.drive_batch_size = drive_batch_size
+        self.storage = storage
+        self.owner = owner # Only recover tasks claimed by this worker (None: every interrupted task)
+        # With an owner: also adopt tasks claimed by anyone not in live_owners (e.g. a retired worker slot)
+        self.live_owners = tuple(live_owners) if live_owners else None
+        self.last_results = {}
+
+    async def _fetch_interrupted(self):
+        placeholders = ", ".join("?" * len(INTERRUPTED_STATUSES))
+        params = list(INTERRUPTED_STATUSES)
+        owner_filter = ""
+        if self.owner is not None:
+            owner_filter = "AND (claimed_by = ? "
+            params.append(self.owner)
+            if self.live_owners:
+                owner_filter += f"OR claimed_by IS NULL OR claimed_by NOT IN ({', '.join('?' * len(self.live_owners))}) "
+                params.extend(self.live_owners)
+            owner_filter += ") "
+        return await self.db.fetchall(
+            f"SELECT task_id, group_id, user_id, original_link, priority, status, local_filepath, expected_size, checksum, "
+            f"(julianday('now') - julianday(created_at)) * 86400, drive_name "
+            f"FROM tasks WHERE status IN ({placeholders}) {owner_filter}ORDER BY task_id",
+            params
+        )
+
+    async def _requeue(self, rows, outcomes) -> None:
+        """Writes one run of consecutive verified tasks, then makes them visible to the worker."""
+        drive_rows = [(row, found) for row, (outcome, found) in zip(rows, outcomes) if outcome == UPLOADED]
+        verified = [(row[0],) for row, (outcome, _) in zip(rows, outcomes) if outcome == VERIFIED]
+        partial = [(row[0],) for row, (outcome, _) in zip(rows, outcomes) if outcome == PARTIAL]
+        if drive_rows:
+            # Enter the file in the Drive ledger as DriveUploader would have, so retention purges it and
+            # deduplication finds it; together with the task update or not at all
+            await self.db.transaction([
+                ("UPDATE tasks SET status = 'completed', gdrive_link = ?, completed_at = CURRENT_TIMESTAMP WHERE task_id = ?",
+                 [(link, row[0]) for row, (_, link, _) in drive_rows]),
+                ("INSERT INTO drive_files (checksum, drive_file_id, drive_link, name, size, credentials) VALUES (?, ?, ?, ?, ?, ?) "
+                 "ON CONFLICT (checksum) DO UPDATE SET drive_file_id = excluded.drive_file_id, drive_link = excluded.drive_link, "
+                 "name = excluded.name, size = excluded.size, credentials = excluded.credentials, uploaded_at = CURRENT_TIMESTAMP",
+                 [(row[8], file_id, link, _drive_name(row), row[7], credentials)
+                  for row, (file_id, link, credentials) in drive_rows if row[8]]),
+                ("INSERT OR IGNORE INTO uploads (drive_file_id, credentials, checksum, task_id, size) VALUES (?, ?, ?, ?, ?)",
+                 [(file_id, credentials, row[8], row[0], row[7]) for row, (file_id, _, credentials) in drive_rows]),
+            ])
+        if verified:
+            await self.db.executemany("UPDATE tasks SET status = 'pending' WHERE task_id = ?", verified)
+        if partial:
+            await self.db.executemany(
+                "UPDATE tasks SET status = 'pending', local_filepath = NULL, checksum = NULL WHERE task_id = ?", partial
+            )
+
+        requeued = [] # For QueueIndex.add_many: these are older than everything queued since, so one re-rank
+        for row, (outcome, _) in zip(rows, outcomes):
+            task_id, group_id, user_id, link, priority, _, path, _, _, waited, _ = row
+            domain = urlparse(link or "").netloc.lower()
+            if path and self.storage is not None:
+                self.storage.forget(path + ".part") # Deleted by _check_local
+                if outcome == PARTIAL:
+                    self.storage.forget(path)
+                elif outcome == UPLOADED:
+                    self.storage.mark_uploaded(task_id, path)
+            if outcome == UPLOADED:
+                if self.timeline is not None:
+                    self.timeline.record(task_id, 'completed', domain=domain)
+                continue
+            if self.scheduler is not None:
+                self.scheduler.add(task_id, group_id, priority or 0, max(0.0, waited or 0.0))
+            requeued.append((task_id, priority or 0, domain, group_id, user_id))
+            if self.timeline is not None:
+                self.timeline.record(task_id, 'pending', domain=domain)
+        if self.queue_index is not None:
+            self.queue_index.add_many(requeued)
+
+    def _check_local(self, row):
+        _, _, _, _, _, _, path, expected_size, checksum, _, _ = row
+        if path and os.path.isfile(path + ".part"):
+            os.remove(path + ".part") # Left by a crash mid-transfer; download_asset only renames complete files
+        if verify_local_file(path, expected_size, checksum):
+            return True
+        if path and os.path.isfile(path):
+            os.remove(path) # Partial download; it will be fetched again
+        return False
+
+    async def run(self) -> dict:
+        """Recovers every interrupted task; returns counts per outcome."""
+        started = time.monotonic()
+        rows = await self._fetch_interrupted()
+        results = {UPLOADED: 0, VERIFIED: 0, PARTIAL: 0}
+        if not rows:
+            self.last_results = results
+            return results
+        logger.info(f"Recovering {len(rows)} interrupted tasks...")
+
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="recovery") as pool:
+            local_checks = [loop.run_in_executor(pool, self._check_local, row) for row in rows]
+
+            # One Drive query per batch of file names, submitted up front alongside the local checks
+            drive_batches = []
+            if self.drive_lookup:
+                for start in range(0, len(rows), self.drive_batch_size):
+                    names = [_drive_name(row) for row in rows[start:start + self.drive_batch_size]
+                             if _drive_name(row) and row[5] == 'uploading']
+                    drive_batches.append(loop.run_in_executor(pool, self.drive_lookup, names) if names else None)
+
+            ready_rows, ready_outcomes = [], []
+            for index, row in enumerate(rows):
+                drive_links = {}
+                batch = drive_batches[index // self.drive_batch_size] if drive_batches else None
+                if batch is not None:
+                    try:
+                        drive_links = await batch
+                    except Exception as e:
+                        logger.warning(f"Drive lookup failed during recovery, treating files as not uploaded: {e}")
+                try:
+                    local_ok = await local_checks[index]
+                except Exception as e:
+                    logger.warning(f"Could not verify local file for task {row[0]}: {e}")
+                    local_ok = False
+
+                name = _drive_name(row)
+                if row[5] == 'uploading' and name in drive_links:
+                    outcome = (UPLOADED, drive_links[name])
+                else:
+                    outcome = (VERIFIED if local_ok else PARTIAL, None)
+                results[outcome[0]] += 1
+                ready_rows.append(row)
+                ready_outcomes.append(outcome)
+
+                # Flush the run of in-order results once the next task is still being checked
+                following = index + 1
+                next_batch = drive_batches[following // self.drive_batch_size] if drive_batches and following < len(rows) else None
+                next_pending = following < len(rows) and (
+                    not local_checks[following].done() or (next_batch is not None and not next_batch.done())
+                )
+                if next_pending or index + 1 == len(rows):
+                    await self._requeue(ready_rows, ready_outcomes)
+                    ready_rows, ready_outcomes = [], []
+
+        self.last_results = results
+        logger.info(
+            f"Recovered {len(rows)} interrupted tasks in {time.monotonic() - started:.2f}s: "
+            f"{results[UPLOADED]} already on Drive, {results[VERIFIED]} with complete files, {results[PARTIAL]} restarted."
+        )
+        return results
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from typing import NamedTuple
+
+from persistence.db import Database
+
+logger = logging.getLogger(__name__)
+
+
+class GroupState(NamedTuple):
+    is_approved: bool
+    is_active: bool
+    is_paused: bool
+    plan: str
+
+
+class ReferenceData:
+    """
+    In-memory copy of the groups and blocked_domains tables of the reference database.
+
+    The queue and the reference data are separate files, so SQL can't join them. Queue-side code
+    (the worker's plan lookup, the blocked-domain check) asks this cache instead; that is a dict lookup
+    per task, not a query. Triggers bump reference_revision on every change; refresh() reads that one
+    row and reloads both tables only when it has moved. The bot refreshes right after an admin command
+    writes, and worker processes poll with run(). Plan-change listeners (the FairScheduler) are called
+    for every group whose plan differs from the previous load, including every group on the first load.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        self.revision = None
+        self._groups = {} # group_id -> GroupState
+        self._blocked = {} # group_id -> frozenset of blocked domains
+        self._plan_listeners = []
+
+    def on_plan_change(self, callback) -> None:
+        """callback(group_id, plan), called synchronously after a load."""
+        self._plan_listeners.append(callback)
+
+    async def load(self) -> None:
+        row = await self.db.fetchone("SELECT revision FROM reference_revision")
+        groups = await self.db.fetchall("SELECT group_id, is_approved, is_active, is_paused, subscription_plan FROM groups")
+        blocked = {}
+        for group_id, domain in await self.db.fetchall("SELECT group_id, domain FROM blocked_domains"):
+            blocked.setdefault(group_id, set()).add(domain)
+
+        previous = self._groups
+        self._groups = {
+            group_id: GroupState(bool(approved), bool(active), bool(paused), plan or 'default')
+            for group_id, approved, active, paused, plan in groups
+        }
+        self._blocked = {group_id: frozenset(domains) for group_id, domains in blocked.items()}
+        self.revision = row[0] if row else 0
+        for group_id in previous.keys() | self._groups.keys():
+            plan = self.group_plan(group_id)
+            old = previous.get(group_id)
+            if old is None or old.plan != plan:
+                for callback in self._plan_listeners:
+                    callback(group_id, plan)
+        logger.debug("Reference data loaded (revision %s): %s groups.", self.revision, len(self._groups))
+
+    async def refresh(self) -> bool:
+        """Reloads if the reference database changed since the last load; returns whether it did."""
+        row = await self.db.fetchone("SELECT revision FROM reference_revision")
+        if row is not None and row[0] == self.revision:
+            return False
+        await self.load()
+        return True
+
+    def group(self, group_id: int):
+        """GroupState of a known group, else None."""
+        return self._groups.get(group_id)
+
+    def group_plan(self, group_id: int) -> str:
+        state = self._groups.get(group_id)
+        return state.plan if state is not None else 'default'
+
+    def is_blocked(self, group_id: int, domain: str) -> bool:
+        return domain in self._blocked.get(group_id, ())
+
+    async def run(self, interval: float = 2) -> None:
+        """Calls refresh() every interval seconds until cancelled (for processes that don't write it)."""
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Reference data refresh failed: {e}", exc_info=True)
+            await asyncio.sleep(interval)
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Relative width of a histogram bin; percentiles are accurate to about +/- 2.5%
+_BIN_GROWTH = 1.05
+_LOG_GROWTH = math.log(_BIN_GROWTH)
+_MIN_DURATION = 0.001 # Durations below 1 ms all land in bin 0
+
+TERMINAL_STAGES = ('completed', 'failed')
+
+
+def _bin_for(duration: float) -> int:
+    return max(0, int(math.log(max(duration, _MIN_DURATION) / _MIN_DURATION) / _LOG_GROWTH))
+
+
+def _bin_value(index: int) -> float:
+    # Geometric midpoint of the bin
+    return _MIN_DURATION * _BIN_GROWTH ** (index + 0.5)
+
+
+class TaskTimeline:
+    """
+    Append-only stage timeline for tasks plus sliding-window time-in-stage percentiles.
+
+    record() is synchronous and O(1): it buffers a row for the task_events table and folds the
+    duration of the stage that just ended into per-minute log histograms. flush() writes the
+    buffered rows with a single executemany, so the hot path never waits on SQLite.
+
+    Tasks in a non-terminal stage are tracked in _open until their next transition. Deleted tasks are
+    dropped with forget(), and entries whose stage started more than max_open_seconds ago are pruned,
+    so tasks that never finish can't grow it for the life of the process.
+    """
+
+    def __init__(self, db, window_seconds: int = 3600, bucket_seconds: int = 60, max_open_seconds: float = 86400):
+        self.db = db
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.max_open_seconds = max_open_seconds
+        self._pending_rows = []
+        self._open = {} # task_id -> (stage, mono_ns, domain, plan); oldest transition first
+        self._buckets = deque() # (bucket_start, {(dimension, key, stage): {bin: count}})
+
+    def record(self, task_id: int, stage: str, domain: str = None, plan: str = None, wall_ts: float = None) -> None:
+        """Records that task_id entered stage now (or at wall_ts, for transitions reported by a worker process)."""
+        now_ns = time.monotonic_ns()
+        if wall_ts is None:
+            wall_ts = time.time()
+        else:
+            now_ns -= int((time.time() - wall_ts) * 1e9) # Same clock as local events, so durations line up
+        self._pending_rows.append((task_id, stage, now_ns, wall_ts))
+
+        previous = self._open.pop(task_id, None)
+        if previous:
+            prev_stage, prev_ns, prev_domain, prev_plan = previous
+            # Labels learnt later (e.g. the plan, resolved when the worker claims the task) also apply to earlier stages
+            domain = domain or prev_domain
+            plan = plan or prev_plan
+            self._observe(prev_stage, (now_ns - prev_ns) / 1e9, domain, plan)
+
+        if stage not in TERMINAL_STAGES:
+            self._open[task_id] = (stage, now_ns, domain, plan)
+        self._prune(now_ns)
+
+    def _prune(self, now_ns: int) -> None:
+        """Drops the oldest open entries past max_open_seconds. Every transition re-inserts its task at the
+        end of _open, so the dict is in transition order and only its head needs checking."""
+        cutoff = now_ns - int(self.max_open_seconds * 1e9)
+        while self._open:
+            task_id, entry = next(iter(self._open.items()))
+            if entry[1] >= cutoff:
+                break
+            del self._open[task_id]
+
+    def forget(self, task_ids) -> None:
+        """Stops tracking tasks that were deleted (e.g. by /reset_queue) before reaching a terminal stage."""
+        for task_id in task_ids:
+            self._open.pop(task_id, None)
+
+    def _current_bucket(self) -> dict:
+        now = time.monotonic()
+        bucket_start = now - (now % self.bucket_seconds)
+        if not self._buckets or self._buckets[-1][0] != bucket_start:
+            self._buckets.append((bucket_start, {}))
+        while self._buckets and self._buckets[0][0] <= now - self.window_seconds:
+            self._buckets.popleft()
+        return self._buckets[-1][1]
+
+    def _observe(self, stage: str, duration: float, domain: str, plan: str) -> None:
+        bucket = self._current_bucket()
+        index = _bin_for(duration)
+        for dimension, key in (('domain', domain or 'unknown'), ('plan', plan or 'unknown')):
+            histogram = bucket.setdefault((dimension, key, stage), {})
+            histogram[index] = histogram.get(index, 0) + 1
+
+    def percentiles(self, dimension: str = 'domain', window_seconds: int = None, quantiles=(0.5, 0.95, 0.99)) -> dict:
+        """
+        Returns {(key, stage): {'count': n, 'p50': s, 'p95': s, 'p99': s}} for the last window_seconds.
+        Cost is proportional to the number of live buckets and bins, never to task history.
+        """
+        if window_seconds is None:
+            window_seconds = self.window_seconds
+        if window_seconds <= 0:
+            raise ValueError(f"window_seconds must be positive, got {window_seconds!r}")
+        window_seconds = min(window_seconds, self.window_seconds)
+        cutoff = time.monotonic() - window_seconds
+        merged = {}
+        for bucket_start, bucket in self._buckets:
+            if bucket_start + self.bucket_seconds <= cutoff:
+                continue
+            for (dim, key, stage), histogram in bucket.items():
+                if dim != dimension:
+                    continue
+                target = merged.setdefault((key, stage), {})
+                for index, count in histogram.items():
+                    target[index] = target.get(index, 0) + count
+
+        result = {}
+        for series, histogram in merged.items():
+            total = sum(histogram.values())
+            stats = {'count': total}
+            ordered = sorted(histogram.items())
+            for q in quantiles:
+                rank = max(1, math.ceil(q * total))
+                seen = 0
+                for index, count in ordered:
+                    seen += count
+                    if seen >= rank:
+                        stats[f"p{int(q * 100)}"] = _bin_value(index)
+                        break
+            result[series] = stats
+        return result
+
+    async def flush(self) -> int:
+        """Writes buffered events to task_events; returns the number of rows written."""
+        if not self._pending_rows:
+            return 0
+        rows, self._pending_rows = self._pending_rows, []
+        try:
+            await self.db.executemany(
+                "INSERT INTO task_events (task_id, stage, mono_ns, wall_ts) VALUES (?, ?, ?, ?)",
+                rows
+            )
+        except Exception as e:
+            logger.error(f"Failed to flush {len(rows)} task events: {e}")
+            self._pending_rows[:0] = rows # Keep them for the next attempt
+            return 0
+        return len(rows)
+
+    async def run_flusher(self, interval: float = 1.0) -> None:
+        """Flushes buffered events every interval seconds until cancelled."""
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                await self.flush()
+        except asyncio.CancelledError:
+            await self.flush()
+            raise
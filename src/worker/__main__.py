@@ -0,0 +1,7 @@
+"""python -m worker: runs task workers against the shared queue (see worker/runner.py)."""
+import sys
+
+from worker.runner import main
+
+if __name__ == "__main__":
+    sys.exit(main())
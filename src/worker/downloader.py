@@ -0,0 +1,120 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+from urllib.parse import unquote, urlparse
+
+from persistence.db import Database
+from services.download_storage import DownloadStorage
+from services.lazy_import import lazy_import
+
+logger = logging.getLogger(__name__)
+
+requests = lazy_import("requests")
+
+CHUNK_SIZE = 1024 * 1024
+_UNSAFE_FILENAME_CHARS = re.compile(r'[^A-Za-z0-9._-]+')
+
+
+class DownloadTooLarge(Exception):
+    """The response grew past the space reserved for it."""
+
+
+def _filename(task_id: int, url: str, response) -> str:
+    """task_id-prefixed name from Content-Disposition or the URL path, safe for the local filesystem."""
+    name = None
+    disposition = response.headers.get("Content-Disposition", "")
+    match = re.search(r'filename\*?=(?:UTF-8\'\')?"?([^";]+)"?', disposition)
+    if match:
+        name = unquote(match.group(1))
+    if not name:
+        name = unquote(os.path.basename(urlparse(url).path))
+    name = _UNSAFE_FILENAME_CHARS.sub("_", name).strip("._") or "asset"
+    return f"{task_id}_{name}"
+
+
+def display_name(task_id: int, path: str) -> str:
+    """The downloaded file's name without the task_id_ prefix _filename adds (for Drive and Telegram)."""
+    name = os.path.basename(path)
+    prefix = f"{task_id}_"
+    return name[len(prefix):] if name.startswith(prefix) and len(name) > len(prefix) else name
+
+
+def _expected_size(response):
+    length = response.headers.get("Content-Length")
+    return int(length) if length and length.isdigit() else None
+
+
+def _write_response(response, path: str, max_bytes: int):
+    """Streams the body to path (blocking; runs on a thread). Returns (size, sha256 hex)."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "wb") as f:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                raise DownloadTooLarge(f"Download exceeded the {max_bytes} bytes reserved for it")
+            digest.update(chunk)
+            f.write(chunk)
+    return size, digest.hexdigest()
+
+
+async def reusable_download(db: Database, task_id: int):
+    """
+    The task's download from an earlier attempt, if it finished and is still on disk: crash recovery keeps
+    verified files and a retryable upload failure keeps the file, so the retry can go straight to the upload.
+    Only the size is checked here (recovery has already hashed what it kept); like verify_local_file, a file
+    with neither a size nor a checksum recorded doesn't count as complete.
+    """
+    row = await db.fetchone("SELECT local_filepath, expected_size, checksum FROM tasks WHERE task_id = ?", (task_id,))
+    if not row or not row[0] or (row[1] is None and not row[2]):
+        return None
+    path, expected_size, _ = row
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return None # Evicted or deleted since
+    return path if expected_size is None or size == expected_size else None
+
+
+async def download_asset(db: Database, storage: DownloadStorage, task_id: int, url: str, timeout: float = 30) -> str:
+    """
+    Downloads url into the storage directory for a task and returns the local path.
+
+    Space for the Content-Length is reserved before the body is read. If it has to wait for room, the
+    response is closed and requested again once the reservation is granted, so no connection sits idle.
+    expected_size is stored before the transfer and checksum after it, for crash recovery.
+    """
+    response = await asyncio.to_thread(requests.get, url, stream=True, timeout=timeout)
+    response.raise_for_status()
+    expected_size = _expected_size(response)
+    path = os.path.join(storage.directory, _filename(task_id, url, response))
+    await db.execute(
+        "UPDATE tasks SET expected_size = ?, local_filepath = ?, checksum = NULL WHERE task_id = ?",
+        (expected_size, path, task_id)
+    )
+
+    reopen = storage.would_wait(expected_size)
+    if reopen:
+        response.close() # Don't hold the connection while waiting for room
+    reservation = await storage.reserve(expected_size)
+
+    part_path = path + ".part"
+    with reservation:
+        try:
+            if reopen:
+                response = await asyncio.to_thread(requests.get, url, stream=True, timeout=timeout)
+                response.raise_for_status()
+            size, checksum = await asyncio.to_thread(_write_response, response, part_path, reservation.size)
+            os.replace(part_path, path)
+        except BaseException:
+            response.close()
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        reservation.commit(path)
+
+    await db.execute("UPDATE tasks SET expected_size = ?, checksum = ? WHERE task_id = ?", (size, checksum, task_id))
+    logger.info(f"Downloaded {size} bytes for task {task_id} to {path}")
+    return path
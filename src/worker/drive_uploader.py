@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import os
+import threading
+
+from persistence.db import Database
+from services import metrics
+from services.lazy_import import lazy_import
+from services.recovery import file_checksum
+from worker.downloader import display_name
+from worker.retry_scheduler import RETRYABLE_HTTP_STATUSES, is_retryable
+
+logger = logging.getLogger(__name__)
+
+# The Google client stack is heavy; it is imported by the first upload, not at startup
+service_account = lazy_import("google.oauth2.service_account")
+discovery = lazy_import("googleapiclient.discovery")
+googleapiclient_http = lazy_import("googleapiclient.http")
+
+DRIVE_CREDENTIAL_PATHS = ("config/credentials/gdrive1.json", "config/credentials/gdrive2.json")
+DRIVE_SCOPES = ["https://www.googleapis.com/auth/drive"]
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024 # Resumable upload chunk (a multiple of 256 KiB)
+
+
+class DriveUploadError(Exception):
+    """Every credential file failed for a Drive call. retryable is True for 429/5xx and connection errors."""
+
+    def __init__(self, description: str, retryable: bool = False):
+        super().__init__(description)
+        self.retryable = retryable
+        self.retry_after = None
+
+
+def _http_status(error: Exception):
+    """HTTP status of a googleapiclient HttpError (its httplib2 response is `resp`), else None."""
+    return getattr(getattr(error, "resp", None), "status", None)
+
+
+class DriveClient:
+    """Blocking Drive v3 calls through one service-account credential file (run them on a thread).
+    The credentials are loaded on first use. Each thread builds its own client, because the underlying
+    httplib2 connection is not thread-safe."""
+
+    def __init__(self, credentials_path: str):
+        self.credentials_path = credentials_path
+        self.name = os.path.basename(credentials_path)
+        self._credentials = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def service(self):
+        service = getattr(self._local, "service", None)
+        if service is None:
+            with self._lock:
+                if self._credentials is None:
+                    self._credentials = service_account.Credentials.from_service_account_file(
+                        self.credentials_path, scopes=DRIVE_SCOPES)
+            service = self._local.service = discovery.build("drive", "v3", credentials=self._credentials, cache_discovery=False)
+        return service
+
+    def upload(self, path: str, name: str, folder_id: str):
+        """Resumable upload of path as name into folder_id, shared by link. Returns (file id, webViewLink)."""
+        media = googleapiclient_http.MediaFileUpload(path, resumable=True, chunksize=UPLOAD_CHUNK_SIZE)
+        request = self.service().files().create(
+            body={"name": name, "parents": [folder_id]}, media_body=media, fields="id, webViewLink"
+        )
+        response = None
+        while response is None:
+            _, response = request.next_chunk(num_retries=3)
+        self.service().permissions().create(fileId=response["id"], body={"type": "anyone", "role": "reader"}).execute()
+        return response["id"], response.get("webViewLink")
+
+    def exists(self, file_id: str) -> bool:
+        """True if the file is still on Drive and not trashed (one files.get, no folder listing)."""
+        try:
+            item = self.service().files().get(fileId=file_id, fields="id, trashed").execute()
+        except Exception as e:
+            if _http_status(e) == 404:
+                return False
+            raise
+        return not item.get("trashed")
+
+    def delete_many(self, file_ids) -> dict:
+        """Deletes files with one batch request (Drive takes up to 100 calls per batch). Returns
+        {file_id: None if deleted (or already gone), else the error}."""
+        results = {}
+
+        def record(request_id, response, exception):
+            results[request_id] = None if exception is None or _http_status(exception) == 404 else exception
+
+        service = self.service()
+        batch = service.new_batch_http_request(callback=record)
+        for file_id in file_ids:
+            batch.add(service.files().delete(fileId=file_id), request_id=file_id)
+        batch.execute()
+        return results
+
+
+class DriveUploader:
+    """
+    Uploads finished downloads to the Drive folder, at most once per content.
+
+    drive_files indexes every uploaded file by the SHA-256 the downloader computed. A download whose
+    checksum is already there is not uploaded again: it gets the existing file's link, even when it
+    came from a different URL or site. The indexed file is first checked with one files.get, and
+    uploaded again if it is missing. Drive file names are picked from the same table: a name already
+    in use becomes name_2.ext, name_3.ext, ... without listing the folder. Each upload is also entered in
+    the uploads ledger that DriveRetention purges from; reusing a file restarts its retention period.
+
+    The name is stored on the task (drive_name) before the upload starts, so crash recovery can find a
+    file whose upload finished but whose task update was lost. Calls go through the first credential
+    file that works. If one fails, the next is tried and stays active for later uploads.
+    """
+
+    def __init__(self, db: Database, clients, folder_id: str):
+        self.db = db
+        self.clients = list(clients)
+        self.folder_id = folder_id
+        self.active = 0 # Index of the credential file in use
+        self._names_in_flight = set() # Chosen but not yet in drive_files
+
+    @classmethod
+    def from_config(cls, db: Database, config, credential_paths=DRIVE_CREDENTIAL_PATHS):
+        """None when Drive isn't configured (no folder id or no credential files)."""
+        folder_id = config.get("google_drive_folder_id")
+        paths = [path for path in credential_paths if os.path.exists(path)]
+        if not folder_id or folder_id == "YOUR_GOOGLE_DRIVE_FOLDER_ID" or not paths:
+            return None
+        return cls(db, [DriveClient(path) for path in paths], folder_id)
+
+    def _client(self, name: str):
+        return next((client for client in self.clients if client.name == name), None)
+
+    async def _call(self, method: str, *args):
+        """Runs client.method(*args) on a thread with the active credentials, failing over to the others.
+        Returns (result, client)."""
+        errors = []
+        for offset in range(len(self.clients)):
+            index = (self.active + offset) % len(self.clients)
+            client = self.clients[index]
+            try:
+                result = await asyncio.to_thread(getattr(client, method), *args)
+            except Exception as e:
+                logger.warning(f"Drive {method} failed with {client.name}: {e}")
+                errors.append(e)
+                continue
+            if index != self.active:
+                logger.warning(f"Drive uploads switched to {client.name}.")
+                self.active = index
+            return result, client
+        retryable = any(_http_status(e) in RETRYABLE_HTTP_STATUSES or is_retryable(e) for e in errors)
+        raise DriveUploadError(f"Drive {method} failed with every credential file: {errors[-1]}", retryable) from errors[-1]
+
+    async def _unique_name(self, name: str) -> str:
+        stem, ext = os.path.splitext(name)
+        escaped = stem.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        rows = await self.db.fetchall(
+            "SELECT name FROM drive_files WHERE name = ? OR name LIKE ? ESCAPE '\\'", (name, f"{escaped}\\_%{ext}")
+        )
+        taken = {row[0] for row in rows} | self._names_in_flight
+        candidate, number = name, 2
+        while candidate in taken:
+            candidate = f"{stem}_{number}{ext}"
+            number += 1
+        if candidate != name:
+            logger.info(f"Drive already has a file named {name}; uploading as {candidate}.")
+        self._names_in_flight.add(candidate)
+        return candidate
+
+    async def find(self, checksum: str):
+        """Link of a live Drive file with this content, or None. Index entries for deleted files are dropped."""
+        row = await self.db.fetchone("SELECT drive_file_id, drive_link, credentials FROM drive_files WHERE checksum = ?", (checksum,))
+        if not row:
+            return None
+        file_id, link, credentials = row
+        # Restart its retention period; no row updated means the purge has already claimed it
+        cursor = await self.db.execute(
+            "UPDATE uploads SET uploaded_at = CURRENT_TIMESTAMP WHERE drive_file_id = ? AND purge_state IS NULL", (file_id,)
+        )
+        if not cursor.rowcount:
+            return None
+        client = self._client(credentials)
+        try:
+            alive = client is not None and await asyncio.to_thread(client.exists, file_id)
+        except Exception as e:
+            logger.warning(f"Could not check Drive file {file_id}, uploading again: {e}")
+            return None
+        if not alive:
+            logger.info(f"Drive file {file_id} for checksum {checksum[:12]} is gone; it will be uploaded again.")
+            await self.db.execute("DELETE FROM drive_files WHERE checksum = ?", (checksum,))
+            await self.db.execute("DELETE FROM uploads WHERE drive_file_id = ?", (file_id,))
+            return None
+        return link
+
+    async def upload(self, task: dict, path: str) -> str:
+        """Returns the Drive link for a task's download, uploading it only if its content isn't on Drive yet."""
+        row = await self.db.fetchone("SELECT checksum FROM tasks WHERE task_id = ?", (task['task_id'],))
+        checksum = (row[0] if row else None) or await asyncio.to_thread(file_checksum, path)
+        size = os.path.getsize(path)
+        link = await self.find(checksum)
+        if link is not None:
+            metrics.DRIVE_UPLOADS.inc(outcome="deduplicated")
+            metrics.DRIVE_BYTES_SAVED.inc(size)
+            logger.info("Task %s: identical file already on Drive, skipped the upload.", task['task_id'])
+            return link
+
+        name = await self._unique_name(display_name(task['task_id'], path))
+        try:
+            await self.db.execute("UPDATE tasks SET drive_name = ? WHERE task_id = ?", (name, task['task_id']))
+            (file_id, link), client = await self._call("upload", path, name, self.folder_id)
+            await self.db.execute(
+                "INSERT INTO drive_files (checksum, drive_file_id, drive_link, name, size, credentials) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (checksum) DO UPDATE SET drive_file_id = excluded.drive_file_id, drive_link = excluded.drive_link, "
+                "name = excluded.name, size = excluded.size, credentials = excluded.credentials, uploaded_at = CURRENT_TIMESTAMP",
+                (checksum, file_id, link, name, size, client.name)
+            )
+            await self.db.execute(
+                "INSERT OR IGNORE INTO uploads (drive_file_id, credentials, checksum, task_id, size) VALUES (?, ?, ?, ?, ?)",
+                (file_id, client.name, checksum, task['task_id'], size)
+            )
+        finally:
+            self._names_in_flight.discard(name)
+        metrics.DRIVE_UPLOADS.inc(outcome="uploaded")
+        logger.info("Task %s: uploaded %s bytes to Drive as %s.", task['task_id'], size, name)
+        return link
@@ -0,0 +1,245 @@
+import asyncio
+import heapq
+import logging
+import math
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+PLANS = ('default', '12h', 'free', 'file', '1sub')
+# Relative share of worker time per plan tier (config key "plan_weights" overrides these)
+DEFAULT_PLAN_WEIGHTS = {'default': 2, '12h': 3, 'free': 1, 'file': 4, '1sub': 3}
+DEFAULT_MAX_WAIT_SECONDS = 1800
+
+
+class FairScheduler:
+    """
+    In-memory dispatch order for pending tasks, replacing the global ORDER BY priority, created_at.
+
+    Every group has its own queue (priority DESC, then task_id ASC). Groups are grouped into tiers
+    by subscription plan. next_task() runs deficit round-robin across the non-empty tiers, each tier
+    earning its plan weight in credits per round (one task costs one credit), and plain round-robin
+    across the groups of the chosen tier, so a busy group only ever gets one turn per round of its tier.
+
+    Starvation guarantees: a non-empty tier is served at least once every ceil(1 / weight) rounds,
+    a group within it at least once per len(groups) turns of the tier, and any task that has waited
+    longer than max_wait_seconds is dispatched next regardless of tier or group.
+    """
+
+    def __init__(self, plan_weights: dict = None, max_wait_seconds: float = DEFAULT_MAX_WAIT_SECONDS):
+        self.configure(plan_weights, max_wait_seconds)
+        self._tasks = {} # task_id -> (group_id, enqueued_at monotonic)
+        self._group_queues = {} # group_id -> heap of (-priority, task_id); may hold removed ids
+        self._group_sizes = {} # group_id -> live tasks in the heap
+        self._group_plans = {} # group_id -> plan
+        self._tier_groups = {} # plan -> deque of group_ids with live tasks
+        self._active_tiers = deque() # plans with at least one non-empty group
+        self._deficit = {} # plan -> unspent credits
+        self._turn_started = False # Whether the tier at _active_tiers[0] got its credits this round
+        self._arrivals = deque() # task_ids in arrival order, for the max-wait check; may hold removed ids
+        self._available = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def __contains__(self, task_id) -> bool:
+        return task_id in self._tasks
+
+    def configure(self, plan_weights: dict = None, max_wait_seconds: float = DEFAULT_MAX_WAIT_SECONDS) -> None:
+        """Sets the plan weights (merged over the defaults) and max wait; also used on config reload."""
+        weights = dict(DEFAULT_PLAN_WEIGHTS)
+        weights.update(plan_weights or {})
+        for plan, weight in weights.items():
+            if not weight or weight <= 0:
+                raise ValueError(f"Plan weight for '{plan}' must be positive, got {weight!r}")
+        self.plan_weights = weights
+        self.max_wait_seconds = max_wait_seconds
+
+    def weight(self, plan: str) -> float:
+        return self.plan_weights.get(plan, self.plan_weights['default'])
+
+    # --- Tier bookkeeping ---
+
+    def _activate_group(self, group_id) -> None:
+        plan = self._group_plans.get(group_id, 'default')
+        groups = self._tier_groups.setdefault(plan, deque())
+        if not groups:
+            self._active_tiers.append(plan)
+        groups.append(group_id)
+
+    def _deactivate_group(self, group_id) -> None:
+        plan = self._group_plans.get(group_id, 'default')
+        groups = self._tier_groups.get(plan)
+        if groups is None or group_id not in groups:
+            return
+        groups.remove(group_id)
+        if not groups:
+            was_current = self._active_tiers and self._active_tiers[0] == plan
+            self._active_tiers.remove(plan)
+            self._deficit[plan] = 0 # DRR: an idle tier doesn't bank credits
+            if was_current:
+                self._turn_started = False
+
+    # --- Queue maintenance ---
+
+    def add(self, task_id: int, group_id: int, priority: int = 0, waited_seconds: float = 0.0) -> None:
+        """Queues a pending task (on enqueue, or when loading the queue at startup)."""
+        if task_id in self._tasks:
+            return
+        self._tasks[task_id] = (group_id, time.monotonic() - waited_seconds)
+        self._arrivals.append(task_id)
+        heapq.heappush(self._group_queues.setdefault(group_id, []), (-(priority or 0), task_id))
+        self._group_sizes[group_id] = self._group_sizes.get(group_id, 0) + 1
+        if self._group_sizes[group_id] == 1:
+            self._activate_group(group_id)
+        self._available.set()
+
+    def remove(self, task_id: int) -> bool:
+        """Forgets a task that was cancelled or deleted. Heap entries are dropped lazily."""
+        entry = self._tasks.pop(task_id, None)
+        if entry is None:
+            return False
+        group_id = entry[0]
+        self._group_sizes[group_id] -= 1
+        if not self._group_sizes[group_id]:
+            self._deactivate_group(group_id)
+            del self._group_sizes[group_id]
+            self._group_queues.pop(group_id, None)
+        return True
+
+    def remove_group(self, group_id: int) -> int:
+        """Drops every pending task of a group (queue reset)."""
+        heap = self._group_queues.get(group_id, [])
+        removed = sum(1 for _, task_id in list(heap) if self.remove(task_id))
+        return removed
+
+    def group_plan(self, group_id: int) -> str:
+        return self._group_plans.get(group_id, 'default')
+
+    def set_group_plan(self, group_id: int, plan: str) -> None:
+        """Moves a group (and its queued tasks) to another plan tier."""
+        if self._group_plans.get(group_id, 'default') == plan:
+            return
+        active = self._group_sizes.get(group_id, 0) > 0
+        if active:
+            self._deactivate_group(group_id)
+        self._group_plans[group_id] = plan
+        if active:
+            self._activate_group(group_id)
+
+    # --- Estimates ---
+
+    def dispatches_ahead(self, task_id: int):
+        """
+        Number of tasks next_task() hands out before task_id, or None if it isn't queued. Its group needs
+        one turn per task ahead of it in the group; the other groups of its tier get as many turns in the
+        meantime (one fewer for those after it in the rotation), and every other tier spends the credits
+        it earns over the tier turns that takes. Exact for the tasks queued now; later arrivals and tasks
+        jumping the queue after max_wait_seconds make it an estimate. O(tasks of the group + groups).
+        """
+        entry = self._tasks.get(task_id)
+        if entry is None:
+            return None
+        group_id = entry[0]
+        keys = {} # Live task_id -> its heap key; a re-added task may have a stale entry too
+        for key in self._group_queues[group_id]:
+            other = key[1]
+            if self._tasks.get(other, (None,))[0] == group_id and (other not in keys or key < keys[other]):
+                keys[other] = key
+        turns = 1 + sum(1 for key in keys.values() if key < keys[task_id])
+
+        plan = self.group_plan(group_id)
+        groups = self._tier_groups.get(plan, ())
+        position = list(groups).index(group_id)
+        tier_ahead = turns - 1 + sum(
+            min(self._group_sizes[other], turns if index < position else turns - 1)
+            for index, other in enumerate(groups) if other != group_id
+        )
+        # Turns the tier needs for that many dispatches, counting the credits it has banked (or, when it
+        # is being served right now, has left in this turn)
+        tiers = list(self._active_tiers)
+        tier_index = tiers.index(plan)
+        in_turn = self._turn_started # Applies to tiers[0]
+        missing = tier_ahead + 1 - self._deficit.get(plan, 0)
+        turns_needed = max(0, math.ceil(missing / self.weight(plan)))
+        if not (tier_index == 0 and in_turn):
+            turns_needed = max(1, turns_needed)
+        other_tiers = 0
+        for index, tier in enumerate(tiers):
+            if tier == plan:
+                continue
+            if tier_index == 0 and in_turn:
+                tier_turns = turns_needed # All of them come after the current turn
+            else:
+                tier_turns = turns_needed if index < tier_index else turns_needed - 1
+            if tier_turns <= 0:
+                continue
+            credits = self._deficit.get(tier, 0) + (tier_turns - (1 if index == 0 and in_turn else 0)) * self.weight(tier)
+            other_tiers += min(sum(self._group_sizes[other] for other in self._tier_groups[tier]), int(credits))
+        return tier_ahead + other_tiers
+
+    # --- Dispatch ---
+
+    def _pop_group(self, group_id) -> int:
+        heap = self._group_queues[group_id]
+        while True:
+            _, task_id = heapq.heappop(heap)
+            if task_id in self._tasks and self._tasks[task_id][0] == group_id:
+                self.remove(task_id)
+                return task_id
+
+    def _pop_overdue(self):
+        """The oldest task if it has waited longer than max_wait_seconds, else None."""
+        while self._arrivals and self._arrivals[0] not in self._tasks:
+            self._arrivals.popleft()
+        if not self._arrivals or not self.max_wait_seconds:
+            return None
+        task_id = self._arrivals[0]
+        if time.monotonic() - self._tasks[task_id][1] < self.max_wait_seconds:
+            return None
+        self._arrivals.popleft()
+        self.remove(task_id)
+        return task_id
+
+    def next_task(self):
+        """Removes and returns the task_id that should run next, or None if nothing is queued."""
+        overdue = self._pop_overdue()
+        if overdue is not None:
+            return overdue
+        while self._active_tiers:
+            plan = self._active_tiers[0]
+            if not self._turn_started:
+                self._deficit[plan] = self._deficit.get(plan, 0) + self.weight(plan)
+                self._turn_started = True
+            if self._deficit[plan] >= 1:
+                self._deficit[plan] -= 1
+                groups = self._tier_groups[plan]
+                group_id = groups[0]
+                groups.rotate(-1) # Next turn in this tier goes to the next group
+                return self._pop_group(group_id)
+            # Tier used up its credits for this round; leftover fractions carry over
+            self._active_tiers.rotate(-1)
+            self._turn_started = False
+        return None
+
+    async def wait(self, timeout: float) -> None:
+        """Sleeps until a task is queued or timeout seconds pass."""
+        if self._tasks:
+            return
+        self._available.clear()
+        try:
+            await asyncio.wait_for(self._available.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def load(self, db) -> None:
+        """Rebuilds the queues from the database (startup): pending tasks in id order. Group plans come from
+        ReferenceData (set_group_plan is one of its plan-change listeners); load it first."""
+        rows = await db.fetchall(
+            "SELECT task_id, group_id, priority, (julianday('now') - julianday(created_at)) * 86400 "
+            "FROM tasks WHERE status = 'pending' ORDER BY task_id"
+        )
+        for task_id, group_id, priority, waited in rows:
+            self.add(task_id, group_id, priority, max(0.0, waited or 0.0))
+        logger.info(f"Fair scheduler loaded with {len(rows)} pending tasks across {len(self._group_sizes)} groups.")
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import logging
+import time
+
+from persistence.db import Database
+from services.task_timeline import TERMINAL_STAGES
+
+logger = logging.getLogger(__name__)
+
+
+class TaskNotices:
+    """
+    Worker-process side of the task_notices table. Passed to start_worker_process in place of the
+    TaskTimeline: record() has the same signature and is just as cheap (it buffers), and flush()
+    writes the buffer with one executemany. Also a RetryScheduler breaker listener.
+    """
+
+    def __init__(self, db: Database, worker_id: str, flush_interval: float = 0.2):
+        self.db = db
+        self.worker_id = worker_id
+        self.flush_interval = flush_interval
+        self._pending_rows = []
+
+    def record(self, task_id: int, stage: str, domain: str = None, plan: str = None) -> None:
+        self._pending_rows.append((task_id, 'stage', stage, domain, plan, None, time.time(), self.worker_id))
+
+    def breaker_changed(self, breaker, groups) -> None:
+        payload = json.dumps({
+            "state": breaker.state, "failures": breaker.consecutive_failures,
+            "cooldown": breaker.cooldown, "groups": list(groups),
+        })
+        self._pending_rows.append((None, 'breaker', None, breaker.domain, None, payload, time.time(), self.worker_id))
+
+    async def flush(self) -> int:
+        if not self._pending_rows:
+            return 0
+        rows, self._pending_rows = self._pending_rows, []
+        try:
+            await self.db.executemany(
+                "INSERT INTO task_notices (task_id, kind, stage, domain, plan, payload, wall_ts, worker_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        except Exception as e:
+            self._pending_rows[:0] = rows # Keep them for the next attempt; the listener must see every final stage
+            logger.error(f"Failed to flush {len(rows)} task notices: {e}")
+            return 0
+        return len(rows)
+
+    async def run_flusher(self) -> None:
+        """Flushes every flush_interval seconds until cancelled (then flushes once more)."""
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+        finally:
+            await self.flush()
+
+
+class NoticeReader:
+    """
+    Listener side of task_notices: tails the table, applies each worker's stage transitions to the
+    listener's TaskTimeline, QueueIndex and FairScheduler as if the work had happened in-process, and
+    deletes what it has consumed. Listeners get (task_id, status) for finished tasks and
+    (domain, details) for circuit-breaker changes; a breaker change is only passed on once even when
+    several worker processes report it.
+    """
+
+    def __init__(self, db: Database, timeline=None, queue_index=None, scheduler=None, poll_interval: float = 0.25,
+                 batch_size: int = 500):
+        self.db = db
+        self.timeline = timeline
+        self.queue_index = queue_index
+        self.scheduler = scheduler
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._last_id = 0
+        self._started = {} # task_id -> wall_ts it was claimed, for queue_index durations
+        self._breaker_states = {} # domain -> last state passed on
+        self._finished_listeners = []
+        self._breaker_listeners = []
+
+    def on_finished(self, listener) -> None:
+        """listener(task_id, status) is awaited for every task a worker process completed or failed."""
+        self._finished_listeners.append(listener)
+
+    def on_breaker_change(self, listener) -> None:
+        """listener(domain, details) is called when a domain's circuit breaker opens or closes."""
+        self._breaker_listeners.append(listener)
+
+    async def _apply_stage(self, task_id, stage, domain, plan, wall_ts) -> None:
+        if self.timeline is not None:
+            self.timeline.record(task_id, stage, domain=domain, plan=plan, wall_ts=wall_ts)
+        if stage == 'downloading':
+            self._started[task_id] = wall_ts
+            if self.queue_index is not None:
+                self.queue_index.remove(task_id)
+            if self.scheduler is not None:
+                self.scheduler.remove(task_id) # The listener doesn't dispatch; keep its copy of the queue in step
+        elif stage == 'pending' and self.queue_index is not None:
+            # A retry came due in a worker process: it's back in the queue
+            row = await self.db.fetchone("SELECT group_id, user_id, priority FROM tasks WHERE task_id = ?", (task_id,))
+            if row:
+                self.queue_index.add(task_id, row[2] or 0, domain, group_id=row[0], user_id=row[1])
+        started = self._started.pop(task_id, None) if stage not in ('downloading', 'uploading') else None
+        if stage == 'completed' and started is not None and self.queue_index is not None:
+            self.queue_index.record_duration(domain, wall_ts - started)
+        if stage in TERMINAL_STAGES:
+            for listener in self._finished_listeners:
+                try:
+                    await listener(task_id, stage)
+                except Exception as e:
+                    logger.error(f"Task notice listener failed for task {task_id}: {e}", exc_info=True)
+
+    def _apply_breaker(self, domain, payload) -> None:
+        details = json.loads(payload or "{}")
+        if self._breaker_states.get(domain, 'closed') == details.get("state"):
+            return
+        self._breaker_states[domain] = details.get("state")
+        for listener in self._breaker_listeners:
+            try:
+                listener(domain, details)
+            except Exception as e:
+                logger.error(f"Breaker notice listener failed for {domain}: {e}", exc_info=True)
+
+    async def poll(self) -> int:
+        """Applies the next batch of notices; returns how many were consumed."""
+        rows = await self.db.fetchall(
+            "SELECT notice_id, task_id, kind, stage, domain, plan, payload, wall_ts FROM task_notices "
+            "WHERE notice_id > ? ORDER BY notice_id LIMIT ?",
+            (self._last_id, self.batch_size)
+        )
+        for notice_id, task_id, kind, stage, domain, plan, payload, wall_ts in rows:
+            if kind == 'stage':
+                await self._apply_stage(task_id, stage, domain, plan, wall_ts)
+            elif kind == 'breaker':
+                self._apply_breaker(domain, payload)
+            self._last_id = notice_id
+        if rows:
+            await self.db.execute("DELETE FROM task_notices WHERE notice_id <= ?", (self._last_id,))
+        return len(rows)
+
+    async def run(self) -> None:
+        """Polls until cancelled; drains backlogs without sleeping between batches."""
+        while True:
+            try:
+                if await self.poll() == self.batch_size:
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Task notice reader error: {e}", exc_info=True)
+            await asyncio.sleep(self.poll_interval)
@@ -1,19 +1,74 @@
 import asyncio
 import logging
 import json
+import os
+import time
+from urllib.parse import urlparse, urljoin
 from persistence.db import Database
+from services.metrics import STAGE_LATENCY
+from worker.downloader import download_asset, reusable_download
+from worker.retry_scheduler import is_retryable
+from worker.telegram_delivery import TelegramDeliveryError
+from worker.drive_uploader import DriveUploadError
+from services.config_watcher import DomainMatcher
+from services.lazy_import import lazy_import
+
+# Imported on first use so they don't slow down bot startup
+requests = lazy_import("requests")
+bs4 = lazy_import("bs4")
 
 logger = logging.getLogger(__name__)
 
-async def process_task(db: Database, task: dict, domains_config: dict, config: dict) -> None:
-    """Processes a single task from the queue."""
+# Next pending task with highest priority (also used by benchmarks/db_bench.py). The group's plan is in the
+# reference database, so it comes from ReferenceData rather than a join.
+DEQUEUE_QUERY = (
+    "SELECT task_id, group_id, user_id, original_link, status, priority, message_id "
+    "FROM tasks WHERE status = 'pending' ORDER BY priority DESC, created_at ASC LIMIT 1"
+)
+# Same columns for one task chosen by the FairScheduler
+TASK_QUERY = (
+    "SELECT task_id, group_id, user_id, original_link, status, priority, message_id FROM tasks WHERE task_id = ?"
+)
+
+async def fail_task(db: Database, task: dict, error_message: str, retries=None, domain: str = None, retryable: bool = False,
+                    network=None) -> str:
+    """Marks a task failed, or hands the failure to the RetryScheduler, which may schedule another attempt.
+    A retryable failure while the NetworkMonitor can't reach the internet is blamed on the outage, not
+    the site: the task is requeued without spending an attempt or counting towards the domain's breaker."""
+    if retryable and retries is not None and network is not None and not await network.check():
+        await retries.postpone(task)
+        return 'retrying'
+    if retries is not None and domain:
+        return await retries.record_failure(task, domain, error_message, retryable)
+    await db.execute("UPDATE tasks SET status = 'failed', error_message = ? WHERE task_id = ?", (error_message, task['task_id']))
+    return 'failed'
+
+
+def _release_download(storage, task_id: int, local_path: str, status: str) -> str:
+    """Lets the storage evict the download of a task that failed for good; a retrying task keeps it for the
+    next attempt. Returns status."""
+    if status == 'failed' and local_path and storage is not None:
+        storage.release(task_id, local_path)
+    return status
+
+
+async def process_task(db: Database, task: dict, domains_config: dict, config: dict, storage=None, matcher: DomainMatcher = None,
+                       retries=None, network=None, delivery=None, uploader=None, reference=None, on_stage=None) -> str:
+    """Processes a single task from the queue and returns its final status ('completed', 'failed' or 'retrying').
+    Fetch and download failures go through the RetryScheduler when one is given. With a NetworkMonitor,
+    each network stage waits for connectivity before it starts. With a TelegramDelivery, tasks on its
+    plans are sent to the group as a document (or re-sent from the file_id cache) when the file fits;
+    other downloads go to Drive through the DriveUploader, which skips content already uploaded.
+    Blocked domains are checked against ReferenceData when one is given. on_stage(stage) is called when the
+    task moves on to 'uploading'."""
     task_id = task['task_id']
     group_id = task['group_id']
     user_id = task['user_id']
     original_link = task['original_link']
     priority = task['priority']
+    local_path = None
 
-    logger.info(f"Processing task {task_id} for group {group_id}, user {user_id}: {original_link}")
+    logger.info("Processing task %s for group %s, user %s: %s", task_id, group_id, user_id, original_link)
 
     try:
         # 1. Parsing the original_link to identify the domain.
@@ -24,81 +79,188 @@ async def process_task(db: Database, task: dict, domains_config: dict, config: d
         if not domain:
             await db.execute("UPDATE tasks SET status = 'failed', error_message = 'Invalid URL: No domain found' WHERE task_id = ?", (task_id,))
             logger.warning(f"Task {task_id} failed: Invalid URL (no domain) - {original_link}")
-            return
+            return 'failed'
 
         # 2. Checking if the domain is supported and not blocked for the group.
-        allowed_domains = domains_config.get("allowed_domains", [])
-        if domain not in allowed_domains:
-            await db.execute("UPDATE tasks SET status = 'failed', error_message = f'Domain not supported: {domain}' WHERE task_id = ?", (task_id,))
+        if matcher is None:
+            matcher = DomainMatcher.from_config(domains_config)
+        allowed_domain = matcher.match(domain)
+        if allowed_domain is None:
+            await db.execute("UPDATE tasks SET status = 'failed', error_message = ? WHERE task_id = ?", (f'Domain not supported: {domain}', task_id))
             logger.warning(f"Task {task_id} failed: Domain '{domain}' not supported - {original_link}")
-            return
+            return 'failed'
 
         # Check if the domain is blocked for this group
-        is_blocked = await db.fetchone("SELECT 1 FROM blocked_domains WHERE group_id = ? AND domain = ?", (group_id, domain))
-        if is_blocked:
-            await db.execute("UPDATE tasks SET status = 'failed', error_message = f'Domain blocked in this group: {domain}' WHERE task_id = ?", (task_id,))
+        if reference is not None and reference.is_blocked(group_id, allowed_domain):
+            await db.execute("UPDATE tasks SET status = 'failed', error_message = ? WHERE task_id = ?", (f'Domain blocked in this group: {domain}', task_id))
             logger.warning(f"Task {task_id} failed: Domain '{domain}' blocked in group {group_id} - {original_link}")
-            return
+            return 'failed'
 
-        logger.info(f"Domain '{domain}' is supported and not blocked for group {group_id}.")
+        logger.debug("Domain '%s' is supported and not blocked for group %s.", domain, group_id)
 
         # 3. Using appropriate fetching logic based on the domain configuration.
         # Fetch the content of the link
-        import requests
-        from bs4 import BeautifulSoup
-
+        direct = delivery is not None and delivery.applies(task.get('plan'))
         try:
-            response = requests.get(original_link, timeout=10) # Add a timeout
-            response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            # TODO: Implement domain-specific parsing and extraction logic here
-            # Use domains_config to determine how to parse the page for the specific domain.
-            # Example: Extract all image URLs
-            # images = [img['src'] for img in soup.find_all('img', src=True)]
-            # logger.info(f"Found {len(images)} images on {original_link}")
-
-            # For now, just log the title and a snippet of the body
-            title = soup.title.string if soup.title else "No title found"
-            body_snippet = soup.body.get_text(separator=' ', strip=True)[:200] + "..." if soup.body else "No body found"
-            logger.info(f"Fetched content for {original_link}: Title='{title}', Snippet='{body_snippet}'")
-
-            # 4. Downloading assets. (TODO)
-            # 5. Uploading assets to Telegram (or storing them). (TODO)
+            # Asset already sent to Telegram once: re-send it by file_id, nothing to fetch or download
+            file_id = await delivery.cached_file_id(original_link) if direct else None
+            if file_id:
+                if network is not None:
+                    await network.wait_online()
+                with STAGE_LATENCY.time(stage="upload"):
+                    sent = await delivery.send_cached(task, file_id)
+                if sent:
+                    await db.execute("UPDATE tasks SET status = 'completed', completed_at = CURRENT_TIMESTAMP WHERE task_id = ?", (task_id,))
+                    logger.info("Task %s completed from the Telegram file cache.", task_id)
+                    return 'completed'
+
+            # A complete download kept from an earlier attempt (crash recovery, retryable upload failure)
+            # goes straight to the upload; fetching, parsing and downloading again would only overwrite it
+            local_path = await reusable_download(db, task_id) if storage is not None else None
+            if local_path:
+                logger.info("Task %s reuses its download %s.", task_id, local_path)
+            else:
+                if network is not None:
+                    await network.wait_online()
+                with STAGE_LATENCY.time(stage="fetch"):
+                    response = requests.get(original_link, timeout=10) # Add a timeout
+                    response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
+                with STAGE_LATENCY.time(stage="parse"):
+                    soup = bs4.BeautifulSoup(response.content, 'html.parser')
+
+                # TODO: Implement domain-specific parsing and extraction logic here
+                # Use domains_config to determine how to parse the page for the specific domain.
+                # Example: Extract all image URLs
+                # images = [img['src'] for img in soup.find_all('img', src=True)]
+                # logger.info(f"Found {len(images)} images on {original_link}")
+
+                # For now, just log the title and a snippet of the body
+                title = soup.title.string if soup.title else "No title found"
+                body_snippet = soup.body.get_text(separator=' ', strip=True)[:200] + "..." if soup.body else "No body found"
+                logger.debug("Fetched content for %s: Title='%s', Snippet='%s'", original_link, title, body_snippet)
+
+                # 4. Downloading assets. domains.json "download_selectors" maps a domain to the CSS selector of
+                # its download link; the DownloadStorage reserves space before the transfer starts.
+                selector = matcher.download_selectors.get(allowed_domain)
+                if selector and storage is not None:
+                    link = soup.select_one(selector)
+                    if link is None or not link.get('href'):
+                        raise ValueError(f"No download link matching '{selector}' on {original_link}")
+                    if network is not None:
+                        await network.wait_online()
+                    with STAGE_LATENCY.time(stage="download"):
+                        local_path = await download_asset(db, storage, task_id, urljoin(original_link, link['href']))
+
+            # 5. Uploading assets. Direct-delivery plans get the file as a Telegram document when it fits
+            # the upload limit; everything else goes to Drive (shortening: TODO -> stage="shorten")
+            gdrive_link = None
+            if local_path and direct and delivery.applies(task.get('plan'), os.path.getsize(local_path)):
+                if on_stage is not None:
+                    on_stage('uploading')
+                if network is not None:
+                    await network.wait_online()
+                with STAGE_LATENCY.time(stage="upload"):
+                    await delivery.upload(task, local_path)
+            elif local_path and uploader is not None:
+                await db.execute("UPDATE tasks SET status = 'uploading' WHERE task_id = ?", (task_id,))
+                if on_stage is not None:
+                    on_stage('uploading')
+                if network is not None:
+                    await network.wait_online()
+                with STAGE_LATENCY.time(stage="upload"):
+                    gdrive_link = await uploader.upload(task, local_path)
             # 6. Updating task status in the database (e.g., 'completed', 'failed').
 
-            # Update task status to completed (placeholder)
-            await db.execute("UPDATE tasks SET status = 'completed', completed_at = CURRENT_TIMESTAMP WHERE task_id = ?", (task_id,))
-            logger.info(f"Task {task_id} completed.")
+            await db.execute(
+                "UPDATE tasks SET status = 'completed', completed_at = CURRENT_TIMESTAMP, gdrive_link = COALESCE(?, gdrive_link) WHERE task_id = ?",
+                (gdrive_link, task_id)
+            )
+            if local_path:
+                storage.mark_uploaded(task_id, local_path)
+            if retries is not None:
+                retries.record_success(allowed_domain)
+            logger.info("Task %s completed.", task_id)
+            return 'completed'
 
+        except (TelegramDeliveryError, DriveUploadError) as upload_e:
+            # The site did its part: Telegram's or Drive's answer doesn't count against the domain's breaker or attempts
+            error_message = f"Upload failed for task {task_id}: {upload_e}"
+            logger.error(error_message)
+            if retries is not None and upload_e.retryable:
+                # The download is kept; the next attempt uploads it without fetching it again
+                await retries.postpone(task, upload_e.retry_after or retries.policy.base_delay)
+                return 'retrying'
+            return _release_download(storage, task_id, local_path, await fail_task(db, task, error_message))
         except requests.exceptions.RequestException as req_e:
             error_message = f"HTTP/Network error fetching {original_link}: {req_e}"
             logger.error(error_message, exc_info=True)
-            await db.execute("UPDATE tasks SET status = 'failed', error_message = ? WHERE task_id = ?", (error_message, task_id,))
+            status = await fail_task(db, task, error_message, retries, allowed_domain, is_retryable(req_e), network)
+            return _release_download(storage, task_id, local_path, status)
         except Exception as e:
             error_message = f"Error during content fetching/parsing for task {task_id}: {e}"
             logger.error(error_message, exc_info=True)
-            # Update task status to failed
-            await db.execute("UPDATE tasks SET status = 'failed', error_message = ? WHERE task_id = ?", (error_message, task_id,))
+            status = await fail_task(db, task, error_message, retries, allowed_domain, is_retryable(e), network)
+            return _release_download(storage, task_id, local_path, status)
 
     except Exception as e:
         error_message = f"An unexpected error occurred during task processing for task {task_id}: {e}"
         logger.error(error_message, exc_info=True)
         # Update task status to failed
         await db.execute("UPDATE tasks SET status = 'failed', error_message = ? WHERE task_id = ?", (error_message, task_id,))
+        return _release_download(storage, task_id, local_path, 'failed')
+
+
+async def claim_scheduled_task(db: Database, scheduler, worker_id: str = "bot"):
+    """Takes the scheduler's next task and marks it 'downloading'. Tasks that are no longer pending in
+    the database (deleted by a queue reset, claimed elsewhere) are skipped. Returns a DEQUEUE_QUERY-shaped row or None."""
+    while True:
+        task_id = scheduler.next_task()
+        if task_id is None:
+            return None
+        cursor = await db.execute(
+            "UPDATE tasks SET status = 'downloading', claimed_by = ? WHERE task_id = ? AND status = 'pending'", (worker_id, task_id)
+        )
+        if cursor.rowcount:
+            return await db.fetchone(TASK_QUERY, (task_id,))
+        logger.debug("Task %s is no longer pending; skipping.", task_id) # Claimed by another worker process, or reset
 
 
-async def start_worker_process(db: Database, config: dict, domains_config: dict) -> None:
-    """Starts the worker process to consume tasks from the queue."""
+async def start_worker_process(db: Database, config: dict, domains_config: dict, timeline=None, queue_index=None, scheduler=None,
+                               storage=None, config_watcher=None, retries=None, network=None, on_finished=None,
+                               stop_event: asyncio.Event = None, worker_id: str = "bot", delivery=None, uploader=None,
+                               reference=None) -> None:
+    """Starts the worker process to consume tasks from the queue.
+    If a TaskTimeline is given, every stage transition is recorded on it; if a QueueIndex is given,
+    claimed tasks leave it and their processing time feeds its per-domain ETA averages. If a
+    FairScheduler is given it decides the dispatch order, otherwise DEQUEUE_QUERY does. Downloads
+    need a DownloadStorage. With a ConfigWatcher, each task uses the snapshot current when it was claimed.
+    With a RetryScheduler, failures are retried with backoff and tasks for a domain whose circuit breaker
+    is open are parked as 'retrying' instead of being dispatched. With a NetworkMonitor, no task is
+    claimed while the network is down; the loop wakes as soon as it comes back. on_finished(task_id, status)
+    is awaited after each completed or failed task. Setting stop_event stops the loop between tasks.
+    Claimed tasks are tagged with worker_id, so crash recovery can tell whose interrupted tasks are whose.
+    A TelegramDelivery and a DriveUploader are passed on to process_task. Each task's plan and the group's
+    blocked domains come from ReferenceData (without one, every group is on the default plan)."""
     logger.info("Worker process started.")
+    matcher = DomainMatcher.from_config(domains_config)
 
-    while True:
+    while stop_event is None or not stop_event.is_set():
+        if config_watcher is not None:
+            snapshot = config_watcher.current # One consistent snapshot per task, even if a reload lands mid-task
+            config, domains_config, matcher = snapshot.config, snapshot.domains, snapshot.domain_matcher
+        poll_interval = config.get("worker_poll_interval", 10) # Seconds to sleep when the queue is empty
         try:
-            # Fetch the next pending task with highest priority
+            if network is not None:
+                await network.wait_online() # Tasks stay queued (not claimed) during an outage
             # Statuses: 'pending', 'downloading', 'uploading', 'completed', 'failed', 'retrying'
-            task = await db.fetchone(
-                "SELECT task_id, group_id, user_id, original_link, status, priority FROM tasks WHERE status = 'pending' ORDER BY priority DESC, created_at ASC LIMIT 1"
-            )
+            if scheduler is not None:
+                task = await claim_scheduled_task(db, scheduler, worker_id) # Already marked 'downloading'
+            else:
+                # Fetch the next pending task with highest priority
+                task = await db.fetchone(DEQUEUE_QUERY)
+                if task:
+                    # Update status to downloading immediately
+                    await db.execute("UPDATE tasks SET status = 'downloading', claimed_by = ? WHERE task_id = ?", (worker_id, task[0]))
 
             if task:
                 task_dict = {
@@ -107,14 +269,49 @@ async def start_worker_process(db: Database, config: dict, domains_config: dict)
                     'user_id': task[2],
                     'original_link': task[3],
                     'status': task[4],
-                    'priority': task[5]
+                    'priority': task[5],
+                    'plan': reference.group_plan(task[1]) if reference is not None else 'default',
+                    'message_id': task[6]
                 }
-                # Update status to downloading immediately
-                await db.execute("UPDATE tasks SET status = 'downloading' WHERE task_id = ?", (task_dict['task_id'],))
-                await process_task(db, task_dict, domains_config, config)
+                domain = urlparse(task_dict['original_link']).netloc.lower()
+                if queue_index is not None:
+                    queue_index.remove(task_dict['task_id'])
+                breaker_domain = matcher.match(domain) if retries is not None else None
+                if breaker_domain and not retries.allow(breaker_domain):
+                    # Site is failing: park the task until its breaker half-opens, and move on to other sites
+                    await retries.defer(task_dict, breaker_domain)
+                    if timeline is not None:
+                        timeline.record(task_dict['task_id'], 'retrying', domain=domain, plan=task_dict['plan'])
+                    continue
+                if timeline is not None:
+                    timeline.record(task_dict['task_id'], 'downloading', domain=domain, plan=task_dict['plan'])
+                started_at = time.monotonic()
+                on_stage = None
+                if timeline is not None:
+                    def on_stage(stage, task_dict=task_dict, domain=domain):
+                        timeline.record(task_dict['task_id'], stage, domain=domain, plan=task_dict['plan'])
+                try:
+                    final_status = await process_task(db, task_dict, domains_config, config, storage=storage, matcher=matcher,
+                                                      retries=retries, network=network, delivery=delivery,
+                                                      uploader=uploader, reference=reference, on_stage=on_stage)
+                finally:
+                    if breaker_domain:
+                        retries.release(breaker_domain)
+                if timeline is not None:
+                    timeline.record(task_dict['task_id'], final_status, domain=domain, plan=task_dict['plan'])
+                if queue_index is not None and final_status == 'completed':
+                    queue_index.record_duration(domain, time.monotonic() - started_at)
+                if on_finished is not None and final_status in ('completed', 'failed'):
+                    try:
+                        await on_finished(task_dict['task_id'], final_status)
+                    except Exception as e:
+                        logger.error(f"Task {task_dict['task_id']} finished callback failed: {e}", exc_info=True)
             else:
-                # No pending tasks, wait before checking again
-                await asyncio.sleep(10) # Poll every 10 seconds
+                # No pending tasks, wait before checking again (the scheduler wakes us as soon as one is queued)
+                if scheduler is not None:
+                    await scheduler.wait(poll_interval)
+                else:
+                    await asyncio.sleep(poll_interval)
 
         except asyncio.CancelledError:
             logger.info("Worker process cancelled.")
@@ -122,6 +319,8 @@ async def start_worker_process(db: Database, config: dict, domains_config: dict)
         except Exception as e:
             logger.error(f"Error in worker process loop: {e}", exc_info=True)
             await asyncio.sleep(10) # Wait before retrying after an error
+    else:
+        logger.info("Worker process stopped.")
 
 # Example of how to run the worker (for testing purposes, actual run is in main.py)
 # async def main():
@@ -0,0 +1,57 @@
+import asyncio
+import logging
+
+from persistence.db import Database
+from worker.fair_scheduler import FairScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFeed:
+    """
+    Keeps a worker process's FairScheduler in step with the shared queue by tailing queue_feed, which
+    triggers fill whenever a task becomes 'pending' (new, requeued by a retry). Plan changes reach the
+    scheduler through ReferenceData instead; plan rows still in the feed from before are applied too.
+
+    Every worker process sees every task; claim_scheduled_task's conditional UPDATE decides which one
+    runs it, and the others drop it when their own scheduler offers it. start() notes the feed position
+    before loading the pending tasks, so nothing queued in between is missed (duplicates are ignored).
+    """
+
+    def __init__(self, db: Database, scheduler: FairScheduler, poll_interval: float = 0.25, batch_size: int = 1000):
+        self.db = db
+        self.scheduler = scheduler
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._last_id = 0
+
+    async def start(self) -> None:
+        row = await self.db.fetchone("SELECT MAX(feed_id) FROM queue_feed")
+        self._last_id = row[0] or 0
+        await self.scheduler.load(self.db)
+
+    async def poll(self) -> int:
+        """Applies new feed rows to the scheduler; returns how many were read."""
+        rows = await self.db.fetchall(
+            "SELECT feed_id, task_id, group_id, priority, plan FROM queue_feed WHERE feed_id > ? ORDER BY feed_id LIMIT ?",
+            (self._last_id, self.batch_size)
+        )
+        for feed_id, task_id, group_id, priority, plan in rows:
+            if task_id is None:
+                self.scheduler.set_group_plan(group_id, plan or 'default')
+            else:
+                self.scheduler.add(task_id, group_id, priority or 0)
+            self._last_id = feed_id
+        return len(rows)
+
+    async def run(self) -> None:
+        """Polls until cancelled."""
+        while True:
+            try:
+                if await self.poll() == self.batch_size:
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Queue feed error: {e}", exc_info=True)
+            await asyncio.sleep(self.poll_interval)
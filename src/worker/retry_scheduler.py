@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import random
+import time
+from urllib.parse import urlparse
+
+from persistence.db import Database
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2} # Gauge encoding
+# HTTP statuses that mean "try again later" rather than "this link is bad"
+RETRYABLE_HTTP_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504, 520, 521, 522, 523, 524})
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for failures that say the site is unhealthy (timeouts, refused connections, 5xx, 429)."""
+    response = getattr(error, "response", None)
+    if response is not None and getattr(response, "status_code", None) is not None:
+        return response.status_code in RETRYABLE_HTTP_STATUSES
+    name = type(error).__name__
+    return name in ("ConnectionError", "Timeout", "ConnectTimeout", "ReadTimeout", "ChunkedEncodingError") \
+        or isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError))
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter: attempt n waits base * 2^(n-1), capped, of which the upper half is random."""
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 30, max_delay: float = 3600):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return ceiling / 2 + random.uniform(0, ceiling / 2) # Spreads tasks that failed together
+
+
+class CircuitBreaker:
+    """
+    Per-domain breaker. `failure_threshold` consecutive retryable failures open it for `cooldown`
+    seconds (doubled on every failed probe, up to max_cooldown). After the cooldown it is half-open:
+    one task is let through as a probe; success closes it, failure opens it again.
+    """
+
+    def __init__(self, domain: str, failure_threshold: int = 5, cooldown: float = 300, max_cooldown: float = 3600):
+        self.domain = domain
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.cooldown = cooldown
+        self.open_until = 0.0 # time.time() when an open breaker turns half-open
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Whether a task for this domain may be dispatched now (claims the probe slot when half-open)."""
+        if self.state == OPEN and time.time() >= self.open_until:
+            self.state = HALF_OPEN
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def retry_at(self) -> float:
+        """Earliest time a deferred task should be offered again."""
+        if self.state == OPEN:
+            return self.open_until
+        return time.time() + min(self.base_cooldown, 30) # Half-open: wait for the probe's result
+
+    def release_probe(self) -> None:
+        """Frees the half-open probe slot if the probe ended without a verdict (e.g. the group blocks the domain)."""
+        self._probe_in_flight = False
+
+    def record_success(self) -> bool:
+        """Returns True if this closed a breaker that was open or half-open."""
+        recovered = self.state != CLOSED
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.cooldown = self.base_cooldown
+        self._probe_in_flight = False
+        return recovered
+
+    def record_failure(self) -> bool:
+        """Counts a retryable failure; returns True if this opened the breaker."""
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN:
+            self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+        elif self.state == OPEN or self.consecutive_failures < self.failure_threshold:
+            return False
+        self.state = OPEN
+        self.open_until = time.time() + self.cooldown
+        self._probe_in_flight = False
+        return True
+
+
+class RetryScheduler:
+    """
+    Failed-task handling for the worker: retryable failures are parked as 'retrying' with a
+    next_attempt_at from the RetryPolicy, and run() puts them back in the queue when due. Each domain
+    has a CircuitBreaker; while one is open, the worker defers that domain's tasks (without counting
+    an attempt) instead of dispatching them, so tasks for healthy sites keep flowing.
+
+    Listeners (on_breaker_change) are called as listener(breaker, affected_groups) when a breaker opens
+    or closes; the bot uses this to alert admins about the paused groups.
+    """
+
+    def __init__(self, db: Database, policy: RetryPolicy = None, scheduler=None, queue_index=None, timeline=None,
+                 failure_threshold: int = 5, cooldown: float = 300, max_cooldown: float = 3600):
+        self.db = db
+        self.policy = policy or RetryPolicy()
+        self.scheduler = scheduler
+        self.queue_index = queue_index
+        self.timeline = timeline
+        self.breakers = {} # domain -> CircuitBreaker
+        self._breaker_settings = (failure_threshold, cooldown, max_cooldown)
+        self._listeners = []
+        self._affected_groups = {} # domain -> group_ids whose tasks were held back by its breaker
+
+    @classmethod
+    def from_config(cls, db: Database, config, **kwargs) -> "RetryScheduler":
+        retries = cls(db, **kwargs)
+        retries.configure(config)
+        return retries
+
+    def configure(self, config) -> None:
+        """Applies the retry_* and breaker_* keys (startup and config reload)."""
+        self.policy = RetryPolicy(
+            config.get("retry_max_attempts", 5), config.get("retry_base_delay", 30), config.get("retry_max_delay", 3600))
+        self._breaker_settings = (
+            config.get("breaker_failure_threshold", 5), config.get("breaker_cooldown", 300),
+            config.get("breaker_max_cooldown", 3600))
+        for breaker in self.breakers.values():
+            breaker.failure_threshold, breaker.base_cooldown, breaker.max_cooldown = self._breaker_settings
+
+    def on_breaker_change(self, listener) -> None:
+        self._listeners.append(listener)
+
+    def breaker(self, domain: str) -> CircuitBreaker:
+        breaker = self.breakers.get(domain)
+        if breaker is None:
+            breaker = self.breakers[domain] = CircuitBreaker(domain, *self._breaker_settings)
+        return breaker
+
+    def _notify(self, breaker: CircuitBreaker) -> None:
+        metrics.CIRCUIT_BREAKER_STATE.set(_STATE_VALUES[breaker.state], domain=breaker.domain)
+        groups = sorted(self._affected_groups.pop(breaker.domain, set())) if breaker.state == CLOSED \
+            else sorted(self._affected_groups.setdefault(breaker.domain, set()))
+        for listener in self._listeners:
+            try:
+                listener(breaker, groups)
+            except Exception as e:
+                logger.error(f"Circuit breaker listener failed: {e}", exc_info=True)
+
+    # --- Worker hooks ---
+
+    def allow(self, domain: str) -> bool:
+        return self.breaker(domain).allow()
+
+    async def defer(self, task: dict, domain: str) -> None:
+        """Parks a claimed task whose domain breaker is open; it keeps its attempt count."""
+        delay = max(0.0, self.breaker(domain).retry_at() - time.time())
+        self._affected_groups.setdefault(domain, set()).add(task['group_id'])
+        await self._park(task['task_id'], delay, None)
+        metrics.TASK_RETRIES.inc(outcome="deferred")
+
+    def release(self, domain: str) -> None:
+        """Called after every dispatched task, whatever its outcome."""
+        self.breaker(domain).release_probe()
+
+    async def postpone(self, task: dict, delay: float = 0) -> None:
+        """Parks a task that failed for reasons unrelated to its site (e.g. a local network outage),
+        without counting an attempt or touching the breaker."""
+        await self._park(task['task_id'], delay, None)
+        metrics.TASK_RETRIES.inc(outcome="postponed")
+
+    def record_success(self, domain: str) -> None:
+        breaker = self.breaker(domain)
+        if breaker.record_success():
+            logger.info(f"Circuit breaker for {domain} closed; dispatch resumed.")
+            self._notify(breaker)
+
+    async def record_failure(self, task: dict, domain: str, error_message: str, retryable: bool) -> str:
+        """Counts the attempt and returns the task's new status: 'retrying' (with a backoff) or 'failed'."""
+        task_id = task['task_id']
+        breaker = self.breaker(domain)
+        if retryable and breaker.record_failure():
+            self._affected_groups.setdefault(domain, set()).update(await self._queued_groups(domain) | {task['group_id']})
+            logger.warning(
+                f"Circuit breaker for {domain} opened after {breaker.consecutive_failures} consecutive failures; "
+                f"pausing its tasks for {breaker.cooldown:.0f}s."
+            )
+            self._notify(breaker)
+        elif not retryable and breaker.state == HALF_OPEN:
+            breaker.record_success() # The site answered; the link itself is bad
+
+        rows = await self.db.execute_returning(
+            "UPDATE tasks SET error_count = COALESCE(error_count, 0) + 1, error_message = ? WHERE task_id = ? RETURNING error_count",
+            (error_message, task_id)
+        )
+        attempts = rows[0][0] if rows else 1
+        if not retryable or attempts >= self.policy.max_attempts:
+            await self.db.execute("UPDATE tasks SET status = 'failed', next_attempt_at = NULL WHERE task_id = ?", (task_id,))
+            metrics.TASK_RETRIES.inc(outcome="failed")
+            return 'failed'
+
+        delay = self.policy.delay(attempts)
+        if breaker.state == OPEN:
+            delay = max(delay, breaker.open_until - time.time())
+        await self._park(task_id, delay, error_message)
+        metrics.TASK_RETRIES.inc(outcome="scheduled")
+        logger.info("Task %s will retry in %.0fs (attempt %s of %s).", task_id, delay, attempts + 1, self.policy.max_attempts)
+        return 'retrying'
+
+    async def _queued_groups(self, domain: str) -> set:
+        """Groups with queued or retrying tasks for domain (or a subdomain of it)."""
+        rows = await self.db.fetchall(
+            "SELECT DISTINCT group_id FROM tasks WHERE status IN ('pending', 'retrying') "
+            "AND (original_link LIKE ? OR original_link LIKE ?)",
+            (f"%://{domain}/%", f"%.{domain}/%")
+        )
+        return {row[0] for row in rows}
+
+    async def _park(self, task_id: int, delay: float, error_message) -> None:
+        await self.db.execute(
+            "UPDATE tasks SET status = 'retrying', next_attempt_at = datetime('now', ?), "
+            "error_message = COALESCE(?, error_message) WHERE task_id = ?",
+            (f"+{delay:.0f} seconds", error_message, task_id)
+        )
+
+    # --- Requeueing ---
+
+    async def requeue_due(self) -> int:
+        """Moves retrying tasks whose next_attempt_at has passed back to 'pending' (and into the scheduler)."""
+        rows = await self.db.execute_returning(
+            "UPDATE tasks SET status = 'pending', next_attempt_at = NULL "
+            "WHERE status = 'retrying' AND next_attempt_at <= datetime('now') "
+            "RETURNING task_id, group_id, user_id, priority, original_link"
+        )
+        requeued = []
+        for task_id, group_id, user_id, priority, original_link in rows:
+            domain = urlparse(original_link or "").netloc.lower()
+            if self.timeline is not None:
+                self.timeline.record(task_id, 'pending', domain=domain)
+            requeued.append((task_id, priority or 0, domain, group_id, user_id))
+            if self.scheduler is not None:
+                self.scheduler.add(task_id, group_id, priority or 0)
+        if self.queue_index is not None:
+            self.queue_index.add_many(requeued) # Retries are older than newer arrivals: one re-rank for the batch
+        if rows:
+            logger.info(f"Requeued {len(rows)} tasks due for retry.")
+        return len(rows)
+
+    async def run(self, interval: float = 5) -> None:
+        """Requeues due retries every interval seconds, until cancelled."""
+        while True:
+            try:
+                await self.requeue_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Retry scheduler error: {e}", exc_info=True)
+            await asyncio.sleep(interval)
+
+    def stats(self) -> list:
+        """(domain, state, consecutive_failures, seconds until half-open) for every non-closed breaker."""
+        now = time.time()
+        return [
+            (b.domain, b.state, b.consecutive_failures, max(0.0, b.open_until - now) if b.state == OPEN else 0.0)
+            for b in self.breakers.values() if b.state != CLOSED
+        ]
+
@@ -0,0 +1,195 @@
+"""
+Standalone task worker, started with python -m worker [--processes N] (see worker/__main__.py).
+
+Runs the download pipeline in N OS processes that share the SQLite queue with the bot (the listener).
+Set "external_workers": true in config.json so the bot stops running its in-process worker; it then
+reads the workers' completion notices from the task_notices table. Run from the repository root with
+src/ on the import path:
+
+    PYTHONPATH=src python -m worker --processes 4
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import time
+
+from persistence.db import Database, REFERENCE_POLICY, REFERENCE_SCHEMA
+from services.config_watcher import ConfigWatcher
+from services.download_storage import DownloadStorage, GIB
+from services.log_pipeline import LogPipeline
+from services.network_monitor import NetworkMonitor
+from services.recovery import CrashRecovery, make_drive_lookup
+from services.reference_data import ReferenceData
+from worker.drive_uploader import DriveUploader
+from worker.fair_scheduler import FairScheduler
+from worker.notices import TaskNotices
+from worker.queue_consumer import start_worker_process
+from worker.queue_feed import QueueFeed
+from worker.retry_scheduler import RetryScheduler
+from worker.telegram_delivery import TelegramDelivery
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = "config/config.json"
+ADMINS_CONFIG_PATH = "config/admins.json"
+DOMAINS_CONFIG_PATH = "config/domains.json"
+DATABASE_PATH = "data/bot.db"
+REFERENCE_DATABASE_PATH = "data/reference.db"
+RESTART_DELAY = 5 # Seconds before a crashed worker process is started again
+BOT_WORKER_ID = "bot" # claimed_by of tasks run by the bot's in-process worker
+
+
+def worker_ids(processes: int) -> list:
+    """claimed_by ids of the worker slots, w0..w<processes - 1>."""
+    return [f"w{index}" for index in range(processes)]
+
+
+async def run_worker(worker_id: str, processes: int = 1) -> None:
+    """One worker process: its own scheduler (fed from queue_feed), retries, network monitor and disk share."""
+    watcher = ConfigWatcher(CONFIG_PATH, ADMINS_CONFIG_PATH, DOMAINS_CONFIG_PATH)
+    config = watcher.load().config
+    db = Database(DATABASE_PATH)
+    scheduler = FairScheduler(config.get("plan_weights"), max_wait_seconds=config.get("max_queue_wait_seconds", 1800))
+    notices = TaskNotices(db, worker_id)
+    retries = RetryScheduler.from_config(db, config, scheduler=scheduler, timeline=notices)
+    retries.on_breaker_change(notices.breaker_changed)
+    network = NetworkMonitor.from_config(config)
+    storage = DownloadStorage(
+        config.get("download_directory", "downloads"),
+        # Each process enforces an equal share on its own; idle shares aren't lent to busy processes
+        budget_bytes=int(config.get("download_budget_gb", 50) * GIB / processes),
+        min_free_bytes=int(config.get("download_min_free_gb", 2) * GIB),
+        db=db
+    )
+    feed = QueueFeed(db, scheduler)
+    reference = ReferenceData(Database(REFERENCE_DATABASE_PATH, REFERENCE_POLICY, REFERENCE_SCHEMA))
+    reference.on_plan_change(scheduler.set_group_plan)
+    delivery = TelegramDelivery.from_config(db, config)
+    uploader = DriveUploader.from_config(db, config)
+
+    def apply_config(snapshot):
+        scheduler.configure(snapshot.config.get("plan_weights"), snapshot.config.get("max_queue_wait_seconds", 1800))
+        retries.configure(snapshot.config)
+        delivery.configure(snapshot.config)
+    watcher.subscribe(apply_config)
+
+    await storage.scan()
+    await reference.load()
+    await feed.start()
+    # Tasks this worker slot was running when its previous process died. Slot w0 also adopts tasks of slots
+    # that no longer exist (--processes lowered) or of no known owner; the bot keeps its own.
+    try:
+        drive_lookup = make_drive_lookup(config.get("google_drive_folder_id"))
+    except Exception as e:
+        logger.warning(f"Drive lookups disabled for crash recovery: {e}")
+        drive_lookup = None
+    recovery = CrashRecovery(
+        db, scheduler=scheduler, timeline=notices, drive_lookup=drive_lookup,
+        max_workers=config.get("recovery_workers", 8), storage=storage, owner=worker_id,
+        live_owners=[BOT_WORKER_ID, *worker_ids(processes)] if worker_id == "w0" else None
+    )
+    background = [
+        asyncio.create_task(recovery.run()),
+        asyncio.create_task(watcher.run(config.get("config_reload_interval", 2))),
+        asyncio.create_task(feed.run()),
+        asyncio.create_task(notices.run_flusher()),
+        asyncio.create_task(retries.run(config.get("retry_poll_interval", 5))),
+        asyncio.create_task(network.run()),
+        asyncio.create_task(reference.run(config.get("reference_poll_interval", 2))),
+    ]
+
+    # First SIGTERM/SIGINT: finish the current task and exit. Second: cancel it (crash recovery resumes it).
+    stop = asyncio.Event()
+    worker_task = asyncio.create_task(start_worker_process(
+        db, config, watcher.current.domains, timeline=notices, scheduler=scheduler, storage=storage,
+        config_watcher=watcher, retries=retries, network=network, stop_event=stop,
+        worker_id=worker_id, delivery=delivery, uploader=uploader, reference=reference
+    ))
+
+    def request_stop():
+        if stop.is_set():
+            worker_task.cancel()
+        stop.set()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, request_stop)
+
+    logger.info(f"Worker {worker_id} started (pid {os.getpid()}).")
+    try:
+        await worker_task
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True) # The notice flusher writes what's left
+        logger.info(f"Worker {worker_id} exited.")
+
+
+def worker_entry(worker_id: str, processes: int) -> None:
+    """Target of each child process."""
+    config = ConfigWatcher(CONFIG_PATH, ADMINS_CONFIG_PATH, DOMAINS_CONFIG_PATH).load().config
+    log_pipeline = LogPipeline.from_config(config, filename=f"worker-{worker_id}.log").start()
+    try:
+        asyncio.run(run_worker(worker_id, processes))
+    finally:
+        log_pipeline.stop()
+
+
+def supervise(processes: int) -> int:
+    """Starts the worker processes, restarts any that crash, and forwards SIGTERM/SIGINT to them."""
+    context = multiprocessing.get_context("spawn") # No inherited event loop, locks or SQLite handles
+    children = {}
+    stopping = False
+
+    def start(index: int) -> None:
+        worker_id = worker_ids(processes)[index]
+        child = context.Process(target=worker_entry, args=(worker_id, processes), name=f"worker-{worker_id}")
+        child.start()
+        children[index] = child
+        logger.info(f"Started worker {worker_id} (pid {child.pid}).")
+
+    def forward(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for child in children.values():
+            if child.is_alive():
+                os.kill(child.pid, signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for index in range(processes):
+        start(index)
+
+    while children:
+        for index, child in list(children.items()):
+            child.join(timeout=0.5)
+            if child.exitcode is None:
+                continue
+            del children[index]
+            if not stopping and child.exitcode != 0:
+                logger.error(f"Worker w{index} exited with code {child.exitcode}; restarting in {RESTART_DELAY}s.")
+                time.sleep(RESTART_DELAY)
+                if not stopping:
+                    start(index)
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m worker", description="Run task workers against the shared queue.")
+    parser.add_argument("--processes", type=int, help="Worker processes (default: worker_processes in config.json, else CPU count)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    config = ConfigWatcher(CONFIG_PATH, ADMINS_CONFIG_PATH, DOMAINS_CONFIG_PATH).load().config
+    processes = args.processes or config.get("worker_processes") or os.cpu_count() or 1
+    if not config.get("external_workers"):
+        logger.warning('config.json does not set "external_workers": true; the bot will also run its own worker.')
+    # Idempotent; lets workers start before the bot on a fresh install
+    asyncio.run(Database(DATABASE_PATH).initialize())
+    asyncio.run(Database(REFERENCE_DATABASE_PATH, REFERENCE_POLICY, REFERENCE_SCHEMA).initialize())
+    if processes == 1:
+        worker_entry(worker_ids(1)[0], 1)
+        return 0
+    return supervise(processes)
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+
+from persistence.db import Database
+from services.lazy_import import lazy_import
+from worker.downloader import display_name
+from worker.retry_scheduler import is_retryable
+
+logger = logging.getLogger(__name__)
+
+requests = lazy_import("requests")
+
+TELEGRAM_API_URL = "https://api.telegram.org/bot" # Same form as the Application's base_url: the token is appended
+DEFAULT_UPLOAD_LIMIT_MB = 50 # sendDocument limit on the public Bot API (a local Bot API server allows 2000)
+DEFAULT_DIRECT_PLANS = ("file",)
+CHUNK_SIZE = 1024 * 1024
+# Bot API errors that mean a cached file_id can't be re-sent (the file is gone or the id is from another bot)
+STALE_FILE_ID_ERRORS = ("wrong file identifier", "file reference", "wrong remote file", "failed to get http url content")
+
+
+class TelegramDeliveryError(Exception):
+    """The Bot API rejected a sendDocument call. `response` carries the HTTP status for is_retryable();
+    retry_after is the wait Telegram asked for when it rate-limited the call."""
+
+    def __init__(self, description: str, response=None, retry_after: float = None):
+        super().__init__(description)
+        self.description = description
+        self.response = response
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return is_retryable(self.__cause__ or self)
+
+
+class MultipartFile:
+    """
+    multipart/form-data body for one file plus plain form fields, produced in CHUNK_SIZE pieces as it is
+    sent. len() is known up front (the parts around the file are small), so requests sends a
+    Content-Length instead of chunked encoding and the file is never held in memory.
+    """
+
+    def __init__(self, fields: dict, file_field: str, path: str, filename: str):
+        self.boundary = uuid.uuid4().hex
+        self.path = path
+        self.size = os.path.getsize(path)
+        head = b"".join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+            f'{json.dumps(value) if isinstance(value, bool) else value}\r\n'.encode("utf-8")
+            for name, value in fields.items() if value is not None
+        )
+        quoted = filename.replace('"', "_")
+        self._head = head + (
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{quoted}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'
+        ).encode("utf-8")
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode("ascii")
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return len(self._head) + self.size + len(self._tail)
+
+    def __iter__(self):
+        yield self._head
+        with open(self.path, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        yield self._tail
+
+
+class TelegramDelivery:
+    """
+    Sends finished downloads straight to the requesting group with sendDocument instead of going through
+    Google Drive and the link shortener. Used for the plans in direct_delivery_plans, and only for files
+    within telegram_upload_limit_mb; anything else takes the normal route.
+
+    Uploads stream the file from disk (MultipartFile) on a thread. The file_id Telegram returns is cached
+    in telegram_files by original link, so a repeat request for the same asset is answered by reference
+    (no fetch, download or upload). A cached id Telegram no longer accepts is dropped and the task falls
+    back to a fresh download. Works without a telegram.ext Application, so worker processes can use it too.
+    """
+
+    def __init__(self, db: Database, token: str, base_url: str = TELEGRAM_API_URL,
+                 upload_limit_mb: float = DEFAULT_UPLOAD_LIMIT_MB, plans=DEFAULT_DIRECT_PLANS, timeout: float = 60):
+        self.db = db
+        self.api_url = f"{base_url}{token}"
+        self.upload_limit_bytes = int(upload_limit_mb * 1024 * 1024)
+        self.plans = frozenset(plans)
+        self.timeout = timeout
+
+    @classmethod
+    def from_config(cls, db: Database, config) -> "TelegramDelivery":
+        return cls(
+            db, config.get("telegram_bot_token", ""),
+            base_url=config.get("telegram_api_url", TELEGRAM_API_URL),
+            upload_limit_mb=config.get("telegram_upload_limit_mb", DEFAULT_UPLOAD_LIMIT_MB),
+            plans=config.get("direct_delivery_plans", DEFAULT_DIRECT_PLANS),
+        )
+
+    def configure(self, config) -> None:
+        """Applies direct_delivery_plans and telegram_upload_limit_mb from a reloaded config."""
+        self.upload_limit_bytes = int(config.get("telegram_upload_limit_mb", DEFAULT_UPLOAD_LIMIT_MB) * 1024 * 1024)
+        self.plans = frozenset(config.get("direct_delivery_plans", DEFAULT_DIRECT_PLANS))
+
+    def applies(self, plan: str, size: int = None) -> bool:
+        """Whether a task on this plan (and, once downloaded, of this size) is delivered directly."""
+        return plan in self.plans and (size is None or size <= self.upload_limit_bytes)
+
+    # --- Bot API calls (blocking; run on a thread) ---
+
+    def _call(self, method: str, data, headers=None) -> dict:
+        try:
+            if isinstance(data, dict):
+                response = requests.post(f"{self.api_url}/{method}", json=data, timeout=self.timeout)
+            else:
+                response = requests.post(f"{self.api_url}/{method}", data=data, headers=headers, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            raise TelegramDeliveryError(f"{method}: {e}", getattr(e, "response", None)) from e
+        try:
+            body = response.json()
+        except ValueError:
+            response.raise_for_status()
+            raise TelegramDeliveryError(f"{method}: unexpected response", response)
+        if not body.get("ok"):
+            raise TelegramDeliveryError(f"{method}: {body.get('description', 'unknown error')}", response,
+                                        (body.get("parameters") or {}).get("retry_after"))
+        return body["result"]
+
+    def _fields(self, task: dict, caption: str) -> dict:
+        return {
+            "chat_id": task['group_id'],
+            "caption": caption,
+            "reply_to_message_id": task.get('message_id'),
+            "allow_sending_without_reply": True, # Still deliver if the request message was deleted
+        }
+
+    # --- Delivery ---
+
+    async def cached_file_id(self, original_link: str):
+        row = await self.db.fetchone("SELECT file_id FROM telegram_files WHERE original_link = ?", (original_link,))
+        return row[0] if row else None
+
+    async def _completed(self, task: dict, file_id: str) -> None:
+        await self.db.execute("UPDATE tasks SET telegram_file_id = ? WHERE task_id = ?", (file_id, task['task_id']))
+
+    async def send_cached(self, task: dict, file_id: str, caption: str = None) -> bool:
+        """Re-sends a cached file_id. False (and the cache entry is dropped) if Telegram no longer knows it."""
+        fields = self._fields(task, caption or f"✅ Task #{task['task_id']}")
+        fields["document"] = file_id
+        try:
+            await asyncio.to_thread(self._call, "sendDocument", {k: v for k, v in fields.items() if v is not None})
+        except TelegramDeliveryError as e:
+            if not any(marker in e.description.lower() for marker in STALE_FILE_ID_ERRORS):
+                raise
+            logger.warning("Cached file_id for %s was rejected (%s); downloading it again.", task['original_link'], e)
+            await self.db.execute("DELETE FROM telegram_files WHERE original_link = ?", (task['original_link'],))
+            return False
+        await self.db.execute(
+            "UPDATE telegram_files SET last_sent_at = CURRENT_TIMESTAMP WHERE original_link = ?", (task['original_link'],)
+        )
+        await self._completed(task, file_id)
+        return True
+
+    async def upload(self, task: dict, path: str, caption: str = None) -> str:
+        """Streams path to the group as a document (replying to the request) and caches its file_id."""
+        body = MultipartFile(self._fields(task, caption or f"✅ Task #{task['task_id']}"), "document", path,
+                             display_name(task['task_id'], path))
+        message = await asyncio.to_thread(self._call, "sendDocument", body, {"Content-Type": body.content_type})
+        document = message.get("document") or {}
+        file_id = document.get("file_id")
+        if not file_id:
+            raise TelegramDeliveryError("sendDocument: no document in the response")
+        await self.db.execute(
+            "INSERT INTO telegram_files (original_link, file_id, file_unique_id, file_size, checksum) "
+            "VALUES (?, ?, ?, ?, (SELECT checksum FROM tasks WHERE task_id = ?)) "
+            "ON CONFLICT (original_link) DO UPDATE SET file_id = excluded.file_id, file_unique_id = excluded.file_unique_id, "
+            "file_size = excluded.file_size, checksum = excluded.checksum, last_sent_at = CURRENT_TIMESTAMP",
+            (task['original_link'], file_id, document.get("file_unique_id"), document.get("file_size", body.size), task['task_id'])
+        )
+        await self._completed(task, file_id)
+        logger.info("Sent task %s to group %s as a document (%s bytes).", task['task_id'], task['group_id'], body.size)
+        return file_id
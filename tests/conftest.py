@@ -0,0 +1,29 @@
+"""Shared fixtures. The bot imports its modules relative to src/, and the stand-ins live in benchmarks/."""
+import os
+import sys
+
+import pytest
+
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+if BENCHMARKS_DIR not in sys.path:
+    sys.path.insert(0, BENCHMARKS_DIR)
+
+from _common import SCHEMA_FILE # noqa: E402 (also puts src/ on sys.path)
+from fakes import BotApiStandIn # noqa: E402
+
+from persistence import db as db_module # noqa: E402
+
+
+@pytest.fixture
+def bot_api():
+    """A running local Bot API stand-in."""
+    server = BotApiStandIn().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Path of a fresh queue database; call Database(db_path).initialize() inside the test's event loop."""
+    monkeypatch.setattr(db_module, "SCHEMA_PATH", SCHEMA_FILE)
+    return str(tmp_path / "bot.db")
@@ -0,0 +1,156 @@
+"""TelegramDelivery against the local Bot API stand-in (benchmarks/fakes.py)."""
+import asyncio
+import os
+
+import pytest
+
+from persistence.db import Database
+from worker.telegram_delivery import MultipartFile, TelegramDelivery, TelegramDeliveryError
+
+GROUP_ID = -100123
+LINK = "https://freepik.com/asset/1"
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def make_delivery(db_path: str, bot_api, **kwargs):
+    db = Database(db_path)
+    await db.initialize()
+    cursor = await db.execute(
+        "INSERT INTO tasks (group_id, user_id, message_id, original_link, status) VALUES (?, 1, 7, ?, 'uploading')",
+        (GROUP_ID, LINK)
+    )
+    task = {"task_id": cursor.lastrowid, "group_id": GROUP_ID, "message_id": 7, "original_link": LINK, "plan": "file"}
+    return db, TelegramDelivery(db, "0:test", base_url=bot_api.base_url, **kwargs), task
+
+
+def write_asset(directory, task_id: int, size: int = 3 * 1024 * 1024 + 17) -> str:
+    path = os.path.join(str(directory), f"{task_id}_asset.zip")
+    with open(path, "wb") as f:
+        f.write(os.urandom(size))
+    return path
+
+
+def sent_documents(bot_api) -> list:
+    return [params for _, method, params in bot_api.calls if method == "sendDocument"]
+
+
+# --- Multipart upload ---
+
+def test_multipart_length_matches_body(tmp_path):
+    path = write_asset(tmp_path, 1, 2 * 1024 * 1024 + 5) # Spans several CHUNK_SIZE reads
+    body = MultipartFile({"chat_id": GROUP_ID, "caption": "done", "reply_to_message_id": None}, "document", path, "asset.zip")
+    data = b"".join(body)
+    assert len(data) == len(body)
+    assert body.boundary in body.content_type
+    assert b'name="reply_to_message_id"' not in data # None fields are left out
+
+
+def test_upload_streams_document_and_caches_file_id(tmp_path, db_path, bot_api):
+    async def scenario():
+        db, delivery, task = await make_delivery(db_path, bot_api)
+        path = write_asset(tmp_path, task["task_id"])
+        file_id = await delivery.upload(task, path)
+        cached = await db.fetchone("SELECT file_id, file_size FROM telegram_files WHERE original_link = ?", (LINK,))
+        stored = await db.fetchone("SELECT telegram_file_id FROM tasks WHERE task_id = ?", (task["task_id"],))
+        return file_id, path, cached, stored
+
+    file_id, path, cached, stored = run(scenario())
+    [params] = sent_documents(bot_api)
+    assert params["chat_id"] == str(GROUP_ID)
+    assert params["reply_to_message_id"] == "7"
+    assert params["allow_sending_without_reply"] == "true"
+    assert params["document"] == {"file_name": "asset.zip", "file_size": os.path.getsize(path)} # task_id_ prefix dropped
+    assert bot_api.documents[file_id]["file_size"] == os.path.getsize(path)
+    assert cached == (file_id, os.path.getsize(path))
+    assert stored == (file_id,)
+
+
+# --- file_id cache ---
+
+def test_cached_file_id_is_resent_without_upload(tmp_path, db_path, bot_api):
+    async def scenario():
+        db, delivery, task = await make_delivery(db_path, bot_api)
+        assert await delivery.cached_file_id(LINK) is None
+        file_id = await delivery.upload(task, write_asset(tmp_path, task["task_id"]))
+        cached = await delivery.cached_file_id(LINK)
+        repeat = dict(task, task_id=task["task_id"] + 1)
+        await db.execute("INSERT INTO tasks (task_id, group_id, original_link, status) VALUES (?, ?, ?, 'downloading')",
+                         (repeat["task_id"], GROUP_ID, LINK))
+        sent = await delivery.send_cached(repeat, cached)
+        stored = await db.fetchone("SELECT telegram_file_id FROM tasks WHERE task_id = ?", (repeat["task_id"],))
+        return file_id, cached, sent, stored
+
+    file_id, cached, sent, stored = run(scenario())
+    assert cached == file_id
+    assert sent is True
+    assert stored == (file_id,)
+    assert sent_documents(bot_api)[-1]["document"] == file_id # By reference, not a multipart upload
+
+
+def test_stale_file_id_is_dropped(db_path, bot_api):
+    async def scenario():
+        db, delivery, task = await make_delivery(db_path, bot_api)
+        await db.execute("INSERT INTO telegram_files (original_link, file_id) VALUES (?, 'never-issued')", (LINK,))
+        sent = await delivery.send_cached(task, "never-issued")
+        return sent, await delivery.cached_file_id(LINK)
+
+    sent, cached = run(scenario())
+    assert sent is False # The caller falls back to a fresh download
+    assert cached is None
+
+
+# --- Error mapping ---
+
+@pytest.mark.parametrize("status, description, retry_after, retryable", [
+    (429, "Too Many Requests: retry after 7", 7, True),
+    (500, "Internal Server Error", None, True),
+    (502, "Bad Gateway", None, True),
+    (400, "Bad Request: chat not found", None, False),
+    (403, "Forbidden: bot was kicked from the supergroup chat", None, False),
+    (413, "Request Entity Too Large", None, False),
+])
+def test_upload_error_mapping(tmp_path, db_path, bot_api, status, description, retry_after, retryable):
+    bot_api.fail_next("sendDocument", status, description, retry_after)
+
+    async def scenario():
+        db, delivery, task = await make_delivery(db_path, bot_api)
+        with pytest.raises(TelegramDeliveryError) as raised:
+            await delivery.upload(task, write_asset(tmp_path, task["task_id"], 1024))
+        return raised.value, await delivery.cached_file_id(LINK)
+
+    error, cached = run(scenario())
+    assert error.retryable is retryable
+    assert error.retry_after == retry_after
+    assert description in str(error)
+    assert cached is None
+
+
+def test_cached_resend_error_other_than_stale_id_is_raised(db_path, bot_api):
+    bot_api.fail_next("sendDocument", 429, "Too Many Requests: retry after 3", 3)
+
+    async def scenario():
+        db, delivery, task = await make_delivery(db_path, bot_api)
+        await db.execute("INSERT INTO telegram_files (original_link, file_id) VALUES (?, 'BQACAgI00000001')", (LINK,))
+        with pytest.raises(TelegramDeliveryError) as raised:
+            await delivery.send_cached(task, "BQACAgI00000001")
+        return raised.value, await delivery.cached_file_id(LINK)
+
+    error, cached = run(scenario())
+    assert error.retryable and error.retry_after == 3
+    assert cached == "BQACAgI00000001" # Only a rejected id is dropped
+
+
+def test_unreachable_bot_api_is_retryable(tmp_path, db_path, bot_api):
+    async def scenario():
+        db, delivery, task = await make_delivery(db_path, bot_api, timeout=5)
+        bot_api.stop()
+        with pytest.raises(TelegramDeliveryError) as raised:
+            await delivery.upload(task, write_asset(tmp_path, task["task_id"], 1024))
+        return raised.value
+
+    error = run(scenario())
+    assert error.retryable
+    assert error.retry_after is None